@@ -5,15 +5,117 @@ from typing import List
 class Settings(BaseSettings):
     """Application settings loaded from environment variables"""
     
+    # Storage backend: "mongo", "sqlite" (edge gateways) or "memory" (tests)
+    STORAGE_BACKEND: str = "mongo"
+    SQLITE_PATH: str = "data/smart_crop.db"
+    SQLITE_BATCH_SIZE: int = 500
+    
     # MongoDB Configuration
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "smart_crop_irrigation"
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 5000
+    MONGODB_COMPRESSORS: str = ""  # e.g. "zstd,snappy,zlib"
+    
+    # Ingest (write) pool
+    MONGODB_WRITE_MAX_POOL_SIZE: int = 50
+    MONGODB_WRITE_MIN_POOL_SIZE: int = 5
+    MONGODB_WRITE_CONCERN: str = "1"  # "1", "majority", ...
+    MONGODB_WRITE_JOURNAL: bool = False
+    MONGODB_WRITE_TIMEOUT_MS: int = 10000
+    MONGODB_WRITE_SOCKET_TIMEOUT_MS: int = 20000
+    
+    # Dashboard/analytics (read) pool; set MONGODB_READ_URL to query another cluster
+    MONGODB_SEPARATE_READ_POOL: bool = True
+    MONGODB_READ_URL: str = ""
+    MONGODB_READ_MAX_POOL_SIZE: int = 20
+    MONGODB_READ_MIN_POOL_SIZE: int = 0
+    MONGODB_READ_PREFERENCE: str = "primary"  # e.g. "secondaryPreferred" for analytics
+    MONGODB_READ_MAX_STALENESS_SECONDS: int = -1
+    MONGODB_READ_SOCKET_TIMEOUT_MS: int = 60000
     
     # MQTT Configuration
     MQTT_BROKER: str = "broker.hivemq.com"
     MQTT_PORT: int = 1883
     MQTT_TOPIC: str = "smart_crop/sensors"
     MQTT_CLIENT_ID: str = "smart_crop_backend"
+    MQTT_CLIENT_ID_SUFFIX: str = ""  # stable per replica (e.g. pod name); empty = <hostname>-<pid>, clean sessions
+    MQTT_WORKER_SLOT_DIR: str = "data/mqtt_workers"  # lock files numbering a replica's workers
+    MQTT_SHARED_GROUP: str = "smart_crop_ingest"  # empty disables shared subscriptions
+    MQTT_QOS: int = 1
+    MQTT_CLEAN_START: bool = False
+    MQTT_SESSION_EXPIRY_SECONDS: int = 3600
+    
+    # Reading Spool (used while MongoDB is unavailable)
+    SPOOL_PATH: str = "data/reading_spool.db"
+    SPOOL_MAX_READINGS: int = 500000
+    SPOOL_REPLAY_BATCH_SIZE: int = 1000
+    SPOOL_REPLAY_INTERVAL_SECONDS: float = 5.0
+    
+    # Streaming Anomaly Detection
+    ANOMALY_DETECTION_ENABLED: bool = True
+    ANOMALY_EWMA_ALPHA: float = 0.05
+    ANOMALY_Z_THRESHOLD: float = 4.0
+    ANOMALY_WARMUP_READINGS: int = 30
+    ANOMALY_STUCK_MINUTES: float = 120.0  # unchanged this long -> sensor_stuck; 0 disables
+    ANOMALY_STUCK_READINGS: int = 30  # ...and for at least this many readings
+    ANOMALY_COOLDOWN_READINGS: int = 20
+    ANOMALY_CHECKPOINT_INTERVAL_SECONDS: float = 60.0
+    
+    # Device Heartbeats (ingest lag and offline detection)
+    DEVICE_OFFLINE_AFTER_SECONDS: float = 600.0  # silence before a device_offline alert; 0 disables
+    HEARTBEAT_SWEEP_INTERVAL_SECONDS: float = 30.0
+    
+    # Closed-Loop Irrigation (valve commands on per-device MQTT topics)
+    IRRIGATION_ENABLED: bool = False
+    IRRIGATION_TRANSPORT: str = "mqtt"  # or "loopback": in-process broker stand-in with simulated valves
+    IRRIGATION_COMMAND_TOPIC: str = "smart_crop/irrigation/{device_id}/command"
+    IRRIGATION_ACK_TOPIC: str = "smart_crop/irrigation/{device_id}/ack"
+    IRRIGATION_DURATION_SECONDS: int = 120  # valve open time per command; devices close it themselves
+    IRRIGATION_SOAK_SECONDS: float = 900.0  # wait after watering before watering again
+    IRRIGATION_ACK_TIMEOUT_SECONDS: float = 5.0
+    IRRIGATION_MAX_ATTEMPTS: int = 3
+    IRRIGATION_LOOPBACK_ACK_DELAY_SECONDS: float = 0.05
+    
+    # Alert Auto-Resolution
+    ALERT_AUTO_RESOLVE: bool = True
+    ALERT_OPEN_CACHE_TTL_SECONDS: float = 60.0
+    ALERT_COUNTER_REPAIR_INTERVAL_SECONDS: float = 86400.0
+    
+    # Percentile Sketches
+    SKETCH_COMPRESSION: float = 100.0
+    SKETCH_FLUSH_INTERVAL_SECONDS: float = 30.0
+    
+    # Time-to-Threshold Forecasting
+    FORECAST_WINDOW_READINGS: int = 720
+    FORECAST_WINDOW_HOURS: float = 12.0
+    FORECAST_MIN_READINGS: int = 10
+    
+    # Threshold What-If Simulation
+    SIMULATION_BATCH_SIZE: int = 50000
+    SIMULATION_MAX_GAP_SECONDS: float = 600.0  # a reading covers at most this long
+    SIMULATION_MAX_DAYS: int = 366
+    
+    # Season Analytics Jobs
+    ANALYTICS_WORKERS: int = 2  # worker processes
+    ANALYTICS_BATCH_SIZE: int = 50000
+    ANALYTICS_MAX_DAYS: int = 366
+    ANALYTICS_CACHE_SIZE: int = 32  # cached job results
+    ANALYTICS_JOB_RETENTION_SECONDS: float = 3600.0  # finished jobs kept for polling
+    
+    # Incremental dashboard sync (sync tokens)
+    SYNC_SETTLE_SECONDS: float = 2.0  # changes newer than this wait for the next poll
+    SYNC_TOMBSTONE_RETENTION_HOURS: int = 24  # how long deleted alerts are remembered
+    SYNC_MAX_ALERT_CHANGES: int = 1000  # more than this since a token -> full reload
+    
+    # Cold-data archive: closed days moved to local Parquet files (needs pyarrow)
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_PATH: str = "data/archive"
+    ARCHIVE_AFTER_DAYS: int = 30  # days of readings kept in the database
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    ARCHIVE_BATCH_SIZE: int = 50000
+    ARCHIVE_COMPRESSION: str = "zstd"
     
     # Email Configuration
     SMTP_HOST: str = "smtp.gmail.com"
@@ -23,11 +125,24 @@ class Settings(BaseSettings):
     SMTP_FROM_EMAIL: str = ""
     SMTP_FROM_NAME: str = "Smart Crop Irrigation System"
     
+    # Notification outbox (alert emails queued with the alert, sent with retries)
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 20
+    OUTBOX_LEASE_SECONDS: float = 120.0  # a claimed message is retried by anyone after this
+    OUTBOX_MAX_ATTEMPTS: int = 8  # then it becomes a dead letter
+    OUTBOX_RETRY_BASE_SECONDS: float = 30.0  # doubled after every failed attempt
+    OUTBOX_RETRY_MAX_SECONDS: float = 3600.0
+    
     # Application Settings
     APP_HOST: str = "0.0.0.0"
     APP_PORT: int = 8000
     DEBUG: bool = True
     
+    # Response compression (br when the brotli package is installed, else gzip)
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    
     # CORS Settings
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
     
@@ -1,30 +1,178 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import IndexModel, monitoring
 from app.config import settings
+from app.utils.timing import stage_timings
+import asyncio
 import logging
+import threading
+import time
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 
 
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool usage and checkout wait times for one client"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts_total = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def metrics(self) -> dict:
+        return {
+            "open_connections": self.open_connections,
+            "checked_out": self.checked_out,
+            "checkouts_total": self.checkouts_total,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears,
+        }
+    
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+    
+    def connection_checked_out(self, event):
+        # Time spent waiting for a free connection (or opening one); newer
+        # PyMongo reports it on the event, older versions need the start time
+        duration = getattr(event, "duration", None)
+        started = getattr(self._local, "started", None)
+        if duration is not None:
+            stage_timings.record(f"mongo.{self.name}.checkout_wait", duration * 1000)
+        elif started is not None:
+            stage_timings.record(f"mongo.{self.name}.checkout_wait", (time.perf_counter() - started) * 1000)
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts_total += 1
+    
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+    
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+
+
+def _write_concern() -> dict:
+    w = settings.MONGODB_WRITE_CONCERN
+    return {
+        "w": int(w) if w.isdigit() else w,
+        "journal": settings.MONGODB_WRITE_JOURNAL,
+        "wTimeoutMS": settings.MONGODB_WRITE_TIMEOUT_MS,
+    }
+
+
+def _common_options() -> dict:
+    options = {
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    }
+    if settings.MONGODB_COMPRESSORS:
+        options["compressors"] = settings.MONGODB_COMPRESSORS
+    return options
+
+
 class Database:
-    """MongoDB database connection manager"""
+    """MongoDB database connection manager
+    
+    Ingest writes and dashboard queries use separate clients (and therefore
+    separate connection pools), so a burst of heavy aggregations can't starve
+    sensor writes of connections. Queries can also be sent to secondaries.
+    """
     
     client: AsyncIOMotorClient = None
     db: AsyncIOMotorDatabase = None
+    read_client: AsyncIOMotorClient = None
+    read_db: AsyncIOMotorDatabase = None
+    pool_monitors = {"write": PoolMonitor("write"), "read": PoolMonitor("read")}
+    index_task: asyncio.Task = None
+    # True once the index build has finished, successfully or not
+    indexes_ready: bool = False
+    # collection -> error, for index builds that failed
+    index_failures: Dict[str, str] = {}
+    # Multi-document transactions need a replica set or a sharded cluster
+    supports_transactions: bool = False
     
     @classmethod
     async def connect_db(cls):
         """Connect to MongoDB"""
         try:
-            cls.client = AsyncIOMotorClient(settings.MONGODB_URL)
+            cls.client = AsyncIOMotorClient(
+                settings.MONGODB_URL,
+                appname="smart-crop-ingest",
+                maxPoolSize=settings.MONGODB_WRITE_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGODB_WRITE_MIN_POOL_SIZE,
+                socketTimeoutMS=settings.MONGODB_WRITE_SOCKET_TIMEOUT_MS,
+                event_listeners=[cls.pool_monitors["write"]],
+                **_write_concern(),
+                **_common_options()
+            )
             cls.db = cls.client[settings.DATABASE_NAME]
             
+            if settings.MONGODB_SEPARATE_READ_POOL:
+                read_options = {}
+                if settings.MONGODB_READ_MAX_STALENESS_SECONDS > 0:
+                    read_options["maxStalenessSeconds"] = settings.MONGODB_READ_MAX_STALENESS_SECONDS
+                cls.read_client = AsyncIOMotorClient(
+                    settings.MONGODB_READ_URL or settings.MONGODB_URL,
+                    appname="smart-crop-query",
+                    maxPoolSize=settings.MONGODB_READ_MAX_POOL_SIZE,
+                    minPoolSize=settings.MONGODB_READ_MIN_POOL_SIZE,
+                    socketTimeoutMS=settings.MONGODB_READ_SOCKET_TIMEOUT_MS,
+                    readPreference=settings.MONGODB_READ_PREFERENCE,
+                    event_listeners=[cls.pool_monitors["read"]],
+                    **read_options,
+                    **_common_options()
+                )
+            else:
+                cls.read_client = cls.client
+            cls.read_db = cls.read_client[settings.DATABASE_NAME]
+            
             # Test connection
             await cls.client.admin.command('ping')
+            cls.supports_transactions = cls.client.topology_description.topology_type_name in (
+                "ReplicaSetWithPrimary", "Sharded"
+            )
+            if cls.read_client is not cls.client:
+                await cls.read_client.admin.command('ping')
             logger.info(f"✅ Connected to MongoDB: {settings.DATABASE_NAME}")
             
-            # Create indexes
-            await cls.create_indexes()
-            
+            # Build indexes in the background so the app can start serving;
+            # they are idempotent and usually already exist
+            cls.indexes_ready = False
+            cls.index_failures = {}
+            cls.index_task = asyncio.create_task(cls.create_indexes())
+        
         except Exception as e:
             logger.error(f"❌ Failed to connect to MongoDB: {e}")
             raise
@@ -32,36 +180,94 @@ class Database:
     @classmethod
     async def close_db(cls):
         """Close MongoDB connection"""
+        if cls.index_task and not cls.index_task.done():
+            cls.index_task.cancel()
+            try:
+                await cls.index_task
+            except asyncio.CancelledError:
+                pass
+        cls.index_task = None
+        if cls.read_client and cls.read_client is not cls.client:
+            cls.read_client.close()
         if cls.client:
             cls.client.close()
             logger.info("🔌 MongoDB connection closed")
     
     @classmethod
     async def create_indexes(cls):
-        """Create database indexes for better performance"""
-        try:
-            # Sensor data indexes
-            await cls.db.sensor_data.create_index([("timestamp", -1)])
-            await cls.db.sensor_data.create_index([("sensor_type", 1)])
-            
-            # Alerts indexes
-            await cls.db.alerts.create_index([("timestamp", -1)])
-            await cls.db.alerts.create_index([("is_resolved", 1)])
-            
-            # Settings indexes
-            await cls.db.settings.create_index([("setting_type", 1)], unique=True)
-            
-            logger.info("✅ Database indexes created")
-        except Exception as e:
-            logger.warning(f"⚠️ Index creation warning: {e}")
+        """Create database indexes for better performance
+        
+        One createIndexes command per collection, all issued concurrently.
+        """
+        indexes = {
+            "sensor_data": [
+                IndexModel([("timestamp", -1)]),
+                IndexModel([("sensor_type", 1)]),
+                IndexModel([("device_id", 1), ("timestamp", 1)], unique=True),
+            ],
+            "alerts": [
+                IndexModel([("timestamp", -1)]),
+                IndexModel([("is_resolved", 1)]),
+                IndexModel([("device_id", 1), ("is_resolved", 1), ("alert_type", 1)]),
+                IndexModel([("updated_at", 1)]),
+            ],
+            "alert_tombstones": [
+                IndexModel(
+                    [("deleted_at", 1)], expireAfterSeconds=settings.SYNC_TOMBSTONE_RETENTION_HOURS * 3600
+                ),
+            ],
+            "sensor_sketches": [
+                IndexModel([("hour", 1), ("device_id", 1)]),
+            ],
+            "settings": [
+                IndexModel([("setting_type", 1)], unique=True),
+            ],
+            "notification_outbox": [
+                IndexModel([("dead", 1), ("available_at", 1)]),
+                IndexModel([("dead", 1), ("failed_at", -1)]),
+            ],
+        }
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(cls.db[name].create_indexes(models) for name, models in indexes.items()),
+            return_exceptions=True
+        )
+        # A failed index makes its queries slower, not wrong: reported, but not fatal
+        cls.index_failures = {
+            name: str(result) for name, result in zip(indexes, results) if isinstance(result, Exception)
+        }
+        cls.indexes_ready = True
+        if cls.index_failures:
+            failures = "; ".join(f"{name}: {error}" for name, error in cls.index_failures.items())
+            logger.warning(f"⚠️ Index creation warning: {failures}")
+        else:
+            logger.info(f"✅ Database indexes created in {(time.perf_counter() - started) * 1000:.0f} ms")
     
     @classmethod
     def get_db(cls) -> AsyncIOMotorDatabase:
-        """Get database instance"""
+        """Get database instance (ingest/write pool)"""
         return cls.db
-
-
-# Dependency for FastAPI routes
-async def get_database() -> AsyncIOMotorDatabase:
-    """FastAPI dependency to get database"""
-    return Database.get_db()
+    
+    @classmethod
+    def get_read_db(cls) -> AsyncIOMotorDatabase:
+        """Get database instance for dashboard queries (read pool)"""
+        return cls.read_db
+    
+    @classmethod
+    def pool_metrics(cls) -> dict:
+        """Pool usage per client, with the options that shape it"""
+        separate = cls.read_client is not None and cls.read_client is not cls.client
+        return {
+            "write": {
+                **cls.pool_monitors["write"].metrics(),
+                "max_pool_size": settings.MONGODB_WRITE_MAX_POOL_SIZE,
+                "write_concern": settings.MONGODB_WRITE_CONCERN,
+            },
+            "read": {
+                **cls.pool_monitors["read" if separate else "write"].metrics(),
+                "separate_pool": separate,
+                "max_pool_size": settings.MONGODB_READ_MAX_POOL_SIZE if separate else settings.MONGODB_WRITE_MAX_POOL_SIZE,
+                "read_preference": settings.MONGODB_READ_PREFERENCE if separate else "primary",
+            },
+            "compressors": settings.MONGODB_COMPRESSORS or None,
+        }
@@ -1,11 +1,22 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 from app.config import settings
-from app.database import Database
-from app.routes import dashboard_router, settings_router, alerts_router
+from app.storage import storage
+from app.routes import dashboard_router, settings_router, alerts_router, admin_router, analytics_router
 from app.services.mqtt_service import mqtt_service
+from app.services.spool_service import reading_spool, spool_replayer
+from app.services.anomaly_service import anomaly_checkpointer
+from app.services.alert_service import alert_counter_repair
+from app.services.sketch_service import sketch_service
+from app.services.analytics_service import analytics_service
+from app.services.irrigation_service import irrigation_controller
+from app.services.loopback_broker import create_loopback_transport
+from app.services.heartbeat_service import device_offline_sweeper, heartbeat_table
+from app.services.notification_service import notification_dispatcher
+from app.utils.compression import CompressionMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -23,14 +34,48 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Starting Smart Crop Irrigation System...")
     
     try:
-        # Connect to MongoDB
-        await Database.connect_db()
+        # Open the local reading spool
+        reading_spool.open()
+        
+        # Connect to the storage backend
+        await storage.connect()
+        
+        # Replay readings spooled while the database was unavailable
+        spool_replayer.start()
+        
+        # Resume anomaly detection from its last checkpoint
+        await anomaly_checkpointer.load()
+        anomaly_checkpointer.start()
+        
+        # Watch for devices that stop reporting, resuming from the last checkpoint
+        await device_offline_sweeper.load()
+        device_offline_sweeper.start()
+        
+        # Keep the alert statistics counters consistent with the alerts
+        alert_counter_repair.start()
+        
+        # Send alert emails queued in the notification outbox, including any left by a restart
+        notification_dispatcher.start()
+        
+        # Periodically save the percentile sketches
+        sketch_service.start()
+        
+        # Move closed days of readings to the Parquet archive
+        if settings.ARCHIVE_ENABLED:
+            from app.services.archive_service import sensor_archiver
+            sensor_archiver.start()
+        
+        # Send valve commands through the MQTT broker, or to simulated valves in-process
+        if settings.IRRIGATION_TRANSPORT == "loopback":
+            irrigation_controller.start(create_loopback_transport(irrigation_controller.handle_ack))
+        else:
+            irrigation_controller.start(mqtt_service)
         
         # Start MQTT service
         mqtt_service.start()
         
         logger.info("✅ Application started successfully")
-        
+    
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
         raise
@@ -44,11 +89,41 @@ async def lifespan(app: FastAPI):
         # Stop MQTT service
         mqtt_service.stop()
         
+        # Stop retrying valve commands
+        await irrigation_controller.stop()
+        
+        # Stop spool replay
+        await spool_replayer.stop()
+        reading_spool.close()
+        
+        # Cancel analytics jobs and stop their worker processes
+        await analytics_service.stop()
+        
+        # Stop archiving
+        if settings.ARCHIVE_ENABLED:
+            from app.services.archive_service import sensor_archiver
+            await sensor_archiver.stop()
+        
+        # Save the percentile sketches
+        await sketch_service.stop()
+        
+        # Stop offline detection and checkpoint device heartbeats
+        await device_offline_sweeper.stop()
+        
+        # Stop alert counter repair
+        await alert_counter_repair.stop()
+        
+        # Stop sending alert emails; unsent ones stay in the outbox
+        await notification_dispatcher.stop()
+        
+        # Checkpoint anomaly detector state
+        await anomaly_checkpointer.stop()
+        
         # Close database connection
-        await Database.close_db()
+        await storage.close()
         
         logger.info("✅ Application shutdown complete")
-        
+    
     except Exception as e:
         logger.error(f"❌ Shutdown error: {e}")
 
@@ -68,12 +143,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Sync-Token", "X-Sync-Has-More"],
+)
+
+# Compress large responses (history, alert lists) for clients that accept it
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
 )
 
 # Include routers
 app.include_router(dashboard_router)
 app.include_router(settings_router)
 app.include_router(alerts_router)
+app.include_router(admin_router)
+app.include_router(analytics_router)
 
 
 @app.get("/")
@@ -94,8 +180,48 @@ async def health_check():
     return {
         "status": "healthy",
         "mqtt_connected": mqtt_service.is_connected,
-        "database": "connected" if Database.db else "disconnected"
+        "database": "connected" if storage.is_connected else "disconnected",
+        "storage_backend": storage.name,
+        "spool_depth": reading_spool.depth,
+        "ingest": heartbeat_table.summary()
+    }
+
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ingest")
+async def ingest_health():
+    """Ingest lag overall and per device, from the in-memory heartbeat table"""
+    return {
+        "offline_after_seconds": settings.DEVICE_OFFLINE_AFTER_SECONDS,
+        **heartbeat_table.summary(),
+        "devices": heartbeat_table.devices()
+    }
+
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness probe: storage connected and index build finished (503 otherwise)
+    
+    Indexes that failed to build leave the app "degraded" but ready: queries
+    still work. MQTT is left out, since the HTTP API doesn't need the broker
+    (see /api/health).
+    """
+    checks = {
+        "database": storage.is_connected,
+        "indexes": storage.is_ready,
     }
+    ready = all(checks.values())
+    content = {"status": "ready" if ready else "starting", "checks": checks}
+    failures = storage.index_failures
+    if failures:
+        # Only known once the build has finished, so the app is ready by then
+        content.update(status="degraded", index_failures=failures)
+    return JSONResponse(status_code=200 if ready else 503, content=content)
 
 
 if __name__ == "__main__":
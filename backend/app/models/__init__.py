@@ -1,14 +1,36 @@
-from .sensor_data import SensorData, SensorReading
-from .settings import SystemSettings, ThresholdSettings, EmailSettings
-from .alert import Alert, AlertType, AlertSeverity
+from .sensor_data import SensorData, SensorReading, SensorStats, SensorType, SensorForecast
+from .settings import (
+    SystemSettings,
+    ThresholdSettings,
+    EmailSettings,
+    UpdateThresholds,
+    ThresholdSimulationRequest,
+    MetricSimulation,
+    ThresholdSimulation,
+)
+from .analytics import AnalyticsJob, AnalyticsJobRequest
+from .alert import Alert, AlertChanges, AlertFilter, AlertType, AlertSeverity, AlertResponse, AlertStats
 
 __all__ = [
     "SensorData",
     "SensorReading",
+    "SensorStats",
+    "SensorType",
+    "SensorForecast",
     "SystemSettings",
     "ThresholdSettings",
     "EmailSettings",
+    "UpdateThresholds",
+    "ThresholdSimulationRequest",
+    "MetricSimulation",
+    "ThresholdSimulation",
     "Alert",
+    "AlertChanges",
+    "AlertFilter",
     "AlertType",
     "AlertSeverity",
+    "AlertResponse",
+    "AlertStats",
+    "AnalyticsJob",
+    "AnalyticsJobRequest",
 ]
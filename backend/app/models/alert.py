@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
 
@@ -14,6 +14,10 @@ class AlertType(str, Enum):
     HUMIDITY_HIGH = "humidity_high"
     LIGHT_INTENSITY_LOW = "light_intensity_low"
     LIGHT_INTENSITY_HIGH = "light_intensity_high"
+    SENSOR_ANOMALY = "sensor_anomaly"
+    SENSOR_STUCK = "sensor_stuck"
+    DEVICE_OFFLINE = "device_offline"
+    IRRIGATION_FAILED = "irrigation_failed"
 
 
 class AlertSeverity(str, Enum):
@@ -31,6 +35,7 @@ class Alert(BaseModel):
     message: str
     sensor_value: float
     threshold_value: float
+    device_id: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     is_resolved: bool = Field(False)
     email_sent: bool = Field(False)
@@ -51,6 +56,28 @@ class Alert(BaseModel):
         }
 
 
+class AlertFilter(BaseModel):
+    """Filter for bulk alert operations"""
+    alert_types: Optional[List[AlertType]] = None
+    severities: Optional[List[AlertSeverity]] = None
+    device_id: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    is_resolved: Optional[bool] = None
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "alert_types": ["soil_moisture_low"],
+                "device_id": "ESP32_001",
+                "since": "2024-01-01T00:00:00"
+            }
+        }
+    
+    def is_empty(self) -> bool:
+        return not any(value is not None for value in self.model_dump().values())
+
+
 class AlertResponse(BaseModel):
     """Response model for alerts"""
     total_alerts: int
@@ -58,10 +85,18 @@ class AlertResponse(BaseModel):
     alerts: list[Alert]
 
 
+class AlertChanges(BaseModel):
+    """Alert changes since a sync token"""
+    alerts: list[Alert]  # created or updated (e.g. resolved), current state
+    deleted: list[str]  # ids of deleted alerts
+    sync_token: str
+
+
 class AlertStats(BaseModel):
     """Alert statistics for dashboard"""
     total_alerts: int
     unresolved_alerts: int
     alerts_by_type: dict[str, int]
     alerts_by_severity: dict[str, int]
+    alerts_by_device: dict[str, int] = {}
     recent_alerts: list[Alert]
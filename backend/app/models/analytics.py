@@ -0,0 +1,54 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+from datetime import datetime, timezone
+
+AnalyticsReport = Literal["correlation", "daily", "growing_degree_days"]
+
+
+class AnalyticsJobRequest(BaseModel):
+    """Season-level reports to compute over a range of stored readings"""
+    reports: List[AnalyticsReport] = Field(
+        default_factory=lambda: ["correlation", "daily", "growing_degree_days"],
+        min_length=1,
+        description="Reports to compute"
+    )
+    since: datetime = Field(..., description="Start of the range (UTC)")
+    until: Optional[datetime] = Field(None, description="End of the range (UTC), open-ended by default")
+    device_id: Optional[str] = Field(None, description="Only readings from this device")
+    gdd_base_celsius: float = Field(10.0, ge=-20, le=40, description="Base temperature for growing-degree-days")
+    
+    @field_validator("since", "until")
+    @classmethod
+    def normalize_time(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Compare as naive UTC, like stored timestamps"""
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "reports": ["correlation", "daily", "growing_degree_days"],
+                "since": "2026-03-01T00:00:00Z",
+                "device_id": "ESP32_001",
+                "gdd_base_celsius": 10.0
+            }
+        }
+
+
+class AnalyticsJob(BaseModel):
+    """Status of an analytics job"""
+    id: str
+    status: Literal["queued", "running", "done", "failed"]
+    reports: List[AnalyticsReport]
+    since: datetime
+    until: Optional[datetime] = None
+    device_id: Optional[str] = None
+    gdd_base_celsius: float
+    cached: bool = Field(False, description="Served from a previous job's result")
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    batches: int = 0
+    total_readings: int = 0
+    error: Optional[str] = None
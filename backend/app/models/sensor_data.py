@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter, field_validator
+from datetime import datetime, timezone
+from typing import Annotated, Dict, List, Optional, Union
+from typing_extensions import NotRequired, TypedDict
 from enum import Enum
 
 
@@ -12,13 +13,38 @@ class SensorType(str, Enum):
     LIGHT_INTENSITY = "light_intensity"
 
 
+DEFAULT_DEVICE_ID = "ESP32_001"
+
+# Field constraints shared by SensorReading and the ingest decoder
+SoilMoisture = Annotated[float, Field(ge=0, le=100, description="Soil moisture percentage")]
+Temperature = Annotated[float, Field(ge=-50, le=100, description="Temperature in Celsius")]
+Humidity = Annotated[float, Field(ge=0, le=100, description="Humidity percentage")]
+LightIntensity = Annotated[float, Field(ge=0, le=100000, description="Light intensity in Lux")]
+
+
+def normalize_timestamp(value: Optional[datetime]) -> datetime:
+    """Store device timestamps as naive UTC, like the rest of the database"""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    # MongoDB keeps millisecond precision; truncate so redeliveries match exactly
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
 class SensorReading(BaseModel):
     """Individual sensor reading from MQTT"""
-    soil_moisture: float = Field(..., ge=0, le=100, description="Soil moisture percentage")
-    temperature: float = Field(..., ge=-50, le=100, description="Temperature in Celsius")
-    humidity: float = Field(..., ge=0, le=100, description="Humidity percentage")
-    light_intensity: float = Field(..., ge=0, le=100000, description="Light intensity in Lux")
-    timestamp: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    soil_moisture: SoilMoisture
+    temperature: Temperature
+    humidity: Humidity
+    light_intensity: LightIntensity
+    timestamp: Optional[datetime] = Field(default_factory=datetime.utcnow, description="Device timestamp (UTC)")
+    device_id: str = Field(default=DEFAULT_DEVICE_ID)
+    
+    @field_validator("timestamp")
+    @classmethod
+    def normalize_timestamp(cls, value: Optional[datetime]) -> datetime:
+        return normalize_timestamp(value)
     
     class Config:
         json_schema_extra = {
@@ -27,11 +53,47 @@ class SensorReading(BaseModel):
                 "temperature": 28.3,
                 "humidity": 65.2,
                 "light_intensity": 15000.0,
-                "timestamp": "2026-01-20T14:30:00Z"
+                "timestamp": "2026-01-20T14:30:00Z",
+                "device_id": "ESP32_001"
             }
         }
 
 
+class SensorReadingDocument(TypedDict):
+    """A validated reading as a plain dict, ready to insert (see `decode_readings`)"""
+    soil_moisture: SoilMoisture
+    temperature: Temperature
+    humidity: Humidity
+    light_intensity: LightIntensity
+    timestamp: NotRequired[Annotated[Optional[datetime], AfterValidator(normalize_timestamp)]]
+    device_id: NotRequired[str]
+
+
+# Built once: validating raw JSON against a cached schema skips json.loads and the model instance
+_reading_adapter = TypeAdapter(SensorReadingDocument)
+_readings_adapter = TypeAdapter(List[SensorReadingDocument])
+
+
+def decode_readings(raw: Union[str, bytes], received_at: Optional[datetime] = None) -> List[dict]:
+    """Parse and validate a JSON reading, or a JSON array of readings, in one pass
+    
+    Returns insert-ready documents with the same values SensorReading would
+    give (defaults filled in, timestamps normalized) plus `received_at`.
+    Raises pydantic's ValidationError (a ValueError) for bad JSON or values.
+    """
+    if raw.lstrip()[:1] in (b"[", "["):
+        docs = _readings_adapter.validate_json(raw)
+    else:
+        docs = [_reading_adapter.validate_json(raw)]
+    received_at = received_at or datetime.utcnow()
+    for doc in docs:
+        if "timestamp" not in doc:
+            doc["timestamp"] = received_at
+        doc.setdefault("device_id", DEFAULT_DEVICE_ID)
+        doc["received_at"] = received_at
+    return docs
+
+
 class SensorData(BaseModel):
     """Sensor data stored in database"""
     id: Optional[str] = Field(None, alias="_id")
@@ -41,6 +103,7 @@ class SensorData(BaseModel):
     light_intensity: float
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     device_id: str = Field(default="ESP32_001")
+    received_at: Optional[datetime] = None
     
     class Config:
         populate_by_name = True
@@ -70,4 +133,25 @@ class SensorStats(BaseModel):
     min_light_intensity: float
     max_light_intensity: float
     total_readings: int
+    percentiles: Dict[str, Dict[str, float]] = {}
     latest_reading: Optional[SensorReading] = None
+
+
+class SensorForecast(BaseModel):
+    """Projected threshold crossing for one device metric"""
+    device_id: str
+    metric: str
+    status: str
+    samples: int
+    current_value: Optional[float] = None
+    trend_value: Optional[float] = None
+    slope_per_hour: Optional[float] = None
+    r_squared: Optional[float] = None
+    window_start: Optional[datetime] = None
+    window_end: Optional[datetime] = None
+    threshold_name: Optional[str] = None
+    threshold_value: Optional[float] = None
+    projected_crossing: Optional[datetime] = None
+    crossing_earliest: Optional[datetime] = None
+    crossing_latest: Optional[datetime] = None
+    hours_until_crossing: Optional[float] = None
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Dict, Optional
+from datetime import datetime, timezone
 
 
 class ThresholdSettings(BaseModel):
@@ -31,7 +31,7 @@ class ThresholdSettings(BaseModel):
 
 class EmailSettings(BaseModel):
     """Email notification settings"""
-    email: EmailStr = Field(..., description="Email address for alerts")
+    email: Optional[EmailStr] = Field(None, description="Email address for alerts")
     enabled: bool = Field(True, description="Enable/disable email notifications")
     
     class Config:
@@ -50,6 +50,7 @@ class SystemSettings(BaseModel):
     thresholds: ThresholdSettings = Field(default_factory=ThresholdSettings)
     email_settings: EmailSettings
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = Field(0, description="Incremented on every change; the settings ETag")
     
     class Config:
         populate_by_name = True
@@ -84,3 +85,55 @@ class UpdateThresholds(BaseModel):
     humidity_max: Optional[float] = Field(None, ge=0, le=100)
     light_intensity_min: Optional[float] = Field(None, ge=0)
     light_intensity_max: Optional[float] = Field(None, ge=0)
+
+
+class ThresholdSimulationRequest(BaseModel):
+    """Candidate thresholds and the stored history to evaluate them against"""
+    thresholds: UpdateThresholds = Field(
+        default_factory=UpdateThresholds,
+        description="Candidate values; unset ones keep the current thresholds"
+    )
+    since: datetime = Field(..., description="Start of the simulated range (UTC)")
+    until: Optional[datetime] = Field(None, description="End of the simulated range (UTC), defaults to now")
+    device_id: Optional[str] = Field(None, description="Only readings from this device")
+    
+    @field_validator("since", "until")
+    @classmethod
+    def normalize_time(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Compare as naive UTC, like stored timestamps"""
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "thresholds": {"soil_moisture_min": 25.0, "temperature_max": 38.0},
+                "since": "2026-03-01T00:00:00Z",
+                "until": "2026-06-01T00:00:00Z"
+            }
+        }
+
+
+class MetricSimulation(BaseModel):
+    """What one metric's thresholds would have produced"""
+    min: float
+    max: float
+    below_min: int = Field(..., description="Readings below the minimum")
+    above_max: int = Field(..., description="Readings above the maximum")
+    alerts: int = Field(..., description="Alerts that would have been raised (one per violating reading)")
+    episodes: int = Field(..., description="Times a device went from in range to out of range")
+    seconds_in_violation: float
+    percent_time_in_violation: float
+
+
+class ThresholdSimulation(BaseModel):
+    """Result of a threshold what-if simulation"""
+    since: datetime
+    until: datetime
+    device_id: Optional[str] = None
+    total_readings: int
+    devices: int
+    observed_seconds: float = Field(..., description="Time covered by readings (gaps are capped)")
+    metrics: Dict[str, MetricSimulation]
+    elapsed_ms: float
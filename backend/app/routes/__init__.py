@@ -1,5 +1,7 @@
 from .dashboard import router as dashboard_router
 from .settings import router as settings_router
 from .alerts import router as alerts_router
+from .admin import router as admin_router
+from .analytics import router as analytics_router
 
-__all__ = ["dashboard_router", "settings_router", "alerts_router"]
+__all__ = ["dashboard_router", "settings_router", "alerts_router", "admin_router", "analytics_router"]
@@ -0,0 +1,182 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.utils.timing import stage_timings
+from app.utils.profiler import profiler, ProfilerBusyError
+from app.services.spool_service import reading_spool
+from app.services.alert_service import alert_counter_repair
+from app.services.irrigation_service import irrigation_controller
+from app.services.notification_service import notification_dispatcher
+from app.storage import get_storage
+from app.config import settings
+from typing import Literal, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/admin", tags=["Admin"])
+
+
+@router.get("/timings")
+async def get_stage_timings():
+    """Get percentile summaries of per-stage hot-path timings"""
+    return stage_timings.summary()
+
+
+@router.delete("/timings")
+async def reset_stage_timings():
+    """Reset the per-stage timing summaries"""
+    stage_timings.reset()
+    return {"message": "Stage timings reset successfully"}
+
+
+@router.get("/spool")
+async def get_spool_metrics():
+    """Get reading spool depth and replay metrics"""
+    return reading_spool.metrics()
+
+
+@router.get("/mongo-pools")
+async def get_mongo_pool_metrics():
+    """Get MongoDB connection pool usage for the ingest and query clients"""
+    if settings.STORAGE_BACKEND != "mongo":
+        raise HTTPException(status_code=404, detail="MongoDB storage backend is not in use")
+    from app.database import Database
+    return Database.pool_metrics()
+
+
+@router.post("/alert-counters/rebuild")
+async def rebuild_alert_counters():
+    """Recompute the hourly alert statistics counters from the alerts"""
+    try:
+        buckets = await alert_counter_repair.run()
+        if buckets is None:
+            raise HTTPException(status_code=409, detail="Alert counters are already being rebuilt")
+        return {"message": "Alert counters rebuilt successfully", "buckets": buckets}
+    
+    except HTTPException:
+        raise
+    
+    except Exception as e:
+        logger.error(f"Error rebuilding alert counters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/archive")
+async def get_archive_status():
+    """Get the extent and size of the Parquet sensor data archive"""
+    archive = getattr(get_storage().sensor_data, "archive", None)
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Sensor data archive is not enabled")
+    return archive.status()
+
+
+@router.post("/archive/run")
+async def run_archiver():
+    """Archive closed days of sensor readings now instead of waiting for the next run"""
+    if not settings.ARCHIVE_ENABLED:
+        raise HTTPException(status_code=404, detail="Sensor data archive is not enabled")
+    try:
+        from app.services.archive_service import sensor_archiver
+        return await sensor_archiver.run()
+    
+    except Exception as e:
+        logger.error(f"Error archiving sensor data: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/irrigation")
+async def get_irrigation_metrics():
+    """Get valve command counters, unacknowledged commands and reading-to-actuation latency histograms"""
+    return irrigation_controller.metrics()
+
+
+@router.post("/irrigation/{device_id}/{action}")
+async def send_valve_command(
+    device_id: str,
+    action: Literal["open", "close"],
+    duration_seconds: Optional[int] = Query(None, ge=1, le=3600, description="How long to open the valve")
+):
+    """Send a valve command to a device now, regardless of soak time"""
+    if not irrigation_controller.enabled or irrigation_controller.transport is None:
+        raise HTTPException(status_code=404, detail="Irrigation control is not enabled")
+    try:
+        return await irrigation_controller.send(device_id, action, reason="manual", duration_seconds=duration_seconds, force=True)
+    
+    except Exception as e:
+        logger.error(f"Error sending valve command: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/outbox")
+async def get_outbox_metrics():
+    """Get pending and dead-lettered notification counts and dispatch counters"""
+    try:
+        return await notification_dispatcher.metrics()
+    
+    except Exception as e:
+        logger.error(f"Error fetching outbox metrics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/outbox/dead-letters")
+async def get_dead_letters(limit: int = Query(50, ge=1, le=500)):
+    """Get notifications that ran out of send attempts, most recently failed first"""
+    try:
+        return await get_storage().outbox.dead_letters(limit)
+    
+    except Exception as e:
+        logger.error(f"Error fetching dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/outbox/dead-letters/{message_id}/retry")
+async def retry_dead_letter(message_id: str):
+    """Send a dead-lettered notification again, with a fresh set of attempts"""
+    try:
+        if not await get_storage().outbox.requeue(message_id):
+            raise HTTPException(status_code=404, detail="Dead letter not found")
+        notification_dispatcher.wake()
+        return {"message": "Notification requeued successfully", "message_id": message_id}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error requeuing dead letter: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/outbox/dead-letters/{message_id}")
+async def delete_dead_letter(message_id: str):
+    """Discard a dead-lettered notification"""
+    try:
+        if not await get_storage().outbox.delete(message_id):
+            raise HTTPException(status_code=404, detail="Dead letter not found")
+        return {"message": "Dead letter deleted successfully", "message_id": message_id}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting dead letter: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def run_profiler(
+    seconds: float = Query(10, gt=0, le=120, description="Profiling duration in seconds"),
+    interval_ms: float = Query(5, ge=1, le=100, description="Sampling interval in milliseconds")
+):
+    """Sample all threads for N seconds and return collapsed stacks for flamegraph.pl / speedscope"""
+    try:
+        logger.info(f"🔬 Profiling for {seconds}s (interval {interval_ms}ms)")
+        stacks = await asyncio.to_thread(profiler.run, seconds, interval_ms / 1000)
+        
+        return PlainTextResponse(
+            profiler.to_collapsed(stacks),
+            headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+        )
+    
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error running profiler: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,36 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.database import get_database
-from app.models import Alert, AlertResponse, AlertStats
-from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from app.storage import Storage, get_storage
+from app.storage.base import EPOCH, epoch_seconds
+from app.config import settings as app_settings
+from app.models import Alert, AlertChanges, AlertFilter, AlertStats
+from app.utils.sync_token import StaleSyncTokenError, SyncTokenError, decode_sync_token, encode_sync_token
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Union
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/alerts", tags=["Alerts"])
 
 
-@router.get("/", response_model=List[Alert])
+@router.get("/", response_model=Union[List[Alert], AlertChanges])
 async def get_alerts(
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
     unresolved_only: bool = Query(False),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    device_id: Optional[str] = Query(None),
+    sync_token: Optional[str] = Query(None, description="Only changes since this X-Sync-Token"),
+    storage: Storage = Depends(get_storage)
 ):
-    """Get alerts with optional filtering"""
+    """Get alerts with optional filtering
+    
+    Every response carries an X-Sync-Token header. Passing it back as
+    `sync_token` returns only the alerts created, updated or deleted since
+    (for every alert of the device, whatever `unresolved_only` says).
+    """
     try:
-        query = {}
-        if unresolved_only:
-            query["is_resolved"] = False
+        # Changes from the last few seconds may still be being written; the next poll gets them
+        until = datetime.utcnow() - timedelta(seconds=app_settings.SYNC_SETTLE_SECONDS)
+        token = encode_sync_token("alerts", storage.name, epoch_seconds(until))
+        response.headers["X-Sync-Token"] = token
         
-        cursor = db.alerts.find(query).sort("timestamp", -1).limit(limit)
-        alerts = await cursor.to_list(length=limit)
+        if sync_token:
+            since = EPOCH + timedelta(seconds=decode_sync_token(sync_token, "alerts", storage.name))
+            if since < datetime.utcnow() - timedelta(hours=app_settings.SYNC_TOMBSTONE_RETENTION_HOURS):
+                raise StaleSyncTokenError("Sync token is older than the retained alert changes")
+            
+            max_changes = app_settings.SYNC_MAX_ALERT_CHANGES
+            alerts, deleted = await storage.alerts.changes(since, until, max_changes + 1, device_id=device_id)
+            if len(alerts) + len(deleted) > max_changes:
+                raise StaleSyncTokenError("Too many alert changes since the sync token")
+            
+            return AlertChanges(alerts=[Alert(**alert) for alert in alerts], deleted=deleted, sync_token=token)
         
-        for alert in alerts:
-            alert["_id"] = str(alert["_id"])
+        alerts = await storage.alerts.find(
+            unresolved_only=unresolved_only, limit=limit, device_id=device_id
+        )
         
         return [Alert(**alert) for alert in alerts]
     
+    except StaleSyncTokenError as e:
+        raise HTTPException(status_code=410, detail=f"{e}; reload without sync_token")
+    except SyncTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting alerts: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -39,47 +63,19 @@ async def get_alerts(
 @router.get("/stats", response_model=AlertStats)
 async def get_alert_stats(
     hours: int = Query(24, ge=1, le=168),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    storage: Storage = Depends(get_storage)
 ):
     """Get alert statistics"""
     try:
         time_threshold = datetime.utcnow() - timedelta(hours=hours)
         
-        total_alerts = await db.alerts.count_documents(
-            {"timestamp": {"$gte": time_threshold}}
-        )
-        
-        unresolved_alerts = await db.alerts.count_documents(
-            {"timestamp": {"$gte": time_threshold}, "is_resolved": False}
-        )
-        
-        pipeline = [
-            {"$match": {"timestamp": {"$gte": time_threshold}}},
-            {"$group": {"_id": "$alert_type", "count": {"$sum": 1}}}
-        ]
-        
-        alerts_by_type_cursor = db.alerts.aggregate(pipeline)
-        alerts_by_type_list = await alerts_by_type_cursor.to_list(length=None)
-        alerts_by_type = {item["_id"]: item["count"] for item in alerts_by_type_list}
-        
-        pipeline[1]["$group"]["_id"] = "$severity"
-        alerts_by_severity_cursor = db.alerts.aggregate(pipeline)
-        alerts_by_severity_list = await alerts_by_severity_cursor.to_list(length=None)
-        alerts_by_severity = {item["_id"]: item["count"] for item in alerts_by_severity_list}
-        
-        recent_cursor = db.alerts.find(
-            {"timestamp": {"$gte": time_threshold}}
-        ).sort("timestamp", -1).limit(10)
+        # Summed from at most `hours` hourly counter buckets, not a scan of the alerts
+        summary = await storage.alerts.summary(time_threshold)
         
-        recent_alerts = await recent_cursor.to_list(length=10)
-        for alert in recent_alerts:
-            alert["_id"] = str(alert["_id"])
+        recent_alerts = await storage.alerts.find(since=time_threshold, limit=10)
         
         return AlertStats(
-            total_alerts=total_alerts,
-            unresolved_alerts=unresolved_alerts,
-            alerts_by_type=alerts_by_type,
-            alerts_by_severity=alerts_by_severity,
+            **summary,
             recent_alerts=[Alert(**alert) for alert in recent_alerts]
         )
     
@@ -88,24 +84,62 @@ async def get_alert_stats(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/bulk/resolve")
+async def bulk_resolve_alerts(
+    alert_filter: AlertFilter,
+    storage: Storage = Depends(get_storage)
+):
+    """Resolve every open alert matching a filter"""
+    try:
+        if alert_filter.is_empty():
+            raise HTTPException(status_code=400, detail="At least one filter is required")
+        
+        resolved = await storage.alerts.resolve_many(
+            **alert_filter.model_dump(exclude={"is_resolved"})
+        )
+        logger.info(f"✅ Bulk resolved {resolved} alerts")
+        
+        return {"message": "Alerts resolved successfully", "resolved": resolved}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error bulk resolving alerts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/bulk/delete")
+async def bulk_delete_alerts(
+    alert_filter: AlertFilter,
+    storage: Storage = Depends(get_storage)
+):
+    """Delete every alert matching a filter"""
+    try:
+        if alert_filter.is_empty():
+            raise HTTPException(status_code=400, detail="At least one filter is required")
+        
+        deleted = await storage.alerts.delete_many(**alert_filter.model_dump())
+        logger.info(f"🗑️ Bulk deleted {deleted} alerts")
+        
+        return {"message": "Alerts deleted successfully", "deleted": deleted}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error bulk deleting alerts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.put("/{alert_id}/resolve")
 async def resolve_alert(
     alert_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    storage: Storage = Depends(get_storage)
 ):
     """Mark an alert as resolved"""
     try:
-        result = await db.alerts.update_one(
-            {"_id": ObjectId(alert_id)},
-            {
-                "$set": {
-                    "is_resolved": True,
-                    "resolved_at": datetime.utcnow()
-                }
-            }
-        )
+        resolved = await storage.alerts.resolve(alert_id)
         
-        if result.modified_count == 0:
+        if not resolved:
             raise HTTPException(status_code=404, detail="Alert not found")
         
         return {"message": "Alert resolved successfully", "alert_id": alert_id}
@@ -120,13 +154,13 @@ async def resolve_alert(
 @router.delete("/{alert_id}")
 async def delete_alert(
     alert_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    storage: Storage = Depends(get_storage)
 ):
     """Delete an alert"""
     try:
-        result = await db.alerts.delete_one({"_id": ObjectId(alert_id)})
+        deleted = await storage.alerts.delete(alert_id)
         
-        if result.deleted_count == 0:
+        if not deleted:
             raise HTTPException(status_code=404, detail="Alert not found")
         
         return {"message": "Alert deleted successfully", "alert_id": alert_id}
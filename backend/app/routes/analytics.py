@@ -0,0 +1,62 @@
+from fastapi import APIRouter, HTTPException
+from app.config import settings
+from app.models import AnalyticsJob, AnalyticsJobRequest
+from app.services.analytics_service import analytics_service
+from datetime import datetime, timedelta
+from typing import Any, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
+
+
+def _get_job(job_id: str) -> dict:
+    job = analytics_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analytics job not found")
+    return job
+
+
+@router.post("/jobs", response_model=AnalyticsJob, status_code=202)
+async def submit_analytics_job(request: AnalyticsJobRequest):
+    """Start computing season reports in the background; poll the job for its status"""
+    try:
+        until = request.until or datetime.utcnow()
+        if request.since >= until:
+            raise HTTPException(status_code=400, detail="since must be before until")
+        if until - request.since > timedelta(days=settings.ANALYTICS_MAX_DAYS):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Analytics range is limited to {settings.ANALYTICS_MAX_DAYS} days"
+            )
+        
+        return AnalyticsJob(**await analytics_service.submit(request))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting analytics job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=AnalyticsJob)
+async def get_analytics_job(job_id: str):
+    """Get the status of an analytics job"""
+    return AnalyticsJob(**_get_job(job_id))
+
+
+@router.get("/jobs/{job_id}/result", response_model=Dict[str, Any])
+async def get_analytics_result(job_id: str):
+    """Get the reports of a finished analytics job (409 while it is still running or if it failed)"""
+    job = _get_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Analytics job failed: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Analytics job is {job['status']}")
+    return {
+        "since": job["since"],
+        "until": job["until"],
+        "device_id": job["device_id"],
+        "cached": job["cached"],
+        **job["result"]
+    }
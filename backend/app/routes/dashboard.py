@@ -1,29 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.database import get_database
-from app.models import SensorData, SensorStats
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
+from app.storage import SENSOR_FIELDS, Storage, get_storage
+from app.storage.base import epoch_seconds
+from app.utils.sync_token import StaleSyncTokenError, SyncTokenError, decode_sync_token, encode_sync_token
+from app.models import SensorData, SensorForecast, SensorStats, ThresholdSettings
+from app.services.forecast_service import forecast_service
+from app.services.sketch_service import sketch_service
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional, Union
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
+# Hours per unit for the `windows` statistics parameter
+WINDOW_UNITS = {"m": 1 / 60, "h": 1, "d": 24}
+
 
 @router.get("/sensor-data/latest", response_model=SensorData)
-async def get_latest_sensor_data(db: AsyncIOMotorDatabase = Depends(get_database)):
+async def get_latest_sensor_data(storage: Storage = Depends(get_storage)):
     """Get the most recent sensor reading"""
     try:
-        sensor_data = await db.sensor_data.find_one(
-            sort=[("timestamp", -1)]
-        )
+        sensor_data = await storage.sensor_data.latest()
         
         if not sensor_data:
             raise HTTPException(status_code=404, detail="No sensor data found")
         
-        # Convert ObjectId to string
-        sensor_data["_id"] = str(sensor_data["_id"])
-        
         return SensorData(**sensor_data)
     
     except HTTPException:
@@ -33,83 +35,137 @@ async def get_latest_sensor_data(db: AsyncIOMotorDatabase = Depends(get_database
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/sensor-data/history", response_model=List[SensorData])
+def _columnar(docs: List[dict]) -> dict:
+    """Parallel arrays for charts: epoch-ms timestamps and one array per metric
+    
+    `device_id` is a single value when every point is from one device;
+    otherwise `devices` lists them and `device` holds an index per point.
+    """
+    payload = {"count": len(docs), "timestamps": [int(epoch_seconds(doc["timestamp"]) * 1000) for doc in docs]}
+    devices = list(dict.fromkeys(doc["device_id"] for doc in docs))
+    if len(devices) == 1:
+        payload["device_id"] = devices[0]
+    elif devices:
+        index = {device: position for position, device in enumerate(devices)}
+        payload["devices"] = devices
+        payload["device"] = [index[doc["device_id"]] for doc in docs]
+    for field in SENSOR_FIELDS:
+        payload[field] = [doc[field] for doc in docs]
+    return payload
+
+
+@router.get("/sensor-data/history", response_model=Union[List[SensorData], Dict[str, Any]])
 async def get_sensor_data_history(
+    response: Response,
     hours: int = Query(24, ge=1, le=168, description="Number of hours to retrieve"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records"),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    device_id: Optional[str] = Query(None, description="Only readings from this device"),
+    format: Literal["json", "columnar"] = Query("json", description="columnar: parallel arrays for charts"),
+    sync_token: Optional[str] = Query(None, description="Only readings stored since this X-Sync-Token"),
+    storage: Storage = Depends(get_storage)
 ):
-    """Get historical sensor data for specified time period"""
+    """Get historical sensor data for specified time period (newest first)
+    
+    Every response carries an X-Sync-Token header. Passing it back as
+    `sync_token` returns only the readings stored since, newest first: the
+    oldest `limit` of them, with X-Sync-Has-More: true if there are more to
+    fetch with the new token.
+    """
     try:
         # Calculate time threshold
         time_threshold = datetime.utcnow() - timedelta(hours=hours)
         
-        # Query database
-        cursor = db.sensor_data.find(
-            {"timestamp": {"$gte": time_threshold}}
-        ).sort("timestamp", -1).limit(limit)
+        has_more = False
+        if sync_token:
+            previous = decode_sync_token(sync_token, "readings", storage.name)
+            sensor_data_list, cursor, has_more = await storage.sensor_data.changes_since(
+                previous, time_threshold, limit, device_id=device_id
+            )
+            if has_more and cursor == previous:
+                # More than `limit` readings share the token's position; paging can't move past them
+                raise StaleSyncTokenError("Too many readings stored at once since this sync token")
+            sensor_data_list.reverse()
+        else:
+            # Taken before the query, so nothing stored meanwhile is missed by the next poll
+            cursor = await storage.sensor_data.sync_cursor()
+            sensor_data_list = await storage.sensor_data.history(time_threshold, limit, device_id=device_id)
+        headers = {"X-Sync-Token": encode_sync_token("readings", storage.name, cursor)}
+        if sync_token:
+            headers["X-Sync-Has-More"] = "true" if has_more else "false"
         
-        sensor_data_list = await cursor.to_list(length=limit)
-        
-        # Convert ObjectId to string
-        for data in sensor_data_list:
-            data["_id"] = str(data["_id"])
+        if format == "columnar":
+            # Straight from the documents: no per-row models or response validation
+            return JSONResponse(_columnar(sensor_data_list), headers=headers)
         
+        response.headers.update(headers)
         return [SensorData(**data) for data in sensor_data_list]
     
+    except StaleSyncTokenError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except SyncTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting sensor data history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/stats", response_model=SensorStats)
+def _parse_windows(windows: str) -> Dict[str, int]:
+    """Parse "1h,24h,7d" into hours per window (1 minute to 7 days)"""
+    parsed = {}
+    for window in filter(None, (part.strip() for part in windows.split(","))):
+        unit = WINDOW_UNITS.get(window[-1:])
+        try:
+            hours = float(window[:-1]) * unit if unit else None
+        except ValueError:
+            hours = None
+        if hours is None or not 0 < hours <= 168:
+            raise HTTPException(status_code=400, detail=f"Invalid window '{window}' (use e.g. 30m, 24h, 7d up to 7d)")
+        parsed[window] = hours
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No windows given")
+    return parsed
+
+
+@router.get("/stats", response_model=Union[SensorStats, Dict[str, Optional[SensorStats]]])
 async def get_sensor_statistics(
     hours: int = Query(24, ge=1, le=168, description="Time period for statistics"),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    windows: Optional[str] = Query(None, description="Several windows in one scan, e.g. 1h,24h,7d"),
+    storage: Storage = Depends(get_storage)
 ):
     """Get statistical summary of sensor data"""
     try:
-        time_threshold = datetime.utcnow() - timedelta(hours=hours)
-        
-        # Aggregation pipeline
-        pipeline = [
-            {"$match": {"timestamp": {"$gte": time_threshold}}},
-            {
-                "$group": {
-                    "_id": None,
-                    "avg_soil_moisture": {"$avg": "$soil_moisture"},
-                    "avg_temperature": {"$avg": "$temperature"},
-                    "avg_humidity": {"$avg": "$humidity"},
-                    "avg_light_intensity": {"$avg": "$light_intensity"},
-                    "min_soil_moisture": {"$min": "$soil_moisture"},
-                    "max_soil_moisture": {"$max": "$soil_moisture"},
-                    "min_temperature": {"$min": "$temperature"},
-                    "max_temperature": {"$max": "$temperature"},
-                    "min_humidity": {"$min": "$humidity"},
-                    "max_humidity": {"$max": "$humidity"},
-                    "min_light_intensity": {"$min": "$light_intensity"},
-                    "max_light_intensity": {"$max": "$light_intensity"},
-                    "total_readings": {"$sum": 1}
-                }
-            }
-        ]
-        
-        cursor = db.sensor_data.aggregate(pipeline)
-        result = await cursor.to_list(length=1)
+        now = datetime.utcnow()
+        if windows:
+            since = {name: now - timedelta(hours=span) for name, span in _parse_windows(windows).items()}
+        else:
+            since = {"window": now - timedelta(hours=hours)}
         
-        if not result:
-            raise HTTPException(status_code=404, detail="No data available for statistics")
+        # One scan of the widest window for every requested window
+        window_stats = await storage.sensor_data.stats_windows(since)
         
-        stats = result[0]
-        stats.pop("_id", None)
+        # p5/p50/p95 merged from hourly sketches rather than sorting raw readings
+        window_percentiles = await sketch_service.percentiles_windows(since)
         
         # Get latest reading
-        latest = await db.sensor_data.find_one(sort=[("timestamp", -1)])
+        latest = await storage.sensor_data.latest()
         if latest:
             latest.pop("_id", None)
-            stats["latest_reading"] = latest
         
-        return SensorStats(**stats)
+        results = {}
+        for name, stats in window_stats.items():
+            if stats is None:
+                results[name] = None
+                continue
+            stats["percentiles"] = window_percentiles[name]
+            if latest:
+                stats["latest_reading"] = latest
+            results[name] = SensorStats(**stats)
+        
+        if windows:
+            return results
+        if results["window"] is None:
+            raise HTTPException(status_code=404, detail="No data available for statistics")
+        return results["window"]
     
     except HTTPException:
         raise
@@ -118,19 +174,45 @@ async def get_sensor_statistics(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/forecast", response_model=SensorForecast)
+async def get_forecast(
+    device_id: str = Query("ESP32_001", description="Device to forecast"),
+    metric: str = Query("soil_moisture", pattern="^(soil_moisture|temperature|humidity|light_intensity)$"),
+    threshold: Optional[float] = Query(None, description="Override the configured min/max threshold"),
+    storage: Storage = Depends(get_storage)
+):
+    """Project when a metric will cross its threshold from the recent trend"""
+    try:
+        if forecast_service.needs_warm_up(device_id):
+            await forecast_service.warm_up(device_id)
+        
+        if threshold is not None:
+            thresholds = {f"{metric}_min": threshold, f"{metric}_max": threshold}
+        else:
+            current_settings = await storage.settings.get()
+            thresholds = (current_settings or {}).get("thresholds") or ThresholdSettings().model_dump()
+        
+        return SensorForecast(**forecast_service.forecast(device_id, metric, thresholds))
+    
+    except Exception as e:
+        logger.error(f"Error forecasting {metric} for {device_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/health")
-async def health_check(db: AsyncIOMotorDatabase = Depends(get_database)):
+async def health_check(storage: Storage = Depends(get_storage)):
     """Health check endpoint"""
     try:
         # Check database connection
-        await db.command("ping")
+        await storage.ping()
         
         # Get latest data timestamp
-        latest = await db.sensor_data.find_one(sort=[("timestamp", -1)])
+        latest = await storage.sensor_data.latest()
         
         return {
             "status": "healthy",
             "database": "connected",
+            "storage_backend": storage.name,
             "latest_data": latest["timestamp"] if latest else None,
             "timestamp": datetime.utcnow()
         }
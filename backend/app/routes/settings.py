@@ -1,33 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.database import get_database
-from app.models import SystemSettings, EmailSettings, UpdateThresholds, ThresholdSettings
-from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from app.storage import Storage, VersionConflictError, get_storage
+from app.config import settings as app_settings
+from app.models import (
+    SystemSettings,
+    EmailSettings,
+    UpdateThresholds,
+    ThresholdSettings,
+    ThresholdSimulationRequest,
+    ThresholdSimulation,
+)
+from datetime import datetime, timedelta
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/settings", tags=["Settings"])
 
 
+def _etag(settings: dict) -> str:
+    """Strong ETag for a settings document, derived from its version"""
+    return f'"{settings.get("version", 0)}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Whether an If-None-Match / If-Match header lists `etag` (or is "*")"""
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _expected_version(if_match: Optional[str]) -> Optional[int]:
+    """Version an If-Match header requires, None when any version will do"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=412, detail="If-Match does not match the current settings")
+
+
 @router.get("/", response_model=SystemSettings)
-async def get_settings(db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Get current system settings"""
+async def get_settings(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    storage: Storage = Depends(get_storage)
+):
+    """Get current system settings (304 when If-None-Match has the current ETag)"""
     try:
-        settings = await db.settings.find_one({"setting_type": "system"})
+        settings = await storage.settings.get()
         
         if not settings:
             # Create default settings if none exist
             default_settings = SystemSettings(
                 setting_type="system",
                 thresholds=ThresholdSettings(),
-                email_settings=EmailSettings(email="", enabled=False)
+                email_settings=EmailSettings(enabled=False)
             )
             
             settings_dict = default_settings.model_dump(exclude={"id"})
-            result = await db.settings.insert_one(settings_dict)
-            settings = await db.settings.find_one({"_id": result.inserted_id})
+            settings = await storage.settings.insert(settings_dict)
+        
+        # Unchanged settings: no validation or serialization at all
+        etag = _etag(settings)
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
         
-        settings["_id"] = str(settings["_id"])
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
         return SystemSettings(**settings)
     
     except Exception as e:
@@ -38,27 +76,32 @@ async def get_settings(db: AsyncIOMotorDatabase = Depends(get_database)):
 @router.put("/email", response_model=SystemSettings)
 async def update_email_settings(
     email_settings: EmailSettings,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    storage: Storage = Depends(get_storage)
 ):
-    """Update email notification settings"""
+    """Update email notification settings (412 when If-Match is stale)"""
     try:
-        result = await db.settings.update_one(
-            {"setting_type": "system"},
+        settings = await storage.settings.update(
             {
-                "$set": {
-                    "email_settings": email_settings.model_dump(),
-                    "updated_at": datetime.utcnow()
-                }
+                "email_settings": email_settings.model_dump(),
+                "updated_at": datetime.utcnow()
             },
-            upsert=True
+            upsert=True,
+            expected_version=_expected_version(if_match)
         )
         
-        settings = await db.settings.find_one({"setting_type": "system"})
-        settings["_id"] = str(settings["_id"])
+        if not settings:
+            raise HTTPException(status_code=404, detail="Settings not found")
         
         logger.info(f"✅ Email settings updated: {email_settings.email}")
+        response.headers["ETag"] = _etag(settings)
         return SystemSettings(**settings)
     
+    except VersionConflictError as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating email settings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -67,39 +110,75 @@ async def update_email_settings(
 @router.put("/thresholds", response_model=SystemSettings)
 async def update_thresholds(
     thresholds: UpdateThresholds,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    storage: Storage = Depends(get_storage)
 ):
-    """Update sensor thresholds"""
+    """Update sensor thresholds (412 when If-Match is stale)"""
     try:
-        current_settings = await db.settings.find_one({"setting_type": "system"})
-        
-        if not current_settings:
-            raise HTTPException(status_code=404, detail="Settings not found")
-        
-        current_thresholds = current_settings.get("thresholds", {})
-        update_data = thresholds.model_dump(exclude_none=True)
-        
-        for key, value in update_data.items():
-            current_thresholds[key] = value
+        # Only the given thresholds change, in one atomic write, so
+        # concurrent edits of different thresholds don't overwrite each other
+        update_data = {
+            f"thresholds.{key}": value
+            for key, value in thresholds.model_dump(exclude_none=True).items()
+        }
+        update_data["updated_at"] = datetime.utcnow()
         
-        await db.settings.update_one(
-            {"setting_type": "system"},
-            {
-                "$set": {
-                    "thresholds": current_thresholds,
-                    "updated_at": datetime.utcnow()
-                }
-            }
+        settings = await storage.settings.update(
+            update_data,
+            expected_version=_expected_version(if_match)
         )
         
-        settings = await db.settings.find_one({"setting_type": "system"})
-        settings["_id"] = str(settings["_id"])
+        if not settings:
+            raise HTTPException(status_code=404, detail="Settings not found")
         
         logger.info("✅ Thresholds updated successfully")
+        response.headers["ETag"] = _etag(settings)
         return SystemSettings(**settings)
     
+    except VersionConflictError as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error updating thresholds: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/thresholds/simulate", response_model=ThresholdSimulation)
+async def simulate_thresholds(
+    request: ThresholdSimulationRequest,
+    storage: Storage = Depends(get_storage)
+):
+    """Count the alerts and time in violation candidate thresholds would have produced"""
+    try:
+        until = request.until or datetime.utcnow()
+        if request.since >= until:
+            raise HTTPException(status_code=400, detail="since must be before until")
+        if until - request.since > timedelta(days=app_settings.SIMULATION_MAX_DAYS):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Simulated range is limited to {app_settings.SIMULATION_MAX_DAYS} days"
+            )
+        
+        # Candidate values on top of the current thresholds
+        current_settings = await storage.settings.get()
+        thresholds = ThresholdSettings().model_dump()
+        if current_settings:
+            thresholds.update(current_settings.get("thresholds", {}))
+        thresholds.update(request.thresholds.model_dump(exclude_none=True))
+        
+        # NumPy is only needed here, so it stays off the startup path
+        from app.services.threshold_simulator import threshold_simulator
+        result = await threshold_simulator.simulate(thresholds, request.since, until, request.device_id)
+        
+        logger.info(
+            f"🧪 Simulated thresholds over {result['total_readings']} readings in {result['elapsed_ms']} ms"
+        )
+        return ThresholdSimulation(**result)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error simulating thresholds: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,138 +1,223 @@
+import asyncio
 import logging
-from datetime import datetime
-from app.database import Database
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import settings
+from app.storage import get_storage
 from app.models import Alert, AlertType, AlertSeverity, SensorReading
-from app.services.email_service import EmailService
+from app.services.anomaly_service import anomaly_detector
+from app.services.notification_service import notification_dispatcher
+from app.utils.timing import stage_timings
 
 logger = logging.getLogger(__name__)
 
+# Alerts raised by evaluate_thresholds, which clear once the value is back in range
+THRESHOLD_ALERT_TYPES = frozenset({
+    AlertType.SOIL_MOISTURE_LOW,
+    AlertType.SOIL_MOISTURE_HIGH,
+    AlertType.TEMPERATURE_LOW,
+    AlertType.TEMPERATURE_HIGH,
+    AlertType.HUMIDITY_LOW,
+    AlertType.HUMIDITY_HIGH,
+    AlertType.LIGHT_INTENSITY_LOW,
+    AlertType.LIGHT_INTENSITY_HIGH,
+})
+
 
 class AlertService:
     """Service for managing alerts and threshold checking"""
     
     def __init__(self):
-        self.email_service = EmailService()
+        # device_id -> (threshold alert types that may be open, when that was last refreshed)
+        self._open_alerts: Dict[str, Tuple[Set[AlertType], float]] = {}
     
-    async def check_and_create_alerts(self, sensor_reading: SensorReading):
-        """Check sensor readings against thresholds and create alerts"""
+    async def check_and_create_alerts(
+        self,
+        sensor_reading: SensorReading,
+        send_emails: bool = True,
+        settings_doc: Optional[dict] = None
+    ) -> List[Alert]:
+        """Check sensor readings against thresholds and create alerts; returns the alerts created
+        
+        Offline replays pass `send_emails=False` and a pre-loaded `settings_doc`.
+        """
+        created: List[Alert] = []
         try:
-            db = Database.get_db()
-            
-            # Get current settings
-            settings_doc = await db.settings.find_one({"setting_type": "system"})
-            if not settings_doc:
-                logger.warning("⚠️ No system settings found, skipping threshold check")
-                return
-            
-            thresholds = settings_doc.get("thresholds", {})
-            email_settings = settings_doc.get("email_settings", {})
+            storage = get_storage()
             
-            alerts_to_create = []
+            # Streaming anomaly detection runs on every reading (no I/O)
+            anomalies = []
+            if settings.ANOMALY_DETECTION_ENABLED:
+                with stage_timings.span("alerts.anomaly_detection"):
+                    anomalies = anomaly_detector.update(sensor_reading)
             
-            # Check soil moisture
-            if sensor_reading.soil_moisture < thresholds.get("soil_moisture_min", 30):
-                alerts_to_create.append({
-                    "alert_type": AlertType.SOIL_MOISTURE_LOW,
-                    "severity": AlertSeverity.WARNING,
-                    "message": f"Soil moisture ({sensor_reading.soil_moisture}%) is below minimum threshold",
-                    "sensor_value": sensor_reading.soil_moisture,
-                    "threshold_value": thresholds.get("soil_moisture_min", 30)
-                })
-            elif sensor_reading.soil_moisture > thresholds.get("soil_moisture_max", 70):
-                alerts_to_create.append({
-                    "alert_type": AlertType.SOIL_MOISTURE_HIGH,
-                    "severity": AlertSeverity.WARNING,
-                    "message": f"Soil moisture ({sensor_reading.soil_moisture}%) is above maximum threshold",
-                    "sensor_value": sensor_reading.soil_moisture,
-                    "threshold_value": thresholds.get("soil_moisture_max", 70)
-                })
-            
-            # Check temperature
-            if sensor_reading.temperature < thresholds.get("temperature_min", 15):
-                alerts_to_create.append({
-                    "alert_type": AlertType.TEMPERATURE_LOW,
-                    "severity": AlertSeverity.WARNING,
-                    "message": f"Temperature ({sensor_reading.temperature}°C) is below minimum threshold",
-                    "sensor_value": sensor_reading.temperature,
-                    "threshold_value": thresholds.get("temperature_min", 15)
-                })
-            elif sensor_reading.temperature > thresholds.get("temperature_max", 35):
-                alerts_to_create.append({
-                    "alert_type": AlertType.TEMPERATURE_HIGH,
-                    "severity": AlertSeverity.CRITICAL if sensor_reading.temperature > 40 else AlertSeverity.WARNING,
-                    "message": f"Temperature ({sensor_reading.temperature}°C) is above maximum threshold",
-                    "sensor_value": sensor_reading.temperature,
-                    "threshold_value": thresholds.get("temperature_max", 35)
-                })
+            # Get current settings
+            if settings_doc is None:
+                with stage_timings.span("alerts.settings_lookup"):
+                    settings_doc = await storage.settings.get()
             
-            # Check humidity
-            if sensor_reading.humidity < thresholds.get("humidity_min", 40):
-                alerts_to_create.append({
-                    "alert_type": AlertType.HUMIDITY_LOW,
-                    "severity": AlertSeverity.INFO,
-                    "message": f"Humidity ({sensor_reading.humidity}%) is below minimum threshold",
-                    "sensor_value": sensor_reading.humidity,
-                    "threshold_value": thresholds.get("humidity_min", 40)
-                })
-            elif sensor_reading.humidity > thresholds.get("humidity_max", 80):
-                alerts_to_create.append({
-                    "alert_type": AlertType.HUMIDITY_HIGH,
-                    "severity": AlertSeverity.WARNING,
-                    "message": f"Humidity ({sensor_reading.humidity}%) is above maximum threshold",
-                    "sensor_value": sensor_reading.humidity,
-                    "threshold_value": thresholds.get("humidity_max", 80)
-                })
+            if settings_doc:
+                alerts_to_create = self.evaluate_thresholds(
+                    sensor_reading, settings_doc.get("thresholds", {})
+                )
+                email_settings = settings_doc.get("email_settings", {})
+                
+                if settings.ALERT_AUTO_RESOLVE:
+                    with stage_timings.span("alerts.auto_resolve"):
+                        await self._resolve_recovered(sensor_reading, alerts_to_create)
+            else:
+                logger.warning("⚠️ No system settings found, skipping threshold check")
+                alerts_to_create, email_settings = [], {}
             
-            # Check light intensity
-            if sensor_reading.light_intensity < thresholds.get("light_intensity_min", 5000):
-                alerts_to_create.append({
-                    "alert_type": AlertType.LIGHT_INTENSITY_LOW,
-                    "severity": AlertSeverity.INFO,
-                    "message": f"Light intensity ({sensor_reading.light_intensity} Lux) is below minimum threshold",
-                    "sensor_value": sensor_reading.light_intensity,
-                    "threshold_value": thresholds.get("light_intensity_min", 5000)
-                })
-            elif sensor_reading.light_intensity > thresholds.get("light_intensity_max", 50000):
-                alerts_to_create.append({
-                    "alert_type": AlertType.LIGHT_INTENSITY_HIGH,
-                    "severity": AlertSeverity.WARNING,
-                    "message": f"Light intensity ({sensor_reading.light_intensity} Lux) is above maximum threshold",
-                    "sensor_value": sensor_reading.light_intensity,
-                    "threshold_value": thresholds.get("light_intensity_max", 50000)
-                })
+            alerts_to_create.extend(anomalies)
             
-            # Create alerts and send emails
+            # Create alerts and send emails; alerts carry the reading's own
+            # timestamp so late or replayed readings land in the right window
             for alert_data in alerts_to_create:
-                alert = Alert(**alert_data, timestamp=datetime.utcnow())
-                
-                # Save alert to database
-                alert_dict = alert.model_dump(exclude={"id"})
-                result = await db.alerts.insert_one(alert_dict)
-                logger.info(f"🚨 Alert created: {alert.alert_type.value}")
-                
-                # Send email if enabled
-                if email_settings.get("enabled", False) and email_settings.get("email"):
-                    email_sent = await self.email_service.send_alert_email(
-                        alert, 
-                        email_settings["email"]
-                    )
-                    
-                    # Update alert with email status
-                    await db.alerts.update_one(
-                        {"_id": result.inserted_id},
-                        {"$set": {"email_sent": email_sent}}
-                    )
+                alert = Alert(
+                    **alert_data,
+                    device_id=sensor_reading.device_id,
+                    timestamp=sensor_reading.timestamp
+                )
+                await self.create_alert(alert, email_settings if send_emails else {})
+                created.append(alert)
         
         except Exception as e:
             logger.error(f"❌ Error in alert service: {e}")
+        return created
+    
+    async def create_alert(self, alert: Alert, email_settings: dict) -> str:
+        """Save an alert, queueing its email when `email_settings` has notifications enabled"""
+        storage = get_storage()
+        
+        # The email goes into the outbox in the same write as the alert, and is
+        # sent (with retries) by the notification dispatcher
+        notification = None
+        if email_settings.get("enabled", False) and email_settings.get("email"):
+            notification = {"channel": "email", "recipient": email_settings["email"]}
+        
+        alert_dict = alert.model_dump(exclude={"id"})
+        with stage_timings.span("alerts.insert"):
+            alert_id = await storage.alerts.insert(alert_dict, notification)
+        logger.info(f"🚨 Alert created: {alert.alert_type.value}")
+        
+        if notification is not None:
+            notification_dispatcher.wake()
+        return alert_id
+    
+    async def _resolve_recovered(self, sensor_reading: SensorReading, alerts_to_create: List[dict]):
+        """Resolve a device's open threshold alerts whose value is back in range
+        
+        Tracks which alert types may be open per device, so a reading only costs a
+        write when something actually recovers. The set is refreshed every
+        ALERT_OPEN_CACHE_TTL_SECONDS by assuming every type may be open, which also
+        picks up alerts raised by other workers or before a restart.
+        """
+        device_id = sensor_reading.device_id
+        active = {alert_data["alert_type"] for alert_data in alerts_to_create}
+        
+        open_types, refreshed_at = self._open_alerts.get(device_id, (None, 0.0))
+        now = time.monotonic()
+        if open_types is None or now - refreshed_at > settings.ALERT_OPEN_CACHE_TTL_SECONDS:
+            open_types, refreshed_at = set(THRESHOLD_ALERT_TYPES), now
+        
+        recovered = open_types - active
+        if recovered:
+            # One batched write for every recovered type; a late reading never
+            # resolves alerts raised after it was taken
+            resolved = await get_storage().alerts.resolve_many(
+                alert_types=sorted(recovered),
+                device_id=device_id,
+                until=sensor_reading.timestamp
+            )
+            if resolved:
+                logger.info(f"✅ Auto-resolved {resolved} alerts for {device_id} ({', '.join(sorted(recovered))})")
+        
+        self._open_alerts[device_id] = (active & THRESHOLD_ALERT_TYPES, refreshed_at)
+    
+    @staticmethod
+    def evaluate_thresholds(sensor_reading: SensorReading, thresholds: dict) -> List[dict]:
+        """Alert data for every threshold the reading violates"""
+        alerts_to_create = []
+        
+        # Check soil moisture
+        if sensor_reading.soil_moisture < thresholds.get("soil_moisture_min", 30):
+            alerts_to_create.append({
+                "alert_type": AlertType.SOIL_MOISTURE_LOW,
+                "severity": AlertSeverity.WARNING,
+                "message": f"Soil moisture ({sensor_reading.soil_moisture}%) is below minimum threshold",
+                "sensor_value": sensor_reading.soil_moisture,
+                "threshold_value": thresholds.get("soil_moisture_min", 30)
+            })
+        elif sensor_reading.soil_moisture > thresholds.get("soil_moisture_max", 70):
+            alerts_to_create.append({
+                "alert_type": AlertType.SOIL_MOISTURE_HIGH,
+                "severity": AlertSeverity.WARNING,
+                "message": f"Soil moisture ({sensor_reading.soil_moisture}%) is above maximum threshold",
+                "sensor_value": sensor_reading.soil_moisture,
+                "threshold_value": thresholds.get("soil_moisture_max", 70)
+            })
+        
+        # Check temperature
+        if sensor_reading.temperature < thresholds.get("temperature_min", 15):
+            alerts_to_create.append({
+                "alert_type": AlertType.TEMPERATURE_LOW,
+                "severity": AlertSeverity.WARNING,
+                "message": f"Temperature ({sensor_reading.temperature}°C) is below minimum threshold",
+                "sensor_value": sensor_reading.temperature,
+                "threshold_value": thresholds.get("temperature_min", 15)
+            })
+        elif sensor_reading.temperature > thresholds.get("temperature_max", 35):
+            alerts_to_create.append({
+                "alert_type": AlertType.TEMPERATURE_HIGH,
+                "severity": AlertSeverity.CRITICAL if sensor_reading.temperature > 40 else AlertSeverity.WARNING,
+                "message": f"Temperature ({sensor_reading.temperature}°C) is above maximum threshold",
+                "sensor_value": sensor_reading.temperature,
+                "threshold_value": thresholds.get("temperature_max", 35)
+            })
+        
+        # Check humidity
+        if sensor_reading.humidity < thresholds.get("humidity_min", 40):
+            alerts_to_create.append({
+                "alert_type": AlertType.HUMIDITY_LOW,
+                "severity": AlertSeverity.INFO,
+                "message": f"Humidity ({sensor_reading.humidity}%) is below minimum threshold",
+                "sensor_value": sensor_reading.humidity,
+                "threshold_value": thresholds.get("humidity_min", 40)
+            })
+        elif sensor_reading.humidity > thresholds.get("humidity_max", 80):
+            alerts_to_create.append({
+                "alert_type": AlertType.HUMIDITY_HIGH,
+                "severity": AlertSeverity.WARNING,
+                "message": f"Humidity ({sensor_reading.humidity}%) is above maximum threshold",
+                "sensor_value": sensor_reading.humidity,
+                "threshold_value": thresholds.get("humidity_max", 80)
+            })
+        
+        # Check light intensity
+        if sensor_reading.light_intensity < thresholds.get("light_intensity_min", 5000):
+            alerts_to_create.append({
+                "alert_type": AlertType.LIGHT_INTENSITY_LOW,
+                "severity": AlertSeverity.INFO,
+                "message": f"Light intensity ({sensor_reading.light_intensity} Lux) is below minimum threshold",
+                "sensor_value": sensor_reading.light_intensity,
+                "threshold_value": thresholds.get("light_intensity_min", 5000)
+            })
+        elif sensor_reading.light_intensity > thresholds.get("light_intensity_max", 50000):
+            alerts_to_create.append({
+                "alert_type": AlertType.LIGHT_INTENSITY_HIGH,
+                "severity": AlertSeverity.WARNING,
+                "message": f"Light intensity ({sensor_reading.light_intensity} Lux) is above maximum threshold",
+                "sensor_value": sensor_reading.light_intensity,
+                "threshold_value": thresholds.get("light_intensity_max", 50000)
+            })
+        
+        return alerts_to_create
     
     async def get_recent_alerts(self, limit: int = 10):
         """Get recent alerts"""
         try:
-            db = Database.get_db()
-            cursor = db.alerts.find().sort("timestamp", -1).limit(limit)
-            alerts = await cursor.to_list(length=limit)
-            return alerts
+            return await get_storage().alerts.find(limit=limit)
         except Exception as e:
             logger.error(f"❌ Error getting recent alerts: {e}")
             return []
@@ -140,24 +225,61 @@ class AlertService:
     async def resolve_alert(self, alert_id: str):
         """Mark alert as resolved"""
         try:
-            db = Database.get_db()
-            from bson import ObjectId
-            
-            result = await db.alerts.update_one(
-                {"_id": ObjectId(alert_id)},
-                {
-                    "$set": {
-                        "is_resolved": True,
-                        "resolved_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            if result.modified_count > 0:
+            if await get_storage().alerts.resolve(alert_id):
                 logger.info(f"✅ Alert {alert_id} resolved")
                 return True
             return False
-            
+        
         except Exception as e:
             logger.error(f"❌ Error resolving alert: {e}")
             return False
+
+
+class AlertCounterRepair:
+    """Periodically recomputes the hourly alert counters from the alerts themselves
+    
+    Counter updates on MongoDB are separate writes from the alert changes they
+    track, so a crash between the two can leave them slightly off. The first
+    pass runs at startup, which also builds counters for alerts stored before
+    the counters existed.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+    
+    async def run(self) -> Optional[int]:
+        """Rebuild the counters now; returns the number of hourly buckets (None if another worker is on it)"""
+        started = time.perf_counter()
+        buckets = await get_storage().alerts.rebuild_counters()
+        if buckets is None:
+            logger.info("🧮 Alert counters are being rebuilt by another worker, skipped")
+        else:
+            logger.info(f"🧮 Alert counters rebuilt: {buckets} buckets in {time.perf_counter() - started:.2f}s")
+        return buckets
+    
+    def start(self):
+        """Start periodic repair on the running event loop"""
+        if self._task is None and settings.ALERT_COUNTER_REPAIR_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic repair"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not rebuild alert counters: {e}")
+            await asyncio.sleep(settings.ALERT_COUNTER_REPAIR_INTERVAL_SECONDS)
+
+
+# Global alert counter repair job
+alert_counter_repair = AlertCounterRepair()
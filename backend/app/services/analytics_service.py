@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from app.config import settings
+from app.models.analytics import AnalyticsJobRequest
+from app.storage import SENSOR_FIELDS, get_storage
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsService:
+    """Season-level reports computed as background jobs in a process pool
+    
+    Column batches are read from `sensor_data` on the event loop and handed
+    to worker processes, which return small mergeable partials. Results are
+    cached by range, device and options together with the storage sync
+    cursor taken before the scan, and reused until a reading in the range
+    is stored after that cursor.
+    """
+    
+    def __init__(self, workers: int, batch_size: int, cache_size: int, retention_seconds: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.retention_seconds = retention_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # key -> (sync cursor before the scan, result)
+        self._cache: "OrderedDict[Tuple, Tuple[Any, dict]]" = OrderedDict()
+    
+    @staticmethod
+    def _key(request: AnalyticsJobRequest) -> Tuple:
+        return (
+            tuple(sorted(set(request.reports))),
+            request.since,
+            request.until,
+            request.device_id,
+            request.gdd_base_celsius if "growing_degree_days" in request.reports else None,
+        )
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: the server process has MQTT and storage threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+    
+    async def submit(self, request: AnalyticsJobRequest) -> dict:
+        """Start a job, or answer from the cache or an identical job still running"""
+        self._prune()
+        key = self._key(request)
+        for job in self._jobs.values():
+            if job["key"] == key and job["status"] in ("queued", "running"):
+                return job
+        
+        job = {
+            "id": uuid.uuid4().hex,
+            "key": key,
+            "status": "queued",
+            **request.model_dump(),
+            "cached": False,
+            "submitted_at": datetime.utcnow(),
+            "batches": 0,
+            "total_readings": 0,
+        }
+        self._jobs[job["id"]] = job
+        
+        cached = await self._cached_result(key, request)
+        if cached is not None:
+            job.update(
+                status="done",
+                cached=True,
+                finished_at=datetime.utcnow(),
+                total_readings=cached["total_readings"],
+                result=cached
+            )
+            return job
+        
+        self._tasks[job["id"]] = asyncio.create_task(self._run(job, request))
+        return job
+    
+    async def _cached_result(self, key: Tuple, request: AnalyticsJobRequest) -> Optional[dict]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        cursor, result = entry
+        # Any reading in the range stored since the scan makes the result stale
+        changes, _, _ = await get_storage().sensor_data.changes_since(
+            cursor, request.since, 1, request.device_id, request.until
+        )
+        if changes:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+    
+    async def _run(self, job: dict, request: AnalyticsJobRequest):
+        # NumPy is only needed once a job runs, so it stays off the startup path
+        from app.utils.season_stats import batch_partial, finalize, merge_partial
+        
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        job.update(status="running", started_at=datetime.utcnow())
+        try:
+            repository = get_storage().sensor_data
+            cursor = await repository.sync_cursor()
+            until = request.until or datetime.utcnow()
+            flags = (
+                "correlation" in request.reports,
+                "daily" in request.reports,
+                "growing_degree_days" in request.reports,
+            )
+            pool = self._get_pool()
+            
+            # A bounded window of batches in flight, merged as they complete
+            total = None
+            pending = deque()
+            async for columns in repository.scan_columns(request.since, until, request.device_id, self.batch_size):
+                pending.append(loop.run_in_executor(pool, batch_partial, columns, SENSOR_FIELDS, *flags))
+                job["batches"] += 1
+                if len(pending) >= self.workers * 2:
+                    total = merge_partial(total, await pending.popleft())
+            while pending:
+                total = merge_partial(total, await pending.popleft())
+            
+            result = finalize(total, SENSOR_FIELDS, request.reports, request.gdd_base_celsius)
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self._cache[job["key"]] = (cursor, result)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            
+            job.update(
+                status="done",
+                finished_at=datetime.utcnow(),
+                total_readings=result["total_readings"],
+                result=result
+            )
+            logger.info(
+                f"📊 Analytics job {job['id']} done: {result['total_readings']} readings in {result['elapsed_ms']:.0f}ms"
+            )
+        except asyncio.CancelledError:
+            job.update(status="failed", finished_at=datetime.utcnow(), error="Cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Analytics job {job['id']} failed: {e}")
+            job.update(status="failed", finished_at=datetime.utcnow(), error=str(e))
+        finally:
+            self._tasks.pop(job["id"], None)
+    
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+    
+    def _prune(self):
+        """Forget finished jobs older than the retention period"""
+        now = datetime.utcnow()
+        for job_id, job in list(self._jobs.items()):
+            finished_at = job.get("finished_at")
+            if finished_at and (now - finished_at).total_seconds() > self.retention_seconds:
+                del self._jobs[job_id]
+    
+    async def stop(self):
+        """Cancel running jobs and shut the worker processes down"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Global analytics service instance
+analytics_service = AnalyticsService(
+    workers=settings.ANALYTICS_WORKERS,
+    batch_size=settings.ANALYTICS_BATCH_SIZE,
+    cache_size=settings.ANALYTICS_CACHE_SIZE,
+    retention_seconds=settings.ANALYTICS_JOB_RETENTION_SECONDS
+)
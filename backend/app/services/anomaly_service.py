@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import math
+import threading
+from array import array
+from typing import Dict, List, Optional
+from app.config import settings
+from app.models import AlertSeverity, AlertType, SensorReading
+from app.storage import SENSOR_FIELDS, get_storage
+from app.storage.base import epoch_seconds
+from app.utils.worker_slot import worker_name
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "anomaly_detector"
+# Bumped when the snapshot layout changes; older checkpoints are ignored
+STATE_VERSION = 2
+
+# Smallest standard deviation considered meaningful, per metric, so a very
+# steady sensor doesn't turn tiny fluctuations into huge z-scores
+MIN_STD = {
+    "soil_moisture": 0.5,
+    "temperature": 0.2,
+    "humidity": 0.5,
+    "light_intensity": 50.0,
+}
+
+# Light legitimately sits at a constant 0 Lux all night
+STUCK_METRICS = ("soil_moisture", "temperature", "humidity")
+
+UNITS = {
+    "soil_moisture": "%",
+    "temperature": "°C",
+    "humidity": "%",
+    "light_intensity": " Lux",
+}
+
+
+class AnomalyDetector:
+    """Streaming per-(device, metric) anomaly detector with O(1) work per reading
+    
+    Keeps an exponentially weighted mean and variance for every device and
+    metric and flags readings more than `z_threshold` standard deviations
+    away (sudden spikes inside the fixed limits). It also flags sensors that
+    usually fluctuate but have repeated exactly the same value for
+    `stuck_minutes` (and at least `stuck_readings` readings); metrics that were
+    already steady before the run are left alone. State lives in flat `array`
+    columns (one row per device, one column per metric), so memory is a few
+    dozen bytes per device and detection needs no DB reads.
+    """
+    
+    METRICS = SENSOR_FIELDS
+    
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        z_threshold: float = 4.0,
+        warmup_readings: int = 30,
+        stuck_minutes: float = 120.0,
+        stuck_readings: int = 30,
+        cooldown_readings: int = 20
+    ):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup_readings = warmup_readings
+        self.stuck_seconds = stuck_minutes * 60  # 0 disables stuck detection
+        self.stuck_readings = stuck_readings
+        self.cooldown_readings = cooldown_readings
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        self._slots: Dict[str, int] = {}
+        self._mean = array("d")
+        self._var = array("d")
+        self._last = array("d")
+        self._count = array("q")
+        self._stuck_run = array("q")
+        self._stuck_since = array("d")
+        self._stuck_std = array("d")
+        self._cooldown = array("q")
+    
+    @property
+    def device_count(self) -> int:
+        return len(self._slots)
+    
+    def _slot(self, device_id: str) -> int:
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = self._slots[device_id] = len(self._slots)
+            width = len(self.METRICS)
+            self._mean.extend([0.0] * width)
+            self._var.extend([0.0] * width)
+            self._last.extend([0.0] * width)
+            self._count.extend([0] * width)
+            self._stuck_run.extend([0] * width)
+            self._stuck_since.extend([0.0] * width)
+            self._stuck_std.extend([0.0] * width)
+            self._cooldown.extend([0] * width)
+        return slot
+    
+    def update(self, sensor_reading: SensorReading) -> List[dict]:
+        """Fold a reading into the state; returns alert data for any anomalies"""
+        anomalies = []
+        with self._lock:
+            base = self._slot(sensor_reading.device_id) * len(self.METRICS)
+            timestamp = epoch_seconds(sensor_reading.timestamp)
+            
+            for offset, metric in enumerate(self.METRICS):
+                i = base + offset
+                value = getattr(sensor_reading, metric)
+                count = self._count[i]
+                
+                if self._cooldown[i] > 0:
+                    self._cooldown[i] -= 1
+                
+                if count == 0:
+                    self._mean[i] = value
+                    self._var[i] = 0.0
+                    self._last[i] = value
+                    self._count[i] = 1
+                    self._stuck_since[i] = timestamp
+                    self._stuck_std[i] = 0.0
+                    continue
+                
+                mean = self._mean[i]
+                std = max(math.sqrt(self._var[i]), MIN_STD[metric])
+                z_score = (value - mean) / std
+                
+                # Stuck sensor: a normally noisy metric frozen on one value for a long time
+                if metric in STUCK_METRICS and self.stuck_seconds > 0:
+                    if value != self._last[i]:
+                        # A new run; remember how much the metric was moving before it
+                        self._stuck_run[i] = 0
+                        self._stuck_since[i] = timestamp
+                        self._stuck_std[i] = math.sqrt(self._var[i])
+                    else:
+                        self._stuck_run[i] += 1
+                        frozen_for = timestamp - self._stuck_since[i]
+                        if (
+                            frozen_for >= self.stuck_seconds
+                            and self._stuck_run[i] >= self.stuck_readings
+                            and self._stuck_std[i] >= MIN_STD[metric]
+                        ):
+                            anomalies.append(self._stuck_alert(metric, value, frozen_for, self._stuck_run[i] + 1))
+                            # Once per run
+                            self._stuck_since[i] = math.inf
+                
+                # Spike: far outside the recent distribution
+                if (
+                    count >= self.warmup_readings
+                    and abs(z_score) > self.z_threshold
+                    and self._cooldown[i] == 0
+                ):
+                    anomalies.append(self._spike_alert(metric, value, mean, z_score))
+                    self._cooldown[i] = self.cooldown_readings
+                
+                # Incremental EWMA mean/variance update
+                diff = value - mean
+                increment = self.alpha * diff
+                self._mean[i] = mean + increment
+                self._var[i] = (1 - self.alpha) * (self._var[i] + diff * increment)
+                self._last[i] = value
+                self._count[i] = count + 1
+        
+        return anomalies
+    
+    @staticmethod
+    def _spike_alert(metric: str, value: float, mean: float, z_score: float) -> dict:
+        name = metric.replace("_", " ").capitalize()
+        direction = "above" if z_score > 0 else "below"
+        return {
+            "alert_type": AlertType.SENSOR_ANOMALY,
+            "severity": AlertSeverity.WARNING,
+            "message": (
+                f"{name} ({value}{UNITS[metric]}) is unusually far {direction} its recent "
+                f"average of {mean:.2f}{UNITS[metric]} (z-score {z_score:+.1f})"
+            ),
+            "sensor_value": value,
+            "threshold_value": round(mean, 2),
+        }
+    
+    @staticmethod
+    def _stuck_alert(metric: str, value: float, seconds: float, readings: int) -> dict:
+        name = metric.replace("_", " ").capitalize()
+        return {
+            "alert_type": AlertType.SENSOR_STUCK,
+            "severity": AlertSeverity.WARNING,
+            "message": (
+                f"{name} sensor has reported exactly {value}{UNITS[metric]} for "
+                f"{seconds / 60:.0f} minutes ({readings} readings) and may be stuck"
+            ),
+            "sensor_value": value,
+            "threshold_value": value,
+        }
+    
+    def snapshot(self) -> dict:
+        """Compact, serializable copy of the detector state"""
+        with self._lock:
+            devices = sorted(self._slots, key=self._slots.get)
+            return {
+                "version": STATE_VERSION,
+                "metrics": list(self.METRICS),
+                "devices": devices,
+                "mean": self._mean.tobytes(),
+                "var": self._var.tobytes(),
+                "last": self._last.tobytes(),
+                "count": self._count.tobytes(),
+                "stuck_run": self._stuck_run.tobytes(),
+                "stuck_since": self._stuck_since.tobytes(),
+                "stuck_std": self._stuck_std.tobytes(),
+                "cooldown": self._cooldown.tobytes(),
+            }
+    
+    def restore(self, data: dict) -> bool:
+        """Load a snapshot; ignored if it was taken with a different layout"""
+        if data.get("version") != STATE_VERSION or data.get("metrics") != list(self.METRICS):
+            return False
+        with self._lock:
+            self._reset()
+            self._slots = {device_id: slot for slot, device_id in enumerate(data["devices"])}
+            self._mean.frombytes(data["mean"])
+            self._var.frombytes(data["var"])
+            self._last.frombytes(data["last"])
+            self._count.frombytes(data["count"])
+            self._stuck_run.frombytes(data["stuck_run"])
+            self._stuck_since.frombytes(data["stuck_since"])
+            self._stuck_std.frombytes(data["stuck_std"])
+            self._cooldown.frombytes(data["cooldown"])
+        return True
+
+
+class AnomalyCheckpointer:
+    """Periodically saves detector state so a restart resumes warm"""
+    
+    def __init__(self, detector: AnomalyDetector):
+        self.detector = detector
+        self._task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def checkpoint_name() -> str:
+        """One checkpoint per worker slot: each worker only sees its share of the readings"""
+        worker = worker_name()
+        return f"{CHECKPOINT_NAME}-{worker}" if worker is not None else CHECKPOINT_NAME
+    
+    async def load(self):
+        """Restore this worker's last checkpoint, if any"""
+        try:
+            data = await get_storage().checkpoints.load(self.checkpoint_name())
+            if data and self.detector.restore(data):
+                logger.info(f"✅ Anomaly detector restored ({self.detector.device_count} devices)")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not restore anomaly detector state: {e}")
+    
+    async def save(self):
+        """Write a checkpoint now"""
+        await get_storage().checkpoints.save(self.checkpoint_name(), self.detector.snapshot())
+    
+    def start(self):
+        """Start periodic checkpointing on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop checkpointing and write a final checkpoint"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.save()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not checkpoint anomaly detector: {e}")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.ANOMALY_CHECKPOINT_INTERVAL_SECONDS)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not checkpoint anomaly detector: {e}")
+
+
+# Global anomaly detector instances
+anomaly_detector = AnomalyDetector(
+    alpha=settings.ANOMALY_EWMA_ALPHA,
+    z_threshold=settings.ANOMALY_Z_THRESHOLD,
+    warmup_readings=settings.ANOMALY_WARMUP_READINGS,
+    stuck_minutes=settings.ANOMALY_STUCK_MINUTES,
+    stuck_readings=settings.ANOMALY_STUCK_READINGS,
+    cooldown_readings=settings.ANOMALY_COOLDOWN_READINGS
+)
+anomaly_checkpointer = AnomalyCheckpointer(anomaly_detector)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+from app.config import settings
+from app.storage import get_storage
+from app.storage.archive import DAY, ArchivedSensorDataRepository, day_start
+from app.storage.base import EPOCH, SCAN_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class SensorArchiver:
+    """Moves closed days of sensor readings from the database to the Parquet archive
+    
+    Readings older than midnight `keep_days` ago are scanned in time order,
+    written a day at a time and only then deleted from the database. Only
+    readings received before the run started are deleted, so any arriving
+    meanwhile are archived by the next run.
+    """
+    
+    def __init__(self, keep_days: int, batch_size: int):
+        self.keep_days = keep_days
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    async def run(self) -> dict:
+        """Archive every closed day past the retention window now"""
+        # NumPy is only needed once archiving runs, so it stays off the startup path
+        import numpy as np
+        
+        repository = get_storage().sensor_data
+        if not isinstance(repository, ArchivedSensorDataRepository):
+            raise RuntimeError("The sensor data archive is not enabled (ARCHIVE_ENABLED)")
+        
+        async with self._lock:
+            started = time.perf_counter()
+            received_before = datetime.utcnow()
+            cutoff = day_start(received_before.date()) - timedelta(days=self.keep_days)
+            result = {"cutoff": cutoff, "days": 0, "archived": 0, "deleted": 0}
+            
+            current_day: Optional[date] = None
+            batches: List[Dict[str, Sequence]] = []
+            async for columns in repository.inner.scan_columns(EPOCH, cutoff, batch_size=self.batch_size):
+                # Split each batch where the day changes
+                days = (np.asarray(columns["timestamp"], dtype=np.float64) // 86400).astype(np.int64)
+                edges = np.flatnonzero(np.diff(days)) + 1
+                for start, end in zip(np.r_[0, edges], np.r_[edges, len(days)]):
+                    day = EPOCH.date() + timedelta(days=int(days[start]))
+                    if current_day is not None and day != current_day:
+                        await self._archive_day(repository, current_day, batches, received_before, result)
+                        batches = []
+                    current_day = day
+                    batches.append({column: columns[column][start:end] for column in SCAN_COLUMNS})
+            if batches:
+                await self._archive_day(repository, current_day, batches, received_before, result)
+            
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if result["days"]:
+                logger.info(
+                    f"🗄️ Archived {result['archived']} readings from {result['days']} days "
+                    f"in {result['elapsed_ms']:.0f}ms"
+                )
+            return result
+    
+    async def _archive_day(
+        self,
+        repository: ArchivedSensorDataRepository,
+        day: date,
+        batches: List[Dict[str, Sequence]],
+        received_before: datetime,
+        result: dict
+    ):
+        import numpy as np
+        
+        columns = {column: np.concatenate([batch[column] for batch in batches]) for column in SCAN_COLUMNS}
+        archived = await asyncio.to_thread(repository.archive.write_day, day, columns)
+        # Deleted only once the day's files are in place
+        deleted = await repository.inner.delete_range(day_start(day), day_start(day) + DAY, received_before)
+        result["days"] += 1
+        result["archived"] += archived
+        result["deleted"] += deleted
+    
+    def start(self):
+        """Start periodic archiving on the running event loop"""
+        if self._task is None and settings.ARCHIVE_ENABLED:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic archiving"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not archive sensor data: {e}")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+
+# Global sensor data archiver
+sensor_archiver = SensorArchiver(keep_days=settings.ARCHIVE_AFTER_DAYS, batch_size=settings.ARCHIVE_BATCH_SIZE)
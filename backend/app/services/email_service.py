@@ -1,6 +1,3 @@
-import aiosmtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import logging
 from app.config import settings
 from app.models import Alert, AlertType
@@ -13,42 +10,41 @@ class EmailService:
     
     @staticmethod
     async def send_alert_email(alert: Alert, recipient_email: str):
-        """Send alert notification email"""
-        try:
-            # Create email message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = f"🚨 Smart Crop Alert: {alert.alert_type.value.replace('_', ' ').title()}"
-            message["From"] = f"{settings.SMTP_FROM_NAME} <{settings.SMTP_FROM_EMAIL}>"
-            message["To"] = recipient_email
-            
-            # Create HTML email body
-            html_body = EmailService._create_alert_html(alert)
-            
-            # Create plain text version
-            text_body = EmailService._create_alert_text(alert)
-            
-            # Attach both versions
-            part1 = MIMEText(text_body, "plain")
-            part2 = MIMEText(html_body, "html")
-            message.attach(part1)
-            message.attach(part2)
-            
-            # Send email
-            await aiosmtplib.send(
-                message,
-                hostname=settings.SMTP_HOST,
-                port=settings.SMTP_PORT,
-                username=settings.SMTP_USERNAME,
-                password=settings.SMTP_PASSWORD,
-                start_tls=True,
-            )
-            
-            logger.info(f"✅ Alert email sent to {recipient_email}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to send email: {e}")
-            return False
+        """Send alert notification email, raising if it could not be sent (the outbox retries it)"""
+        # Only needed when an email actually goes out, so kept off the import path
+        import aiosmtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        
+        # Create email message
+        message = MIMEMultipart("alternative")
+        message["Subject"] = f"🚨 Smart Crop Alert: {alert.alert_type.value.replace('_', ' ').title()}"
+        message["From"] = f"{settings.SMTP_FROM_NAME} <{settings.SMTP_FROM_EMAIL}>"
+        message["To"] = recipient_email
+        
+        # Create HTML email body
+        html_body = EmailService._create_alert_html(alert)
+        
+        # Create plain text version
+        text_body = EmailService._create_alert_text(alert)
+        
+        # Attach both versions
+        part1 = MIMEText(text_body, "plain")
+        part2 = MIMEText(html_body, "html")
+        message.attach(part1)
+        message.attach(part2)
+        
+        # Send email
+        await aiosmtplib.send(
+            message,
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            start_tls=True,
+        )
+        
+        logger.info(f"✅ Alert email sent to {recipient_email}")
     
     @staticmethod
     def _create_alert_text(alert: Alert) -> str:
@@ -156,5 +152,7 @@ Please take appropriate action to ensure optimal crop health.
             AlertType.HUMIDITY_HIGH: "Humidity is above optimal level. Improve air circulation to prevent fungal growth and diseases.",
             AlertType.LIGHT_INTENSITY_LOW: "Light intensity is insufficient. Move plants to brighter location or supplement with grow lights.",
             AlertType.LIGHT_INTENSITY_HIGH: "Light intensity is too high. Provide shade or move plants to prevent leaf burn and heat stress.",
+            AlertType.SENSOR_ANOMALY: "A reading changed far more than usual. Check the field for sudden events and inspect the sensor and its wiring.",
+            AlertType.SENSOR_STUCK: "The sensor keeps reporting the same value. Inspect the probe for damage, corrosion or a loose connection.",
         }
         return recommendations.get(alert_type, "Monitor the situation and take appropriate action based on crop requirements.")
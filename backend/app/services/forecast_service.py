@@ -0,0 +1,271 @@
+import logging
+import math
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Iterable, Optional, Tuple
+from app.config import settings
+from app.models import SensorReading
+from app.storage import SENSOR_FIELDS, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Two-sided 95% normal quantile for the slope confidence interval
+Z_95 = 1.96
+
+
+class SlidingRegression:
+    """Least-squares line over a sliding window, updated in O(1) per point
+    
+    Running sums of t, y, t², t·y and y² are adjusted as points enter and
+    leave the window, so the fit never revisits old readings. Times are
+    hours relative to `origin` to keep the sums numerically well behaved.
+    """
+    
+    def __init__(self, max_points: int, max_age: timedelta):
+        self.max_points = max_points
+        self.max_age = max_age
+        # Whether history has been merged in since this process started
+        self.seeded = False
+        self.points: Deque[Tuple[datetime, float, float]] = deque()
+        self.origin: Optional[datetime] = None
+        self.n = 0
+        self.st = self.sy = self.stt = self.sty = self.syy = 0.0
+    
+    def _hours(self, timestamp: datetime) -> float:
+        return (timestamp - self.origin).total_seconds() / 3600
+    
+    def _add_sums(self, t: float, y: float, sign: int):
+        self.n += sign
+        self.st += sign * t
+        self.sy += sign * y
+        self.stt += sign * t * t
+        self.sty += sign * t * y
+        self.syy += sign * y * y
+    
+    def _rebase(self, origin: datetime):
+        """Move the time origin (rare); recomputes the sums from the window"""
+        self.origin = origin
+        self.n = 0
+        self.st = self.sy = self.stt = self.sty = self.syy = 0.0
+        rebased = deque()
+        for timestamp, _, y in self.points:
+            t = self._hours(timestamp)
+            rebased.append((timestamp, t, y))
+            self._add_sums(t, y, 1)
+        self.points = rebased
+    
+    def add(self, timestamp: datetime, value: float) -> bool:
+        """Append a point; out-of-order points are ignored"""
+        if self.points and timestamp <= self.points[-1][0]:
+            return False
+        if self.origin is None:
+            self.origin = timestamp
+        
+        t = self._hours(timestamp)
+        self.points.append((timestamp, t, value))
+        self._add_sums(t, value, 1)
+        
+        while self.points and (
+            len(self.points) > self.max_points
+            or timestamp - self.points[0][0] > self.max_age
+        ):
+            _, old_t, old_y = self.points.popleft()
+            self._add_sums(old_t, old_y, -1)
+        
+        # Keep t small relative to the window so the sums don't lose precision
+        if t > 24 * 30:
+            self._rebase(self.points[0][0])
+        return True
+    
+    def is_full(self) -> bool:
+        """Whether the window already holds as much as history could give it"""
+        if len(self.points) >= self.max_points:
+            return True
+        return bool(self.points) and self.points[-1][0] - self.points[0][0] >= self.max_age
+    
+    def merge(self, history: Iterable[Tuple[datetime, float]]) -> int:
+        """Fold in (timestamp, value) points from any time; returns how many were new
+        
+        Unlike `add`, points older than the window's newest are kept, so history
+        can back-fill a window that live readings have already started.
+        """
+        values = {timestamp: y for timestamp, _, y in self.points}
+        added = 0
+        for timestamp, value in history:
+            if timestamp not in values:
+                values[timestamp] = value
+                added += 1
+        if not added:
+            return 0
+        
+        self.points = deque()
+        self.origin = None
+        self.n = 0
+        self.st = self.sy = self.stt = self.sty = self.syy = 0.0
+        for timestamp in sorted(values):
+            self.add(timestamp, values[timestamp])
+        return added
+    
+    def fit(self) -> Optional[dict]:
+        """Slope (per hour), intercept, R² and slope standard error"""
+        n = self.n
+        if n < 3:
+            return None
+        t_var = self.stt - self.st * self.st / n
+        if t_var <= 0:
+            return None
+        
+        slope = (self.sty - self.st * self.sy / n) / t_var
+        intercept = (self.sy - slope * self.st) / n
+        y_var = self.syy - self.sy * self.sy / n
+        sse = max(y_var - slope * (self.sty - self.st * self.sy / n), 0.0)
+        r_squared = 1 - sse / y_var if y_var > 0 else 1.0
+        slope_se = math.sqrt(sse / (n - 2) / t_var)
+        
+        return {
+            "slope": slope,
+            "intercept": intercept,
+            "r_squared": max(min(r_squared, 1.0), 0.0),
+            "slope_se": slope_se,
+        }
+    
+    def value_at(self, fit: dict, timestamp: datetime) -> float:
+        return fit["intercept"] + fit["slope"] * self._hours(timestamp)
+    
+    def time_at(self, value: float, slope: float, intercept: float) -> Optional[datetime]:
+        if abs(slope) < 1e-9:
+            return None
+        hours = (value - intercept) / slope
+        try:
+            return self.origin + timedelta(hours=hours)
+        except OverflowError:
+            return None
+
+
+class ForecastService:
+    """Per-(device, metric) sliding-window trends for time-to-threshold forecasts"""
+    
+    def __init__(self, window_points: int, window_hours: float, min_points: int):
+        self.window_points = window_points
+        self.window_age = timedelta(hours=window_hours)
+        self.min_points = max(min_points, 3)
+        self._models: Dict[Tuple[str, str], SlidingRegression] = {}
+        self._lock = threading.Lock()
+    
+    def _model(self, device_id: str, metric: str) -> SlidingRegression:
+        key = (device_id, metric)
+        model = self._models.get(key)
+        if model is None:
+            model = self._models[key] = SlidingRegression(self.window_points, self.window_age)
+        return model
+    
+    def update(self, sensor_reading: SensorReading):
+        """Feed a newly ingested reading into every metric's window"""
+        with self._lock:
+            for metric in SENSOR_FIELDS:
+                self._model(sensor_reading.device_id, metric).add(
+                    sensor_reading.timestamp, getattr(sensor_reading, metric)
+                )
+    
+    def needs_warm_up(self, device_id: str) -> bool:
+        """Whether any of the device's windows is short and history hasn't been loaded yet
+        
+        Live readings after a restart start a window without its history, so
+        "seen" isn't enough: a window is short until it holds `window_points`
+        readings or spans `window_age`. Only devices ingest has seen qualify,
+        so ids from requests never cost a history query or any memory.
+        """
+        with self._lock:
+            models = [self._models.get((device_id, metric)) for metric in SENSOR_FIELDS]
+            if any(model is None for model in models):
+                return False
+            return any(not model.seeded and not model.is_full() for model in models)
+    
+    async def warm_up(self, device_id: str):
+        """Back-fill the device's short windows from recent history (once per process)"""
+        since = datetime.utcnow() - self.window_age
+        docs = await get_storage().sensor_data.history(since, self.window_points, device_id=device_id)
+        added = 0
+        with self._lock:
+            for metric in SENSOR_FIELDS:
+                model = self._models.get((device_id, metric))
+                if model is None or model.seeded:
+                    continue
+                if not model.is_full():
+                    # Merged by timestamp, so readings ingested meanwhile aren't doubled
+                    added = max(added, model.merge((doc["timestamp"], doc[metric]) for doc in docs))
+                # Even without history, so we only look once
+                model.seeded = True
+        logger.info(f"📈 Forecast windows for {device_id} seeded with {added} readings")
+    
+    def forecast(self, device_id: str, metric: str, thresholds: Dict[str, float]) -> dict:
+        """Projected crossing of the min/max threshold in the direction of the trend"""
+        with self._lock:
+            model = self._models.get((device_id, metric))
+            fit = model.fit() if model and model.n >= self.min_points else None
+            result = {
+                "device_id": device_id,
+                "metric": metric,
+                "samples": model.n if model else 0,
+                "status": "insufficient_data",
+            }
+            if fit is None:
+                return result
+            
+            last_time, _, last_value = model.points[-1]
+            slope = fit["slope"]
+            current = model.value_at(fit, last_time)
+            result.update({
+                "window_start": model.points[0][0],
+                "window_end": last_time,
+                "current_value": last_value,
+                "trend_value": round(current, 3),
+                "slope_per_hour": round(slope, 4),
+                "r_squared": round(fit["r_squared"], 4),
+            })
+            
+            if slope < 0:
+                name, threshold = f"{metric}_min", thresholds.get(f"{metric}_min")
+            else:
+                name, threshold = f"{metric}_max", thresholds.get(f"{metric}_max")
+            if threshold is None:
+                result["status"] = "stable"
+                return result
+            result.update({"threshold_name": name, "threshold_value": threshold})
+            
+            crossed = last_value <= threshold if slope < 0 else last_value >= threshold
+            if crossed:
+                result["status"] = "crossed"
+                return result
+            
+            # Only trust a trend whose slope is distinguishable from zero
+            slope_low = slope - Z_95 * fit["slope_se"]
+            slope_high = slope + Z_95 * fit["slope_se"]
+            crossing = model.time_at(threshold, slope, fit["intercept"])
+            if crossing is None or slope_low <= 0 <= slope_high:
+                result["status"] = "stable"
+                return result
+            
+            # Steepest plausible slope gives the earliest crossing, and vice versa
+            steep, shallow = (slope_low, slope_high) if slope < 0 else (slope_high, slope_low)
+            t_last = model._hours(last_time)
+            earliest = model.time_at(threshold, steep, current - steep * t_last)
+            latest = model.time_at(threshold, shallow, current - shallow * t_last)
+            
+            result.update({
+                "status": "crossing",
+                "projected_crossing": crossing,
+                "crossing_earliest": earliest,
+                "crossing_latest": latest,
+                "hours_until_crossing": round((crossing - last_time).total_seconds() / 3600, 2) if crossing else None,
+            })
+            return result
+
+
+# Global forecast service instance
+forecast_service = ForecastService(
+    window_points=settings.FORECAST_WINDOW_READINGS,
+    window_hours=settings.FORECAST_WINDOW_HOURS,
+    min_points=settings.FORECAST_MIN_READINGS
+)
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.models import SensorReading
+from app.models.alert import Alert, AlertSeverity, AlertType
+from app.services.alert_service import AlertService
+from app.storage import get_storage
+from app.storage.base import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "device_heartbeats"
+
+# Weight of the newest reading in each device's average ingest lag
+LAG_EWMA_ALPHA = 0.1
+
+
+class _Heartbeat:
+    __slots__ = ("last_seen", "last_timestamp", "lag", "avg_lag", "readings", "offline")
+    
+    def __init__(self, last_seen: float, last_timestamp: float, lag: float, avg_lag: float, readings: int, offline: bool):
+        self.last_seen = last_seen
+        self.last_timestamp = last_timestamp
+        self.lag = lag
+        self.avg_lag = avg_lag
+        self.readings = readings
+        self.offline = offline
+    
+    def values(self) -> tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+
+class HeartbeatTable:
+    """When each device was last heard from, updated on ingest
+    
+    Kept in memory so health checks and the offline sweep never query
+    stored readings. Ingest lag is the time between a reading's own timestamp
+    and its arrival (network, broker and spool delay, plus device clock skew).
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices: Dict[str, _Heartbeat] = {}
+    
+    def beat(self, reading: SensorReading, received_at: Optional[float] = None):
+        """Record a newly ingested reading (called from the MQTT thread)"""
+        received_at = time.time() if received_at is None else received_at
+        timestamp = epoch_seconds(reading.timestamp)
+        lag = received_at - timestamp
+        with self._lock:
+            heartbeat = self._devices.get(reading.device_id)
+            if heartbeat is None:
+                self._devices[reading.device_id] = _Heartbeat(received_at, timestamp, lag, lag, 1, False)
+                return
+            heartbeat.last_seen = received_at
+            heartbeat.last_timestamp = max(heartbeat.last_timestamp, timestamp)
+            heartbeat.lag = lag
+            heartbeat.avg_lag += LAG_EWMA_ALPHA * (lag - heartbeat.avg_lag)
+            heartbeat.readings += 1
+    
+    def transitions(self, now: float, offline_after: float) -> Tuple[List[Tuple[str, float]], List[str]]:
+        """Devices silent for over `offline_after` not yet marked offline (with how long), and marked ones heard again"""
+        went_offline, came_back = [], []
+        with self._lock:
+            for device_id, heartbeat in self._devices.items():
+                silent = now - heartbeat.last_seen
+                if silent > offline_after and not heartbeat.offline:
+                    went_offline.append((device_id, silent))
+                elif silent <= offline_after and heartbeat.offline:
+                    came_back.append(device_id)
+        return went_offline, came_back
+    
+    def mark(self, device_id: str, offline: bool):
+        with self._lock:
+            if device_id in self._devices:
+                self._devices[device_id].offline = offline
+    
+    def devices(self, now: Optional[float] = None) -> List[dict]:
+        """Per-device heartbeat and lag, most recently heard first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = [(device_id, *heartbeat.values()) for device_id, heartbeat in self._devices.items()]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return [
+            {
+                "device_id": device_id,
+                "last_seen": datetime.utcfromtimestamp(last_seen),
+                "last_reading_at": datetime.utcfromtimestamp(last_timestamp),
+                "silent_seconds": round(now - last_seen, 1),
+                "lag_seconds": round(lag, 3),
+                "avg_lag_seconds": round(avg_lag, 3),
+                "readings": readings,
+                "offline": offline,
+            }
+            for device_id, last_seen, last_timestamp, lag, avg_lag, readings, offline in rows
+        ]
+    
+    def summary(self, now: Optional[float] = None) -> dict:
+        """Fleet-wide ingest lag: time since any reading arrived and lag across devices"""
+        now = time.time() if now is None else now
+        with self._lock:
+            heartbeats = list(self._devices.values())
+            last_seen = max((heartbeat.last_seen for heartbeat in heartbeats), default=None)
+            lags = [heartbeat.avg_lag for heartbeat in heartbeats]
+            offline = sum(heartbeat.offline for heartbeat in heartbeats)
+        return {
+            "device_count": len(heartbeats),
+            "offline_count": offline,
+            "seconds_since_last_reading": round(now - last_seen, 1) if last_seen is not None else None,
+            "avg_lag_seconds": round(sum(lags) / len(lags), 3) if lags else None,
+            "max_lag_seconds": round(max(lags), 3) if lags else None,
+        }
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"devices": {device_id: list(heartbeat.values()) for device_id, heartbeat in self._devices.items()}}
+    
+    def restore(self, data: dict):
+        """Load a snapshot; devices already heard from since startup keep their live state"""
+        with self._lock:
+            for device_id, values in data.get("devices", {}).items():
+                if device_id not in self._devices:
+                    self._devices[device_id] = _Heartbeat(*values)
+    
+    @property
+    def device_count(self) -> int:
+        return len(self._devices)
+
+
+class DeviceOfflineSweeper:
+    """Raises a device_offline alert once a device has been silent too long
+    
+    The heartbeat table is swept periodically; each silence raises one alert,
+    which is resolved by the first sweep after the device is heard again.
+    The table is checkpointed on each sweep so a restart still knows which
+    devices to expect and which are already alerted.
+    """
+    
+    def __init__(self, table: HeartbeatTable, offline_after: float):
+        self.table = table
+        self.offline_after = offline_after
+        self.alert_service = AlertService()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def load(self):
+        """Restore the last checkpoint, if any"""
+        try:
+            data = await get_storage().checkpoints.load(CHECKPOINT_NAME)
+            if data:
+                self.table.restore(data)
+                logger.info(f"✅ Device heartbeats restored ({self.table.device_count} devices)")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not restore device heartbeats: {e}")
+    
+    async def sweep(self) -> dict:
+        """Raise alerts for newly silent devices and resolve them for devices heard again"""
+        storage = get_storage()
+        went_offline, came_back = [], []
+        if self.offline_after > 0:
+            went_offline, came_back = self.table.transitions(time.time(), self.offline_after)
+        
+        email_settings = None
+        for device_id, silent in went_offline:
+            if email_settings is None:
+                settings_doc = await storage.settings.get()
+                email_settings = settings_doc.get("email_settings", {}) if settings_doc else {}
+            await self._raise_offline(device_id, silent, email_settings)
+            self.table.mark(device_id, True)
+        
+        for device_id in came_back:
+            resolved = await storage.alerts.resolve_many(
+                alert_types=[AlertType.DEVICE_OFFLINE.value], device_id=device_id
+            )
+            self.table.mark(device_id, False)
+            logger.info(f"✅ Device {device_id} is reporting again ({resolved} alerts resolved)")
+        
+        await storage.checkpoints.save(CHECKPOINT_NAME, self.table.snapshot())
+        return {"offline": [device_id for device_id, _ in went_offline], "back_online": came_back}
+    
+    async def _raise_offline(self, device_id: str, silent: float, email_settings: dict):
+        # Another worker may have raised it already
+        open_alerts = await get_storage().alerts.find(unresolved_only=True, limit=100, device_id=device_id)
+        if any(alert["alert_type"] == AlertType.DEVICE_OFFLINE.value for alert in open_alerts):
+            return
+        alert = Alert(
+            alert_type=AlertType.DEVICE_OFFLINE,
+            severity=AlertSeverity.CRITICAL,
+            message=f"Device {device_id} has sent no readings for {silent / 60:.0f} minutes",
+            sensor_value=round(silent, 1),
+            threshold_value=self.offline_after,
+            device_id=device_id
+        )
+        logger.warning(f"📴 Device {device_id} silent for {silent:.0f}s")
+        await self.alert_service.create_alert(alert, email_settings)
+    
+    def start(self):
+        """Start periodic sweeps on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop sweeping and write a final checkpoint"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await get_storage().checkpoints.save(CHECKPOINT_NAME, self.table.snapshot())
+        except Exception as e:
+            logger.warning(f"⚠️ Could not checkpoint device heartbeats: {e}")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.HEARTBEAT_SWEEP_INTERVAL_SECONDS)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"⚠️ Device offline sweep failed: {e}")
+
+
+# Global heartbeat table and offline sweeper
+heartbeat_table = HeartbeatTable()
+device_offline_sweeper = DeviceOfflineSweeper(heartbeat_table, offline_after=settings.DEVICE_OFFLINE_AFTER_SECONDS)
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Protocol
+from paho.mqtt.client import topic_matches_sub
+from app.config import settings
+from app.models.alert import Alert, AlertSeverity, AlertType
+from app.services.alert_service import AlertService
+from app.storage import get_storage
+from app.storage.base import epoch_seconds
+from app.utils.timing import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class CommandTransport(Protocol):
+    """Where valve commands are published: the MQTT service or a LoopbackBroker"""
+    
+    def publish(self, topic: str, payload: dict, qos: int = 0) -> bool:
+        ...
+
+
+class IrrigationController:
+    """Opens valves when soil moisture alerts fire and tracks the devices' acknowledgements
+    
+    Commands are published from the ingest path itself, so a device is told
+    to water in the same MQTT message cycle as the reading that triggered it.
+    A device opens its valve for the command's `duration_seconds` and closes
+    it by itself, then acks on its ack topic. Unacked commands are resent
+    with the same `command_id` (devices must treat repeats as one command)
+    and reported with an `irrigation_failed` alert once out of attempts.
+    
+    Watering and soak times live in storage (`storage.valves`), and each command
+    is claimed there with a conditional write first. Workers sharing the sensor
+    subscription therefore send one command per device between them, not one each.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool,
+        duration_seconds: int,
+        soak_seconds: float,
+        ack_timeout_seconds: float,
+        max_attempts: int
+    ):
+        self.enabled = enabled
+        self.duration_seconds = duration_seconds
+        self.soak_seconds = soak_seconds
+        self.ack_timeout_seconds = ack_timeout_seconds
+        self.max_attempts = max_attempts
+        self.transport: Optional[CommandTransport] = None
+        self.alert_service = AlertService()
+        self._lock = threading.Lock()
+        # command_id -> command being awaited
+        self._pending: Dict[str, dict] = {}
+        # Commands that failed, until the sweeper raises their alerts
+        self._failed: Deque[dict] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"sent": 0, "retried": 0, "acked": 0, "failed": 0, "suppressed": 0}
+        self.latency = {
+            "reading_to_command": LatencyHistogram(),
+            "command_to_ack": LatencyHistogram(),
+            "reading_to_ack": LatencyHistogram(),
+        }
+    
+    @staticmethod
+    def command_topic(device_id: str) -> str:
+        return settings.IRRIGATION_COMMAND_TOPIC.format(device_id=device_id)
+    
+    @staticmethod
+    def ack_subscription() -> str:
+        """Ack topics of every device (not shared: each worker awaits its own commands)"""
+        return settings.IRRIGATION_ACK_TOPIC.format(device_id="+")
+    
+    def is_ack_topic(self, topic: str) -> bool:
+        return self.enabled and topic_matches_sub(self.ack_subscription(), topic)
+    
+    async def on_alerts(self, device_id: str, alerts: List[Alert], received_at: datetime):
+        """React to the alerts a new reading raised"""
+        if not self.enabled or self.transport is None:
+            return
+        alert_types = {alert.alert_type for alert in alerts}
+        if AlertType.SOIL_MOISTURE_LOW in alert_types:
+            await self.send(device_id, "open", reason=AlertType.SOIL_MOISTURE_LOW.value, received_at=received_at)
+        elif AlertType.SOIL_MOISTURE_HIGH in alert_types:
+            await self.send(device_id, "close", reason=AlertType.SOIL_MOISTURE_HIGH.value, received_at=received_at)
+    
+    async def send(
+        self,
+        device_id: str,
+        action: str,
+        reason: str,
+        received_at: Optional[datetime] = None,
+        duration_seconds: Optional[int] = None,
+        force: bool = False
+    ) -> Optional[dict]:
+        """Publish a valve command; returns it, or None when it isn't needed
+        
+        An open is skipped while the device is still watering or soaking, and a
+        close when its valve isn't open, whichever worker sent the last command.
+        `force` sends it regardless.
+        """
+        duration = duration_seconds or self.duration_seconds
+        valves = get_storage().valves
+        issued_at = datetime.utcnow()
+        if action == "open":
+            claimed = await valves.claim_open(
+                device_id,
+                issued_at,
+                open_until=issued_at + timedelta(seconds=duration),
+                busy_until=issued_at + timedelta(seconds=duration + self.soak_seconds),
+                force=force
+            )
+        else:
+            claimed = await valves.claim_close(
+                device_id, issued_at, busy_until=issued_at + timedelta(seconds=self.soak_seconds), force=force
+            )
+        if not claimed:
+            with self._lock:
+                self.counters["suppressed"] += 1
+            return None
+        
+        now = time.monotonic()
+        command = {
+            "command_id": uuid.uuid4().hex,
+            "device_id": device_id,
+            "action": action,
+            "duration_seconds": duration if action == "open" else 0,
+            "reason": reason,
+            "issued_at": issued_at.isoformat() + "Z",
+            "attempt": 1,
+        }
+        with self._lock:
+            # Registered before publishing: the ack can arrive before publish returns
+            self._pending[command["command_id"]] = {
+                "command": command,
+                "first_sent": now,
+                "sent_at": now,
+                "received_at": epoch_seconds(received_at) if received_at else None,
+            }
+            self.counters["sent"] += 1
+        
+        if received_at:
+            self.latency["reading_to_command"].observe((time.time() - epoch_seconds(received_at)) * 1000)
+        self._publish(command)
+        logger.info(f"🚿 Valve {action} sent to {device_id} ({reason})")
+        return command
+    
+    def _publish(self, command: dict):
+        try:
+            if not self.transport.publish(self.command_topic(command["device_id"]), command, qos=1):
+                logger.warning(f"⚠️ Valve command {command['command_id']} not published, will retry")
+        except Exception as e:
+            logger.error(f"❌ Error publishing valve command: {e}")
+    
+    def handle_ack(self, payload: bytes):
+        """Record a device's acknowledgement (called from the MQTT thread)"""
+        try:
+            ack = json.loads(payload)
+            command_id = ack["command_id"]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"❌ Invalid valve ack: {e}")
+            return
+        
+        with self._lock:
+            # Unknown ids are other workers' commands or repeats of acked ones
+            entry = self._pending.pop(command_id, None)
+            if entry is None:
+                return
+            if ack.get("status", "ok") != "ok":
+                entry["error"] = ack.get("message") or ack.get("status")
+                self._failed.append(entry)
+                self.counters["failed"] += 1
+                return
+            self.counters["acked"] += 1
+        
+        self.latency["command_to_ack"].observe((time.monotonic() - entry["first_sent"]) * 1000)
+        if entry["received_at"] is not None:
+            self.latency["reading_to_ack"].observe((time.time() - entry["received_at"]) * 1000)
+        command = entry["command"]
+        logger.info(f"✅ Valve {command['action']} acked by {command['device_id']}")
+    
+    def _retry_expired(self) -> List[dict]:
+        """Resend commands whose ack is overdue; move those out of attempts to the failed queue"""
+        now = time.monotonic()
+        resend = []
+        with self._lock:
+            for command_id, entry in list(self._pending.items()):
+                if now - entry["sent_at"] < self.ack_timeout_seconds:
+                    continue
+                command = entry["command"]
+                if command["attempt"] >= self.max_attempts:
+                    del self._pending[command_id]
+                    entry["error"] = f"no ack after {command['attempt']} attempts"
+                    self._failed.append(entry)
+                    self.counters["failed"] += 1
+                    continue
+                command["attempt"] += 1
+                entry["sent_at"] = now
+                self.counters["retried"] += 1
+                resend.append(dict(command))
+        for command in resend:
+            logger.warning(f"🔁 Resending valve {command['action']} to {command['device_id']} (attempt {command['attempt']})")
+            self._publish(command)
+        return resend
+    
+    async def _raise_failures(self):
+        while self._failed:
+            entry = self._failed.popleft()
+            command = entry["command"]
+            # Let the next dry reading try again
+            await get_storage().valves.release(command["device_id"])
+            logger.error(f"❌ Valve {command['action']} for {command['device_id']} failed: {entry['error']}")
+            
+            settings_doc = await get_storage().settings.get()
+            alert = Alert(
+                alert_type=AlertType.IRRIGATION_FAILED,
+                severity=AlertSeverity.CRITICAL,
+                message=f"Valve {command['action']} command for {command['device_id']} failed: {entry['error']}",
+                sensor_value=command["attempt"],
+                threshold_value=self.max_attempts,
+                device_id=command["device_id"]
+            )
+            await self.alert_service.create_alert(alert, settings_doc.get("email_settings", {}) if settings_doc else {})
+    
+    def metrics(self) -> dict:
+        """Command counters, commands awaiting an ack and latency histograms"""
+        now = time.monotonic()
+        with self._lock:
+            pending = [
+                {**entry["command"], "waiting_seconds": round(now - entry["first_sent"], 3)}
+                for entry in self._pending.values()
+            ]
+            counters = dict(self.counters)
+        return {
+            "enabled": self.enabled,
+            "transport": settings.IRRIGATION_TRANSPORT,
+            **counters,
+            "pending": pending,
+            "latency_ms": {name: histogram.snapshot() for name, histogram in self.latency.items()},
+        }
+    
+    def start(self, transport: CommandTransport):
+        """Start tracking acks on the running event loop, publishing through `transport`"""
+        if not self.enabled:
+            return
+        self.transport = transport
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🚀 Irrigation controller started ({settings.IRRIGATION_TRANSPORT} transport)")
+    
+    async def stop(self):
+        """Stop retrying commands"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        interval = min(self.ack_timeout_seconds / 2, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._retry_expired()
+                await self._raise_failures()
+            except Exception as e:
+                logger.warning(f"⚠️ Irrigation ack sweep failed: {e}")
+
+
+# Global irrigation controller instance
+irrigation_controller = IrrigationController(
+    enabled=settings.IRRIGATION_ENABLED,
+    duration_seconds=settings.IRRIGATION_DURATION_SECONDS,
+    soak_seconds=settings.IRRIGATION_SOAK_SECONDS,
+    ack_timeout_seconds=settings.IRRIGATION_ACK_TIMEOUT_SECONDS,
+    max_attempts=settings.IRRIGATION_MAX_ATTEMPTS
+)
@@ -0,0 +1,75 @@
+"""
+In-process stand-in for the MQTT broker and the ESP32 valves
+
+Lets the irrigation command path run end to end without a broker or
+hardware (IRRIGATION_TRANSPORT=loopback): valve commands published to the
+LoopbackBroker reach SimulatedValves, which ack them after a short delay.
+"""
+import json
+import logging
+import random
+import threading
+from typing import Callable, List, Tuple
+from paho.mqtt.client import topic_matches_sub
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopbackBroker:
+    """Delivers each published message to every matching subscription, in the publisher's thread"""
+    
+    def __init__(self):
+        self._subscriptions: List[Tuple[str, Callable[[str, bytes], None]]] = []
+        self._lock = threading.Lock()
+    
+    def subscribe(self, topic_filter: str, callback: Callable[[str, bytes], None]):
+        with self._lock:
+            self._subscriptions.append((topic_filter, callback))
+    
+    def publish(self, topic: str, payload: dict, qos: int = 0) -> bool:
+        data = json.dumps(payload).encode()
+        with self._lock:
+            callbacks = [callback for topic_filter, callback in self._subscriptions if topic_matches_sub(topic_filter, topic)]
+        for callback in callbacks:
+            try:
+                callback(topic, data)
+            except Exception as e:
+                logger.error(f"❌ Loopback subscriber failed on {topic}: {e}")
+        return True
+
+
+class SimulatedValves:
+    """Valves of every device, acking each command after `ack_delay` seconds
+    
+    `drop_rate` is the share of commands silently lost, to exercise retries.
+    """
+    
+    def __init__(self, broker: LoopbackBroker, ack_delay: float, drop_rate: float = 0.0):
+        self.broker = broker
+        self.ack_delay = ack_delay
+        self.drop_rate = drop_rate
+        self.received: List[dict] = []
+        broker.subscribe(settings.IRRIGATION_COMMAND_TOPIC.format(device_id="+"), self._on_command)
+    
+    def _on_command(self, topic: str, payload: bytes):
+        command = json.loads(payload)
+        self.received.append(command)
+        if random.random() < self.drop_rate:
+            return
+        ack = {"command_id": command["command_id"], "device_id": command["device_id"], "status": "ok"}
+        timer = threading.Timer(
+            self.ack_delay,
+            self.broker.publish,
+            args=(settings.IRRIGATION_ACK_TOPIC.format(device_id=command["device_id"]), ack, 1)
+        )
+        timer.daemon = True
+        timer.start()
+
+
+def create_loopback_transport(ack_handler: Callable[[bytes], None]) -> LoopbackBroker:
+    """A broker with simulated valves whose acks go to `ack_handler`"""
+    broker = LoopbackBroker()
+    SimulatedValves(broker, ack_delay=settings.IRRIGATION_LOOPBACK_ACK_DELAY_SECONDS)
+    broker.subscribe(settings.IRRIGATION_ACK_TOPIC.format(device_id="+"), lambda topic, payload: ack_handler(payload))
+    return broker
@@ -1,11 +1,24 @@
 import paho.mqtt.client as mqtt
-import json
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import logging
-from datetime import datetime
+import os
+import socket
+import json
+from typing import List, Optional, Tuple
 from app.config import settings
-from app.database import Database
-from app.models import SensorReading
+from app.storage import StorageUnavailableError, get_storage
+from app.models import Alert, SensorReading
+from app.models.sensor_data import decode_readings
 from app.services.alert_service import AlertService
+from app.services.forecast_service import forecast_service
+from app.services.heartbeat_service import heartbeat_table
+from app.services.irrigation_service import irrigation_controller
+from app.services.sketch_service import sketch_service
+from app.services.spool_service import reading_spool
+from app.utils.timing import stage_timings
+from app.utils.worker_slot import worker_name
 
 logger = logging.getLogger(__name__)
 
@@ -17,92 +30,237 @@ class MQTTService:
         self.client = None
         self.alert_service = AlertService()
         self.is_connected = False
+        self.client_id: Optional[str] = None
+    
+    def _session(self) -> Tuple[str, bool, int]:
+        """Client ID, clean_start and session expiry for this worker
+        
+        A persistent session only helps if the restarted worker comes back with
+        the same ID. With a stable MQTT_CLIENT_ID_SUFFIX every worker of the
+        replica takes the lowest free worker slot, so IDs are
+        `<MQTT_CLIENT_ID>-<suffix>-<slot>` and a restarted worker gets its
+        predecessor's. Without a suffix IDs are `<hostname>-<pid>` and no
+        session is kept, since one that is never resumed would go on taking its
+        share of the group's messages until it expired.
+        """
+        worker = worker_name()
+        if worker is not None:
+            return f"{settings.MQTT_CLIENT_ID}-{worker}", settings.MQTT_CLEAN_START, settings.MQTT_SESSION_EXPIRY_SECONDS
+        return f"{settings.MQTT_CLIENT_ID}-{socket.gethostname()}-{os.getpid()}", True, 0
     
-    def on_connect(self, client, userdata, flags, rc):
+    @property
+    def subscription_topic(self) -> str:
+        """Sensor topic, as an MQTT v5 shared subscription when a group is configured"""
+        if settings.MQTT_SHARED_GROUP:
+            return f"$share/{settings.MQTT_SHARED_GROUP}/{settings.MQTT_TOPIC}"
+        return settings.MQTT_TOPIC
+    
+    def on_connect(self, client, userdata, flags, reason_code, properties):
         """Callback when connected to MQTT broker"""
-        if rc == 0:
+        if not reason_code.is_failure:
             self.is_connected = True
-            logger.info(f"✅ Connected to MQTT broker: {settings.MQTT_BROKER}")
+            logger.info(
+                f"✅ Connected to MQTT broker: {settings.MQTT_BROKER} as {self.client_id} "
+                f"(session present: {flags.session_present})"
+            )
             # Subscribe to sensor topic
-            client.subscribe(settings.MQTT_TOPIC)
-            logger.info(f"📡 Subscribed to topic: {settings.MQTT_TOPIC}")
+            client.subscribe(self.subscription_topic, qos=settings.MQTT_QOS)
+            logger.info(f"📡 Subscribed to topic: {self.subscription_topic} (QoS {settings.MQTT_QOS})")
+            if irrigation_controller.enabled and settings.IRRIGATION_TRANSPORT == "mqtt":
+                client.subscribe(irrigation_controller.ack_subscription(), qos=1)
         else:
             self.is_connected = False
-            logger.error(f"❌ Failed to connect to MQTT broker. Return code: {rc}")
+            logger.error(f"❌ Failed to connect to MQTT broker. Reason: {reason_code}")
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
         """Callback when disconnected from MQTT broker"""
         self.is_connected = False
-        logger.warning(f"⚠️ Disconnected from MQTT broker. Return code: {rc}")
+        logger.warning(f"⚠️ Disconnected from MQTT broker. Reason: {reason_code}")
     
     def on_message(self, client, userdata, msg):
-        """Callback when message received from MQTT"""
+        """Callback when message received from MQTT
+        
+        Messages are acknowledged manually, and only once the reading is
+        durably stored (in MongoDB or the local spool). Anything left
+        unacknowledged is redelivered by the broker from the persistent session.
+        A payload may hold one reading or a JSON array of readings. Valve
+        acks on the irrigation ack topics go to the irrigation controller.
+        """
+        if irrigation_controller.is_ack_topic(msg.topic):
+            irrigation_controller.handle_ack(msg.payload)
+            self._ack(client, msg)
+            return
+        
         try:
-            # Parse JSON payload
-            payload = json.loads(msg.payload.decode())
-            logger.info(f"📨 Received sensor data: {payload}")
-            
-            # Validate and create sensor reading
-            sensor_reading = SensorReading(**payload)
-            
-            # Store in database (async operation handled separately)
-            self._store_sensor_data(sensor_reading)
+            with stage_timings.span("mqtt.total"):
+                # Parse and validate the raw payload straight into insert-ready documents
+                with stage_timings.span("mqtt.decode"):
+                    docs = decode_readings(msg.payload)
+                logger.info(f"📨 Received {len(docs)} sensor reading(s) on {msg.topic}")
+                
+                # Store the whole payload in one write (async operation handled separately)
+                with stage_timings.span("mqtt.store"):
+                    stored, new_docs = self._store_sensor_data(docs)
+                
+                if stored:
+                    self._ack(client, msg)
+                else:
+                    logger.warning(f"⚠️ Reading not stored, leaving message {msg.mid} unacknowledged")
+                
+                self.process_new_readings(new_docs)
             
-            # Check thresholds and generate alerts
-            self._check_thresholds(sensor_reading)
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Invalid JSON payload: {e}")
+        except ValueError as e:
+            logger.error(f"❌ Invalid sensor reading: {e}")
+            self._ack(client, msg)
         except Exception as e:
             logger.error(f"❌ Error processing MQTT message: {e}")
     
-    def _store_sensor_data(self, sensor_reading: SensorReading):
-        """Store sensor data in MongoDB"""
+    def process_new_readings(self, docs: List[dict]):
+        """Run the per-reading processing for newly stored readings (also used by the spool replayer)"""
+        for doc in docs:
+            self._process_new_reading(doc)
+    
+    def _process_new_reading(self, doc: dict):
+        """Feed a newly stored reading to the in-memory services and alerting"""
+        sensor_reading = SensorReading.model_construct(**{field: doc[field] for field in SensorReading.model_fields})
+        heartbeat_table.beat(sensor_reading)
+        forecast_service.update(sensor_reading)
+        sketch_service.update(sensor_reading)
+        
+        # Check thresholds and generate alerts, then water if soil is dry
+        with stage_timings.span("mqtt.alerts"):
+            alerts = self._check_thresholds(sensor_reading)
+        with stage_timings.span("mqtt.irrigation"):
+            self._irrigate(sensor_reading.device_id, alerts, doc["received_at"])
+    
+    @staticmethod
+    def _ack(client, msg):
+        """Acknowledge a QoS 1/2 message (no-op for QoS 0)"""
+        if msg.qos > 0:
+            client.ack(msg.mid, msg.qos)
+    
+    def _store_sensor_data(self, docs: List[dict]) -> Tuple[bool, List[dict]]:
+        """Store a payload's decoded reading documents in the storage backend with one bulk upsert
+        
+        Returns `(stored, new_docs)`: whether every reading is durable (in
+        storage or the spool) and the ones newly written to storage. Spooled
+        readings aren't new yet: the replayer processes them once they reach
+        storage, rather than alerting against a database that is down.
+        Redelivered duplicates were already processed the first time. The
+        device timestamp is kept; arrival time is in `received_at`.
+        """
         try:
             import asyncio
             
             async def save_data():
-                db = Database.get_db()
-                sensor_dict = sensor_reading.model_dump()
-                sensor_dict['timestamp'] = datetime.utcnow()
-                await db.sensor_data.insert_one(sensor_dict)
-                logger.info("💾 Sensor data saved to database")
+                storage = get_storage()
+                
+                # Queue behind any backlog so readings are stored in order
+                if reading_spool.has_pending():
+                    return self._spool_sensor_data(docs), []
+                
+                try:
+                    with stage_timings.span("storage.upsert_sensor_data"):
+                        new = await storage.sensor_data.upsert_many(docs)
+                except StorageUnavailableError as e:
+                    logger.warning(f"⚠️ Database unavailable, spooling {len(docs)} reading(s): {e}")
+                    return self._spool_sensor_data(docs), []
+                
+                new_docs = []
+                for doc, is_new in zip(docs, new):
+                    if is_new:
+                        new_docs.append(doc)
+                    else:
+                        logger.info(f"🔁 Duplicate reading from {doc['device_id']} at {doc['timestamp']}, skipped")
+                if new_docs:
+                    logger.info(f"💾 {len(new_docs)} sensor reading(s) saved to database")
+                return True, new_docs
             
             # Run async operation
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            loop.run_until_complete(save_data())
+            result = loop.run_until_complete(save_data())
             loop.close()
+            return result
             
         except Exception as e:
             logger.error(f"❌ Error storing sensor data: {e}")
+            return False, []
+    
+    def _spool_sensor_data(self, docs: List[dict]) -> bool:
+        """Keep readings in the local spool until the database is back; False if any didn't fit"""
+        with stage_timings.span("spool.append"):
+            for doc in docs:
+                if not reading_spool.append(doc):
+                    return False
+        logger.info(f"📦 {len(docs)} sensor reading(s) spooled")
+        return True
     
-    def _check_thresholds(self, sensor_reading: SensorReading):
-        """Check sensor values against thresholds"""
+    def _irrigate(self, device_id: str, alerts: List[Alert], received_at):
+        """Send the valve command the new alerts call for, if any"""
+        if not irrigation_controller.enabled or not alerts:
+            return
+        try:
+            import asyncio
+            
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(irrigation_controller.on_alerts(device_id, alerts, received_at))
+            loop.close()
+            
+        except Exception as e:
+            logger.error(f"❌ Error sending valve command: {e}")
+    
+    def _check_thresholds(self, sensor_reading: SensorReading) -> List[Alert]:
+        """Check sensor values against thresholds; returns the alerts created"""
         try:
             import asyncio
             
             async def check():
-                await self.alert_service.check_and_create_alerts(sensor_reading)
+                return await self.alert_service.check_and_create_alerts(sensor_reading)
             
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            loop.run_until_complete(check())
+            alerts = loop.run_until_complete(check())
             loop.close()
+            return alerts
             
         except Exception as e:
             logger.error(f"❌ Error checking thresholds: {e}")
+            return []
     
     def start(self):
         """Start MQTT client"""
         try:
-            self.client = mqtt.Client(client_id=settings.MQTT_CLIENT_ID)
+            self.client_id, clean_start, session_expiry = self._session()
+            self.client = mqtt.Client(
+                CallbackAPIVersion.VERSION2,
+                client_id=self.client_id,
+                protocol=mqtt.MQTTv5,
+                manual_ack=True
+            )
             self.client.on_connect = self.on_connect
             self.client.on_disconnect = self.on_disconnect
             self.client.on_message = self.on_message
             
-            logger.info(f"🔌 Connecting to MQTT broker: {settings.MQTT_BROKER}:{settings.MQTT_PORT}")
-            self.client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
+            # Persistent session: the broker keeps subscriptions and
+            # unacknowledged QoS 1 messages across reconnects
+            connect_properties = Properties(PacketTypes.CONNECT)
+            connect_properties.SessionExpiryInterval = session_expiry
+            
+            # The network thread connects (and keeps retrying), so startup
+            # never waits on the broker; readiness reports the connection
+            logger.info(
+                f"🔌 Connecting to MQTT broker: {settings.MQTT_BROKER}:{settings.MQTT_PORT} as {self.client_id} "
+                f"({'clean session' if clean_start else f'session kept for {session_expiry}s'})"
+            )
+            self.client.connect_async(
+                settings.MQTT_BROKER,
+                settings.MQTT_PORT,
+                60,
+                clean_start=clean_start,
+                properties=connect_properties
+            )
             
             # Start network loop in background
             self.client.loop_start()
@@ -119,16 +277,18 @@ class MQTTService:
             self.client.disconnect()
             logger.info("🛑 MQTT service stopped")
     
-    def publish(self, topic: str, payload: dict):
-        """Publish message to MQTT topic"""
+    def publish(self, topic: str, payload: dict, qos: int = 0) -> bool:
+        """Publish message to MQTT topic; returns whether it was handed to the client"""
         try:
             if self.client and self.is_connected:
-                self.client.publish(topic, json.dumps(payload))
+                info = self.client.publish(topic, json.dumps(payload), qos=qos)
                 logger.info(f"📤 Published to {topic}: {payload}")
+                return info.rc == mqtt.MQTT_ERR_SUCCESS
             else:
                 logger.warning("⚠️ MQTT client not connected")
         except Exception as e:
             logger.error(f"❌ Error publishing to MQTT: {e}")
+        return False
 
 
 # Global MQTT service instance
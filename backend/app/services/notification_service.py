@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.models import Alert
+from app.services.email_service import EmailService
+from app.storage import get_storage
+from app.utils.timing import stage_timings
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Sends the alert emails queued in the notification outbox
+    
+    Alerts and their outbox messages are stored together, so a notification
+    survives a restart between the two. The dispatcher claims due messages in
+    batches, sends them concurrently, flips `email_sent` on the delivered
+    alerts in one write and retries failures with exponential backoff. A
+    message that is still failing after `max_attempts` becomes a dead letter.
+    """
+    
+    def __init__(
+        self,
+        batch_size: int,
+        poll_interval: float,
+        lease_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        # Leases are per process, so each worker only completes what it claimed
+        self.owner = uuid.uuid4().hex
+        self.email_service = EmailService()
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"sent": 0, "retried": 0, "dead_lettered": 0}
+        self.last_error: Optional[str] = None
+    
+    def wake(self):
+        """Dispatch now rather than at the next poll (a message was just queued)
+        
+        Safe to call from any thread: alerts are also raised from the MQTT thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def retry_delay(self, attempts: int) -> float:
+        """Seconds before attempt `attempts + 1`: doubling per failure, capped, with jitter"""
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        # Jitter spreads retries out after an SMTP outage
+        return delay * random.uniform(0.5, 1.0)
+    
+    async def _send(self, message: dict) -> Optional[str]:
+        """Send one message; returns the error, if any"""
+        try:
+            if message["channel"] != "email":
+                raise ValueError(f"Unknown notification channel: {message['channel']}")
+            alert = Alert(**message["alert"], _id=message["alert_id"])
+            await self.email_service.send_alert_email(alert, message["recipient"])
+            return None
+        except Exception as e:
+            return str(e) or type(e).__name__
+    
+    async def dispatch(self) -> int:
+        """Send one batch of due messages; returns the number claimed"""
+        outbox = get_storage().outbox
+        messages = await outbox.claim(self.owner, self.batch_size, self.lease_seconds)
+        if not messages:
+            return 0
+        
+        with stage_timings.span("outbox.send"):
+            errors = await asyncio.gather(*(self._send(message) for message in messages))
+        
+        delivered = [message for message, error in zip(messages, errors) if error is None]
+        if delivered:
+            # Status first: a crash before `complete` resends an email rather than losing its status
+            await get_storage().alerts.set_email_sent_many([message["alert_id"] for message in delivered], True)
+            await outbox.complete([message["_id"] for message in delivered])
+            self.counters["sent"] += len(delivered)
+        
+        failures: List[Tuple[str, str, Optional[datetime]]] = []
+        now = datetime.utcnow()
+        for message, error in zip(messages, errors):
+            if error is None:
+                continue
+            attempts = message["attempts"] + 1
+            if attempts >= self.max_attempts:
+                failures.append((message["_id"], error, None))
+                self.counters["dead_lettered"] += 1
+                logger.error(
+                    f"❌ Alert email to {message['recipient']} failed {attempts} times, moved to dead letters: {error}"
+                )
+            else:
+                retry_at = now + timedelta(seconds=self.retry_delay(attempts))
+                failures.append((message["_id"], error, retry_at))
+                self.counters["retried"] += 1
+                logger.warning(
+                    f"⚠️ Alert email to {message['recipient']} failed (attempt {attempts}), will retry: {error}"
+                )
+            self.last_error = error
+        if failures:
+            await outbox.fail(failures)
+        return len(messages)
+    
+    async def metrics(self) -> dict:
+        """Outbox depth and dispatch counters"""
+        return {
+            **await get_storage().outbox.counts(),
+            **self.counters,
+            "last_error": self.last_error,
+        }
+    
+    def start(self):
+        """Start draining the outbox on the running event loop"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop dispatching; unsent messages stay in the outbox"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Keep going while full batches come back
+                while await self.dispatch() >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.warning(f"⚠️ Notification dispatch failed: {e}")
+
+
+# Global notification dispatcher instance
+notification_dispatcher = NotificationDispatcher(
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    retry_base_seconds=settings.OUTBOX_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.OUTBOX_RETRY_MAX_SECONDS
+)
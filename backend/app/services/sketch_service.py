@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import logging
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from app.config import settings
+from app.models import SensorReading
+from app.storage import SENSOR_FIELDS, get_storage
+from app.storage.base import hour_bucket
+from app.utils.tdigest import TDigest
+
+logger = logging.getLogger(__name__)
+
+# Percentiles reported by the dashboard statistics
+PERCENTILES = {"p5": 0.05, "p50": 0.5, "p95": 0.95}
+
+
+class SketchService:
+    """Hourly t-digest sketches per (device, metric), maintained at ingest time
+    
+    Each worker keeps its own sketches for the hours it is receiving readings
+    for and periodically writes them under its own ids. Queries merge every
+    stored sketch in the window (plus this worker's unsaved ones), so no raw
+    readings are read or sorted. Sketches are evicted from memory once their
+    hour has passed and been saved; a late reading for an evicted hour simply
+    starts a new sketch with a new id.
+    """
+    
+    def __init__(self, compression: float):
+        self.compression = compression
+        self._prefix = uuid.uuid4().hex[:12]
+        self._ids = itertools.count(1)
+        # (hour, device_id, metric) -> (sketch id, digest)
+        self._live: Dict[Tuple[datetime, str, str], Tuple[str, TDigest]] = {}
+        self._dirty: Set[Tuple[datetime, str, str]] = set()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    def update(self, sensor_reading: SensorReading):
+        """Add a newly ingested reading to its hour's sketches"""
+        hour = hour_bucket(sensor_reading.timestamp)
+        with self._lock:
+            for metric in SENSOR_FIELDS:
+                key = (hour, sensor_reading.device_id, metric)
+                entry = self._live.get(key)
+                if entry is None:
+                    entry = self._live[key] = (f"{self._prefix}-{next(self._ids)}", TDigest(self.compression))
+                entry[1].add(getattr(sensor_reading, metric))
+                self._dirty.add(key)
+    
+    @staticmethod
+    def _doc(key: Tuple[datetime, str, str], sketch_id: str, digest: TDigest) -> dict:
+        hour, device_id, metric = key
+        return {
+            "_id": sketch_id,
+            "hour": hour,
+            "device_id": device_id,
+            "metric": metric,
+            "count": digest.count,
+            "data": digest.to_bytes(),
+        }
+    
+    async def flush(self) -> int:
+        """Save every sketch changed since the last flush; returns the number saved"""
+        current_hour = hour_bucket(datetime.utcnow())
+        with self._lock:
+            docs = [self._doc(key, *self._live[key]) for key in self._dirty]
+            self._dirty = set()
+        if not docs:
+            return 0
+        
+        try:
+            await get_storage().sketches.save_many(docs)
+        except Exception:
+            with self._lock:
+                self._dirty.update((doc["hour"], doc["device_id"], doc["metric"]) for doc in docs)
+            raise
+        
+        # Past hours that are fully saved don't need to stay in memory
+        with self._lock:
+            for key in [key for key in self._live if key[0] < current_hour and key not in self._dirty]:
+                del self._live[key]
+        return len(docs)
+    
+    async def percentiles(self, since: datetime, device_id: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """p5/p50/p95 per metric over every hour bucket starting at or after the hour of `since`"""
+        return (await self.percentiles_windows({"window": since}, device_id))["window"]
+    
+    async def percentiles_windows(
+        self,
+        windows: Dict[str, datetime],
+        device_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """`percentiles` for several windows, reading the sketches of the widest once"""
+        starts = {name: hour_bucket(since) for name, since in windows.items()}
+        earliest = min(starts.values())
+        docs = await get_storage().sketches.find(earliest, device_id=device_id)
+        
+        sketches: Dict[str, Tuple[datetime, str, bytes]] = {
+            doc["_id"]: (doc["hour"], doc["metric"], doc["data"]) for doc in docs
+        }
+        # This worker's in-memory sketches are newer than what it last saved
+        with self._lock:
+            for (hour, sketch_device, metric), (sketch_id, digest) in self._live.items():
+                if hour >= earliest and (device_id is None or sketch_device == device_id):
+                    sketches[sketch_id] = (hour, metric, digest.to_bytes())
+        
+        decoded = [(hour, metric, TDigest.from_bytes(data)) for hour, metric, data in sketches.values()]
+        results = {}
+        for name, start in starts.items():
+            merged: Dict[str, TDigest] = {}
+            for hour, metric, digest in decoded:
+                if hour >= start:
+                    merged.setdefault(metric, TDigest(self.compression)).merge(digest)
+            results[name] = {
+                metric: {label: round(digest.quantile(q), 2) for label, q in PERCENTILES.items()}
+                for metric, digest in merged.items()
+                if digest.count
+            }
+        return results
+    
+    def start(self):
+        """Start periodic flushing on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic flushing and save what is left"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save sensor sketches: {e}")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.SKETCH_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not save sensor sketches: {e}")
+
+
+# Global sketch service instance
+sketch_service = SketchService(compression=settings.SKETCH_COMPRESSION)
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from bson import json_util
+from app.config import settings
+from app.storage import StorageUnavailableError, get_storage
+
+logger = logging.getLogger(__name__)
+
+class ReadingSpool:
+    """Local append-only SQLite spool for readings that could not reach the database
+    
+    Every worker shares the spool file, so its depth is always read from the
+    table rather than counted per process, and each worker only removes the
+    rows it replayed.
+    """
+    
+    def __init__(self, path: str, max_readings: int):
+        self.path = path
+        self.max_readings = max_readings
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.appended_total = 0
+        self.replayed_total = 0
+        self.dropped_total = 0
+        self.last_replay_rate = 0.0
+        self.last_replay_at: Optional[datetime] = None
+    
+    def open(self):
+        """Open (or create) the spool file"""
+        with self._lock:
+            if self._conn:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)"
+            )
+        
+        depth = self.depth
+        if depth:
+            logger.warning(f"📦 Reading spool opened with {depth} pending readings")
+    
+    def close(self):
+        """Close the spool file"""
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+    
+    @property
+    def depth(self) -> int:
+        """Readings waiting in the spool, across all workers"""
+        with self._lock:
+            if self._conn is None:
+                return 0
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+    
+    def has_pending(self) -> bool:
+        """Whether any reading is waiting (cheap enough to check per reading)"""
+        with self._lock:
+            if self._conn is None:
+                return False
+            return self._conn.execute("SELECT EXISTS (SELECT 1 FROM spool)").fetchone()[0] == 1
+    
+    def append(self, doc: dict) -> bool:
+        """Append a reading document; returns False if the spool is full"""
+        with self._lock:
+            if self._conn is None:
+                return False
+            # The id span bounds the count from above and, unlike COUNT(*), needs no scan
+            span = self._conn.execute("SELECT COALESCE(MAX(id) - MIN(id) + 1, 0) FROM spool").fetchone()[0]
+            if span >= self.max_readings and (
+                self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0] >= self.max_readings
+            ):
+                self.dropped_total += 1
+                logger.error(f"❌ Reading spool full ({self.max_readings}), dropping reading")
+                return False
+            
+            self._conn.execute("INSERT INTO spool (doc) VALUES (?)", (json_util.dumps(doc),))
+            self.appended_total += 1
+            return True
+    
+    def peek(self, limit: int) -> List[Tuple[int, dict]]:
+        """Oldest spooled readings, in arrival order"""
+        with self._lock:
+            if self._conn is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT id, doc FROM spool ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, json_util.loads(doc)) for row_id, doc in rows]
+    
+    def ack(self, row_ids: List[int]):
+        """Remove the replayed readings `row_ids`
+        
+        Only those rows: other workers may have appended (or be replaying) others.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id in row_ids])
+            self._conn.execute("COMMIT")
+            self.replayed_total += self._conn.total_changes - before
+    
+    def metrics(self) -> dict:
+        """Spool depth and replay counters"""
+        return {
+            "depth": self.depth,
+            "max_readings": self.max_readings,
+            "appended_total": self.appended_total,
+            "replayed_total": self.replayed_total,
+            "dropped_total": self.dropped_total,
+            "last_replay_rate_per_sec": round(self.last_replay_rate, 1),
+            "last_replay_at": self.last_replay_at,
+        }
+
+
+class SpoolReplayer:
+    """Background task that bulk-replays spooled readings once the database is back"""
+    
+    def __init__(self, spool: ReadingSpool):
+        self.spool = spool
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the replay loop on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("🚀 Spool replayer started")
+    
+    async def stop(self):
+        """Stop the replay loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("🛑 Spool replayer stopped")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.SPOOL_REPLAY_INTERVAL_SECONDS)
+            if not self.spool.has_pending():
+                continue
+            try:
+                await self.replay()
+            except StorageUnavailableError as e:
+                logger.warning(f"⚠️ Spool replay paused, database still unavailable: {e}")
+            except Exception as e:
+                logger.error(f"❌ Error replaying spool: {e}")
+    
+    async def replay(self) -> int:
+        """Replay every spooled reading in order; returns the number replayed
+        
+        Readings that turn out to be new go through alerting, sketches and
+        heartbeats now, as that was held back while they were spooled.
+        """
+        # mqtt_service imports the spool
+        from app.services.mqtt_service import mqtt_service
+        
+        storage = get_storage()
+        await storage.ping()
+        
+        replayed = 0
+        started = time.perf_counter()
+        
+        while True:
+            batch = await asyncio.to_thread(self.spool.peek, settings.SPOOL_REPLAY_BATCH_SIZE)
+            if not batch:
+                break
+            
+            # Upserts are idempotent, so a batch that fails midway is simply retried
+            docs = [doc for _, doc in batch]
+            new = await storage.sensor_data.upsert_many(docs)
+            await asyncio.to_thread(self.spool.ack, [row_id for row_id, _ in batch])
+            replayed += len(batch)
+            
+            # Another worker replaying the same rows stored them first: skip those here
+            new_docs = [doc for doc, is_new in zip(docs, new) if is_new]
+            if new_docs:
+                await asyncio.to_thread(mqtt_service.process_new_readings, new_docs)
+        
+        elapsed = time.perf_counter() - started
+        self.spool.last_replay_rate = replayed / elapsed if elapsed > 0 else 0.0
+        self.spool.last_replay_at = datetime.utcnow()
+        logger.info(f"📦 Replayed {replayed} spooled readings ({self.spool.last_replay_rate:.0f}/s)")
+        return replayed
+
+
+# Global spool instances
+reading_spool = ReadingSpool(settings.SPOOL_PATH, settings.SPOOL_MAX_READINGS)
+spool_replayer = SpoolReplayer(reading_spool)
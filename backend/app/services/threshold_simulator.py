@@ -0,0 +1,155 @@
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from app.config import settings
+from app.storage import SENSOR_FIELDS, get_storage
+from app.storage.base import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class ThresholdSimulator:
+    """Replays candidate thresholds over stored readings, a column batch at a time
+    
+    Each reading is compared with the thresholds using vectorized NumPy
+    operations. A reading is taken to hold until the device's next reading,
+    capped at `max_gap_seconds` so offline periods don't count as time in
+    violation. The last reading of each device in a batch is carried over to
+    the next batch, so batch boundaries don't change the result.
+    """
+    
+    def __init__(self, max_gap_seconds: float, batch_size: int):
+        self.max_gap_seconds = max_gap_seconds
+        self.batch_size = batch_size
+    
+    async def simulate(
+        self,
+        thresholds: Dict[str, float],
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None
+    ) -> dict:
+        """Alerts, episodes and time in violation per metric for `thresholds` over [since, until)"""
+        started = time.perf_counter()
+        limits = {
+            field: (thresholds[f"{field}_min"], thresholds[f"{field}_max"]) for field in SENSOR_FIELDS
+        }
+        totals = {
+            field: {"below_min": 0, "above_max": 0, "alerts": 0, "episodes": 0, "seconds_in_violation": 0.0}
+            for field in SENSOR_FIELDS
+        }
+        # device_id -> (timestamp of its last reading so far, violation flag per metric)
+        pending: Dict[str, Tuple[float, Dict[str, bool]]] = {}
+        observed = 0.0
+        total_readings = 0
+        
+        storage = get_storage()
+        async for columns in storage.sensor_data.scan_columns(since, until, device_id, self.batch_size):
+            total_readings += len(columns["timestamp"])
+            observed += self._evaluate_batch(columns, limits, totals, pending)
+        
+        # Last readings hold until the end of the range (still capped)
+        end = epoch_seconds(until)
+        for last_timestamp, flags in pending.values():
+            held = min(max(end - last_timestamp, 0.0), self.max_gap_seconds)
+            observed += held
+            for field, violating in flags.items():
+                if violating:
+                    totals[field]["seconds_in_violation"] += held
+        
+        metrics = {}
+        for field, result in totals.items():
+            metrics[field] = {
+                "min": limits[field][0],
+                "max": limits[field][1],
+                **result,
+                "seconds_in_violation": round(result["seconds_in_violation"], 1),
+                "percent_time_in_violation": round(100 * result["seconds_in_violation"] / observed, 2) if observed else 0.0,
+            }
+        
+        return {
+            "since": since,
+            "until": until,
+            "device_id": device_id,
+            "total_readings": total_readings,
+            "devices": len(pending),
+            "observed_seconds": round(observed, 1),
+            "metrics": metrics,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    
+    def _evaluate_batch(
+        self,
+        columns: Dict[str, Sequence],
+        limits: Dict[str, Tuple[float, float]],
+        totals: Dict[str, dict],
+        pending: Dict[str, Tuple[float, Dict[str, bool]]]
+    ) -> float:
+        """Fold one batch into `totals` and `pending`; returns the time it covers"""
+        # Small integer code per device (a dict beats np.unique on strings)
+        index: Dict[str, int] = {}
+        device_ids = columns["device_id"]
+        codes = np.fromiter(
+            (index.setdefault(device, len(index)) for device in device_ids), dtype=np.intp, count=len(device_ids)
+        )
+        devices = list(index)
+        timestamps = np.asarray(columns["timestamp"], dtype=np.float64)
+        
+        # Group by device; batches arrive in time order, which a stable sort keeps
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        timestamps = timestamps[order]
+        group_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        group_ends = np.r_[group_starts[1:], len(codes)] - 1
+        
+        # How long each reading holds: until the same device's next reading
+        same_device = codes[1:] == codes[:-1]
+        held = np.zeros(len(codes))
+        held[:-1] = np.where(same_device, np.minimum(np.diff(timestamps), self.max_gap_seconds), 0.0)
+        
+        # Readings carried over from the previous batch hold until each device's first reading here
+        carried = np.zeros(len(group_starts))
+        carried_flags: Dict[str, np.ndarray] = {field: np.zeros(len(group_starts), dtype=bool) for field in SENSOR_FIELDS}
+        for group, start in enumerate(group_starts):
+            previous = pending.get(devices[codes[start]])
+            if previous:
+                carried[group] = min(max(timestamps[start] - previous[0], 0.0), self.max_gap_seconds)
+                for field in SENSOR_FIELDS:
+                    carried_flags[field][group] = previous[1][field]
+        
+        last_flags = {}
+        for field in SENSOR_FIELDS:
+            values = np.asarray(columns[field], dtype=np.float64)[order]
+            minimum, maximum = limits[field]
+            below = values < minimum
+            above = values > maximum
+            violating = below | above
+            
+            # An episode starts where a device goes from in range to out of range
+            previous = np.empty(len(violating), dtype=bool)
+            previous[1:] = violating[:-1]
+            previous[group_starts] = carried_flags[field]
+            
+            result = totals[field]
+            result["below_min"] += int(below.sum())
+            result["above_max"] += int(above.sum())
+            result["alerts"] += int(violating.sum())
+            result["episodes"] += int((violating & ~previous).sum())
+            result["seconds_in_violation"] += float(held[violating].sum() + carried[carried_flags[field]].sum())
+            last_flags[field] = violating[group_ends]
+        
+        for group, end in enumerate(group_ends):
+            pending[devices[codes[end]]] = (
+                float(timestamps[end]),
+                {field: bool(last_flags[field][group]) for field in SENSOR_FIELDS}
+            )
+        return float(held.sum() + carried.sum())
+
+
+# Global threshold simulator instance
+threshold_simulator = ThresholdSimulator(
+    max_gap_seconds=settings.SIMULATION_MAX_GAP_SECONDS,
+    batch_size=settings.SIMULATION_BATCH_SIZE
+)
@@ -0,0 +1,63 @@
+from app.config import settings
+from .base import (
+    SENSOR_FIELDS,
+    AlertRepository,
+    CheckpointRepository,
+    OutboxRepository,
+    SensorDataRepository,
+    SettingsRepository,
+    SketchRepository,
+    Storage,
+    StorageUnavailableError,
+    ValveRepository,
+    VersionConflictError,
+)
+
+
+def create_storage(backend: str) -> Storage:
+    """Build the configured storage backend ("mongo", "sqlite" or "memory")"""
+    if backend == "mongo":
+        from .mongo import MongoStorage
+        return MongoStorage()
+    if backend == "sqlite":
+        from .sqlite import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH, batch_size=settings.SQLITE_BATCH_SIZE)
+    if backend == "memory":
+        from .memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# Global storage instance
+storage = create_storage(settings.STORAGE_BACKEND)
+
+if settings.ARCHIVE_ENABLED:
+    # Closed days of readings are moved to (and served from) local Parquet files
+    from .archive import ArchivedSensorDataRepository, ParquetArchive
+    storage.sensor_data = ArchivedSensorDataRepository(
+        storage.sensor_data, ParquetArchive(settings.ARCHIVE_PATH, compression=settings.ARCHIVE_COMPRESSION)
+    )
+
+
+# Also used as the FastAPI dependency for routes
+def get_storage() -> Storage:
+    """Get the storage backend"""
+    return storage
+
+
+__all__ = [
+    "SENSOR_FIELDS",
+    "AlertRepository",
+    "CheckpointRepository",
+    "OutboxRepository",
+    "SensorDataRepository",
+    "SettingsRepository",
+    "SketchRepository",
+    "Storage",
+    "StorageUnavailableError",
+    "ValveRepository",
+    "VersionConflictError",
+    "create_storage",
+    "storage",
+    "get_storage",
+]
@@ -0,0 +1,311 @@
+"""
+Closed days of sensor readings in local Parquet files, one per device per day
+
+Files live at <root>/day=YYYY-MM-DD/device=<quoted device_id>.parquet, so a
+query only opens the days (and devices) it covers. Files are memory-mapped
+and only the columns a query needs are read. NumPy and pyarrow are imported
+by the methods that use them, so none of this costs anything at startup.
+"""
+import asyncio
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+from app.storage.base import SENSOR_FIELDS, SCAN_COLUMNS, SensorDataRepository
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+DAY = timedelta(days=1)
+
+
+def day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+
+def merge_stats(first: Optional[dict], second: Optional[dict]) -> Optional[dict]:
+    """Combine two `stats` results over disjoint ranges"""
+    if not first or not second:
+        return first or second
+    total = first["total_readings"] + second["total_readings"]
+    merged = {"total_readings": total}
+    for field in SENSOR_FIELDS:
+        merged[f"avg_{field}"] = (
+            first[f"avg_{field}"] * first["total_readings"] + second[f"avg_{field}"] * second["total_readings"]
+        ) / total
+        merged[f"min_{field}"] = min(first[f"min_{field}"], second[f"min_{field}"])
+        merged[f"max_{field}"] = max(first[f"max_{field}"], second[f"max_{field}"])
+    return merged
+
+
+class ParquetArchive:
+    """Archived readings, written a day at a time and read with column pruning"""
+    
+    def __init__(self, root: str, compression: str = "zstd"):
+        try:
+            import pyarrow as pa
+        except ImportError as e:  # optional: only needed with ARCHIVE_ENABLED
+            raise RuntimeError("The sensor data archive needs the pyarrow package (pip install pyarrow)") from e
+        self.root = Path(root)
+        self.compression = compression
+        self.schema = pa.schema(
+            [("device_id", pa.string()), ("timestamp", pa.timestamp("us"))]
+            + [(field, pa.float64()) for field in SENSOR_FIELDS]
+        )
+        self._lock = threading.Lock()
+        # day -> device_id -> file
+        self._files: Dict[date, Dict[str, Path]] = {}
+        for day_dir in self.root.glob("day=*"):
+            for path in day_dir.glob("device=*.parquet"):
+                device_id = unquote(path.name[len("device="):-len(".parquet")])
+                self._files.setdefault(date.fromisoformat(day_dir.name[len("day="):]), {})[device_id] = path
+    
+    @property
+    def archived_until(self) -> Optional[datetime]:
+        """End of the newest archived day; older readings are served from the archive"""
+        with self._lock:
+            return day_start(max(self._files)) + DAY if self._files else None
+    
+    def _path(self, day: date, device_id: str) -> Path:
+        return self.root / f"day={day.isoformat()}" / f"device={quote(device_id, safe='')}.parquet"
+    
+    def _table(self, columns: Dict[str, Sequence]) -> "pa.Table":
+        import numpy as np
+        import pyarrow as pa
+        
+        micros = np.round(np.asarray(columns["timestamp"], dtype=np.float64) * 1e6).astype(np.int64)
+        arrays = [pa.array(columns["device_id"], pa.string()), pa.array(micros, pa.timestamp("us"))]
+        arrays += [pa.array(np.asarray(columns[field], dtype=np.float64)) for field in SENSOR_FIELDS]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+    
+    def write_day(self, day: date, columns: Dict[str, Sequence]) -> int:
+        """Add a day's readings (SCAN_COLUMNS with epoch-second timestamps); returns the number given"""
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        
+        table = self._table(columns)
+        device_ids = table["device_id"]
+        for device_id in pc.unique(device_ids).to_pylist():
+            part = table.filter(pc.equal(device_ids, device_id))
+            path = self._path(day, device_id)
+            if path.exists():
+                # Late readings for a day that is already archived
+                part = pa.concat_tables([pq.read_table(path), part])
+            part = part.sort_by("timestamp")
+            timestamps = part["timestamp"].cast(pa.int64()).to_numpy()
+            part = part.filter(pa.array(np.r_[True, timestamps[1:] != timestamps[:-1]]))
+            
+            # Written aside and renamed, so readers never see a partial file
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(path.name + ".tmp")
+            pq.write_table(part, partial, compression=self.compression)
+            os.replace(partial, path)
+            with self._lock:
+                self._files.setdefault(day, {})[device_id] = path
+        return table.num_rows
+    
+    def day_files(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        newest_first: bool = False
+    ) -> List[Tuple[date, List[Path]]]:
+        """Files of each archived day overlapping [since, until)"""
+        with self._lock:
+            days = sorted(
+                (day for day in self._files if day_start(day) < until and day_start(day) + DAY > since),
+                reverse=newest_first
+            )
+            return [
+                (day, [path for device, path in self._files[day].items() if device_id is None or device == device_id])
+                for day in days
+            ]
+    
+    def read_day(
+        self,
+        day: date,
+        paths: List[Path],
+        columns: Sequence[str],
+        since: datetime,
+        until: datetime
+    ) -> Optional["pa.Table"]:
+        """`columns` of one day's readings in [since, until), in timestamp order"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        
+        if not paths:
+            return None
+        table = pa.concat_tables([pq.read_table(path, columns=list(columns), memory_map=True) for path in paths])
+        if since > day_start(day) or until < day_start(day) + DAY:
+            timestamps = table["timestamp"]
+            table = table.filter(pc.and_(
+                pc.greater_equal(timestamps, pa.scalar(since, pa.timestamp("us"))),
+                pc.less(timestamps, pa.scalar(until, pa.timestamp("us")))
+            ))
+        return table.sort_by("timestamp") if len(paths) > 1 else table
+    
+    @staticmethod
+    def to_columns(table: "pa.Table") -> Dict[str, Sequence]:
+        """Table -> a scan_columns batch (epoch-second timestamps, NumPy metric arrays)"""
+        import pyarrow as pa
+        
+        columns = {"device_id": table["device_id"].to_pylist()}
+        columns["timestamp"] = table["timestamp"].cast(pa.int64()).to_numpy() / 1e6
+        for field in SENSOR_FIELDS:
+            columns[field] = table[field].to_numpy()
+        return columns
+    
+    def history(self, since: datetime, until: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        """Readings in [since, until), newest first, reading only as many days as needed"""
+        docs: List[dict] = []
+        for day, paths in self.day_files(since, until, device_id, newest_first=True):
+            table = self.read_day(day, paths, SCAN_COLUMNS, since, until)
+            if table is None:
+                continue
+            wanted = limit - len(docs)
+            docs.extend(reversed(table.slice(max(table.num_rows - wanted, 0)).to_pylist()))
+            if len(docs) >= limit:
+                break
+        return docs
+    
+    def stats_windows(self, windows: Dict[str, datetime], until: datetime) -> Dict[str, Optional[dict]]:
+        """`stats` for windows [since, until), reading each day of the widest once"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        totals = {name: {"count": 0, "sum": {}, "min": {}, "max": {}} for name in windows}
+        columns = ("timestamp",) + SENSOR_FIELDS
+        for day, paths in self.day_files(min(windows.values()), until):
+            table = self.read_day(day, paths, columns, min(windows.values()), until)
+            if table is None:
+                continue
+            for name, since in windows.items():
+                part = table
+                if since > day_start(day):
+                    part = table.filter(pc.greater_equal(table["timestamp"], pa.scalar(since, pa.timestamp("us"))))
+                if not part.num_rows:
+                    continue
+                total = totals[name]
+                total["count"] += part.num_rows
+                for field in SENSOR_FIELDS:
+                    extremes = pc.min_max(part[field]).as_py()
+                    total["sum"][field] = total["sum"].get(field, 0.0) + pc.sum(part[field]).as_py()
+                    total["min"][field] = min(total["min"].get(field, extremes["min"]), extremes["min"])
+                    total["max"][field] = max(total["max"].get(field, extremes["max"]), extremes["max"])
+        
+        results = {}
+        for name, total in totals.items():
+            if not total["count"]:
+                results[name] = None
+                continue
+            results[name] = {"total_readings": total["count"]}
+            for field in SENSOR_FIELDS:
+                results[name][f"avg_{field}"] = total["sum"][field] / total["count"]
+                results[name][f"min_{field}"] = total["min"][field]
+                results[name][f"max_{field}"] = total["max"][field]
+        return results
+    
+    def status(self) -> dict:
+        with self._lock:
+            paths = [path for files in self._files.values() for path in files.values()]
+            days = len(self._files)
+        return {
+            "path": str(self.root),
+            "archived_until": self.archived_until,
+            "days": days,
+            "files": len(paths),
+            "bytes": sum(path.stat().st_size for path in paths),
+        }
+
+
+class ArchivedSensorDataRepository(SensorDataRepository):
+    """Sensor data split between a storage backend and the Parquet archive
+    
+    Readings before `archive.archived_until` are served from the archive and
+    later ones from the backend, so queries spanning both read each side once.
+    Late readings for an archived day stay in the backend, out of queries,
+    until the next archive run merges them into the day's files.
+    """
+    
+    def __init__(self, inner: SensorDataRepository, archive: ParquetArchive):
+        self.inner = inner
+        self.archive = archive
+    
+    async def upsert(self, doc: dict) -> bool:
+        return await self.inner.upsert(doc)
+    
+    async def upsert_many(self, docs: List[dict]) -> List[bool]:
+        return await self.inner.upsert_many(docs)
+    
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        return await self.inner.insert_many(docs)
+    
+    async def delete_range(self, since: datetime, until: datetime, received_before: Optional[datetime] = None) -> int:
+        return await self.inner.delete_range(since, until, received_before)
+    
+    async def latest(self) -> Optional[dict]:
+        latest = await self.inner.latest()
+        boundary = self.archive.archived_until
+        if latest or boundary is None:
+            return latest
+        docs = await asyncio.to_thread(self.archive.history, datetime.min, boundary, 1)
+        return docs[0] if docs else None
+    
+    async def sync_cursor(self) -> Any:
+        return await self.inner.sync_cursor()
+    
+    async def changes_since(
+        self,
+        cursor: Any,
+        since: datetime,
+        limit: int,
+        device_id: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[dict], Any, bool]:
+        # New readings are always stored in the backend first
+        return await self.inner.changes_since(cursor, since, limit, device_id, until)
+    
+    async def history(self, since: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        boundary = self.archive.archived_until
+        if boundary is None or since >= boundary:
+            return await self.inner.history(since, limit, device_id)
+        docs = await self.inner.history(boundary, limit, device_id)
+        if len(docs) < limit:
+            docs += await asyncio.to_thread(self.archive.history, since, boundary, limit - len(docs), device_id)
+        return docs
+    
+    async def stats_windows(self, windows: Dict[str, datetime]) -> Dict[str, Optional[dict]]:
+        boundary = self.archive.archived_until
+        if boundary is None or not windows or min(windows.values()) >= boundary:
+            return await self.inner.stats_windows(windows)
+        recent = await self.inner.stats_windows({name: max(since, boundary) for name, since in windows.items()})
+        archived_windows = {name: since for name, since in windows.items() if since < boundary}
+        archived = await asyncio.to_thread(self.archive.stats_windows, archived_windows, boundary)
+        return {name: merge_stats(recent[name], archived.get(name)) for name in windows}
+    
+    async def scan_columns(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        batch_size: int = 50000
+    ) -> AsyncIterator[Dict[str, Sequence]]:
+        boundary = self.archive.archived_until
+        if boundary is not None and since < boundary:
+            archived_until = min(until, boundary)
+            for day, paths in self.archive.day_files(since, archived_until, device_id):
+                table = await asyncio.to_thread(self.archive.read_day, day, paths, SCAN_COLUMNS, since, archived_until)
+                if table is None:
+                    continue
+                for offset in range(0, table.num_rows, batch_size):
+                    yield self.archive.to_columns(table.slice(offset, batch_size))
+            since = boundary
+        if since < until:
+            async for columns in self.inner.scan_columns(since, until, device_id, batch_size):
+                yield columns
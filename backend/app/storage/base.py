@@ -0,0 +1,416 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+SENSOR_FIELDS = ("soil_moisture", "temperature", "humidity", "light_intensity")
+
+# Columns yielded by SensorDataRepository.scan_columns
+SCAN_COLUMNS = ("device_id", "timestamp") + SENSOR_FIELDS
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class StorageUnavailableError(Exception):
+    """Raised when the storage backend cannot be reached"""
+
+
+class VersionConflictError(Exception):
+    """Raised when a conditional update finds the document at another version"""
+
+
+def set_paths(doc: dict, fields: dict):
+    """Apply `$set`-style updates with dotted paths ("thresholds.temperature_max") to a dict"""
+    for path, value in fields.items():
+        target = doc
+        *parents, key = path.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value
+
+
+def epoch_seconds(timestamp: datetime) -> float:
+    """Naive UTC datetime -> seconds since the Unix epoch"""
+    return (timestamp - EPOCH).total_seconds()
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    """Start of the hour `timestamp` falls in (alert counters and sensor sketches are hourly)"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def counter_name(value: str) -> str:
+    """A device id as a counter name: `%`, `.` and `$` are percent-encoded so it is one MongoDB field"""
+    return value.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def next_hour_bucket(timestamp: datetime) -> datetime:
+    """First hour bucket starting at or after `timestamp`"""
+    bucket = hour_bucket(timestamp)
+    return bucket if bucket == timestamp else bucket + timedelta(hours=1)
+
+
+def alert_counter_deltas(alert: dict, sign: int = 1) -> Dict[str, int]:
+    """Counter increments one alert contributes to its hour bucket (negated on delete)"""
+    deltas = {
+        "total": sign,
+        f"type.{getattr(alert['alert_type'], 'value', alert['alert_type'])}": sign,
+        f"severity.{getattr(alert['severity'], 'value', alert['severity'])}": sign,
+    }
+    if not alert.get("is_resolved"):
+        deltas["unresolved"] = sign
+    if alert.get("device_id"):
+        deltas[f"device.{counter_name(alert['device_id'])}"] = sign
+    return deltas
+
+
+def outbox_message(alert_id: str, alert: dict, notification: dict, now: datetime) -> dict:
+    """A new outbox message for `notification` about the alert `alert` (without its id)"""
+    return {
+        "alert_id": alert_id,
+        "channel": notification["channel"],
+        "recipient": notification["recipient"],
+        "alert": {key: value for key, value in alert.items() if key not in ("_id", "updated_at")},
+        "attempts": 0,
+        "created_at": now,
+        "available_at": now,
+        "lease_owner": None,
+        "last_error": None,
+        "failed_at": None,
+        "dead": False,
+    }
+
+
+def summarize_alert_counters(counters: Dict[str, int]) -> dict:
+    """Summed bucket counters -> totals and per-type/severity/device breakdowns"""
+    summary = {
+        "total_alerts": counters.get("total", 0),
+        "unresolved_alerts": counters.get("unresolved", 0),
+        "alerts_by_type": {},
+        "alerts_by_severity": {},
+        "alerts_by_device": {},
+    }
+    groups = {"type": "alerts_by_type", "severity": "alerts_by_severity", "device": "alerts_by_device"}
+    for key, value in counters.items():
+        group, _, name = key.partition(".")
+        if group in groups and value:
+            summary[groups[group]][unquote(name)] = value
+    return summary
+
+
+class SensorDataRepository(ABC):
+    """Storage for sensor readings"""
+    
+    @abstractmethod
+    async def upsert(self, doc: dict) -> bool:
+        """Store a reading once per (device_id, timestamp); returns True if it was new"""
+    
+    @abstractmethod
+    async def upsert_many(self, docs: List[dict]) -> List[bool]:
+        """Idempotently store readings in order; returns whether each one was new"""
+    
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        """Bulk-load readings in any order, skipping ones already stored; returns the new ones"""
+    
+    @abstractmethod
+    async def delete_range(self, since: datetime, until: datetime, received_before: Optional[datetime] = None) -> int:
+        """Delete readings in [since, until), only those received by `received_before` if given; returns the number deleted"""
+    
+    @abstractmethod
+    async def latest(self) -> Optional[dict]:
+        """Most recent reading"""
+    
+    @abstractmethod
+    async def sync_cursor(self) -> Any:
+        """JSON-serializable position after the newest stored reading, for `changes_since`"""
+    
+    @abstractmethod
+    async def changes_since(
+        self,
+        cursor: Any,
+        since: datetime,
+        limit: int,
+        device_id: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[dict], Any, bool]:
+        """The first `limit` readings stored after `cursor` with timestamps in [since, until), oldest first
+        
+        Also returns the cursor to continue from and whether more readings are
+        waiting after it. Backends without a strict storage order may repeat
+        readings stored shortly before `cursor`; the (device_id, timestamp) key
+        makes that harmless.
+        """
+    
+    @abstractmethod
+    async def history(self, since: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        """Readings since `since`, newest first, optionally for one device"""
+    
+    async def stats(self, since: datetime) -> Optional[dict]:
+        """avg/min/max per sensor field and `total_readings` since `since`"""
+        return (await self.stats_windows({"window": since}))["window"]
+    
+    @abstractmethod
+    async def stats_windows(self, windows: Dict[str, datetime]) -> Dict[str, Optional[dict]]:
+        """`stats` for several windows ending now, computed in a single scan of the widest"""
+    
+    @abstractmethod
+    def scan_columns(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        batch_size: int = 50000
+    ) -> AsyncIterator[Dict[str, Sequence]]:
+        """Readings in [since, until) in timestamp order, as batches of SCAN_COLUMNS sequences
+        
+        Timestamps are epoch seconds, so batches can go straight into arrays.
+        """
+
+
+class AlertRepository(ABC):
+    """Storage for alerts"""
+    
+    @abstractmethod
+    async def insert(self, doc: dict, notification: Optional[dict] = None) -> str:
+        """Insert an alert; returns its id
+        
+        With a `notification` ({"channel", "recipient"}), an outbox message for
+        it is written atomically with the alert (see `OutboxRepository`).
+        """
+    
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]) -> int:
+        """Bulk-load alerts, updating the counters once per batch; returns the number inserted"""
+    
+    @abstractmethod
+    async def set_email_sent(self, alert_id: str, email_sent: bool):
+        """Record the email status of an alert"""
+    
+    @abstractmethod
+    async def set_email_sent_many(self, alert_ids: List[str], email_sent: bool) -> int:
+        """Record the email status of several alerts in one write; returns the number updated"""
+    
+    @abstractmethod
+    async def find(
+        self,
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        limit: int = 50,
+        device_id: Optional[str] = None
+    ) -> List[dict]:
+        """Alerts, newest first"""
+    
+    @abstractmethod
+    async def changes(
+        self,
+        since: datetime,
+        until: datetime,
+        limit: int,
+        device_id: Optional[str] = None
+    ) -> Tuple[List[dict], List[str]]:
+        """Up to `limit` alerts created or updated in [since, until), and ids of alerts deleted then
+        
+        Deletions are remembered for SYNC_TOMBSTONE_RETENTION_HOURS.
+        """
+    
+    @abstractmethod
+    async def summary(self, since: datetime) -> dict:
+        """Alert totals and breakdowns since `since`
+        
+        Whole hours come from the hourly counters; the part of the hour `since`
+        falls in is counted from the alerts themselves.
+        """
+    
+    @abstractmethod
+    async def rebuild_counters(self) -> Optional[int]:
+        """Recompute the hourly counters from the alerts themselves without losing concurrent updates
+        
+        Returns the number of buckets, or None when another worker is already rebuilding them.
+        """
+    
+    @abstractmethod
+    async def resolve(self, alert_id: str) -> bool:
+        """Mark an alert as resolved; returns False if not found"""
+    
+    @abstractmethod
+    async def delete(self, alert_id: str) -> bool:
+        """Delete an alert; returns False if not found"""
+    
+    @abstractmethod
+    async def resolve_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> int:
+        """Resolve every open alert matching the filter in one write; returns the number resolved"""
+    
+    @abstractmethod
+    async def delete_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> int:
+        """Delete every alert matching the filter in one write; returns the number deleted"""
+
+
+class SettingsRepository(ABC):
+    """Storage for system settings documents"""
+    
+    @abstractmethod
+    async def get(self, setting_type: str = "system") -> Optional[dict]:
+        """Settings document, if any"""
+    
+    @abstractmethod
+    async def insert(self, doc: dict) -> dict:
+        """Insert a settings document; returns it with its id"""
+    
+    @abstractmethod
+    async def update(
+        self,
+        fields: dict,
+        setting_type: str = "system",
+        upsert: bool = False,
+        expected_version: Optional[int] = None
+    ) -> Optional[dict]:
+        """Atomically set (dotted-path) fields and bump `version`; returns the updated document
+        
+        With `expected_version`, raises VersionConflictError unless the stored
+        document is at that version. Returns None when there is no document
+        and `upsert` is False.
+        """
+
+
+class OutboxRepository(ABC):
+    """Notifications waiting to be sent, written in the same write as their alerts
+    
+    Messages hold a snapshot of the alert, so they can be sent without reading
+    it back. A claimed message is leased to its dispatcher; if that dispatcher
+    dies, the message becomes due again when the lease runs out. Messages
+    that run out of attempts stay behind as dead letters.
+    """
+    
+    @abstractmethod
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[dict]:
+        """Lease up to `limit` due messages to `owner`, longest waiting first"""
+    
+    @abstractmethod
+    async def complete(self, message_ids: List[str]) -> int:
+        """Remove delivered messages; returns the number removed"""
+    
+    @abstractmethod
+    async def fail(self, failures: List[Tuple[str, str, Optional[datetime]]]) -> int:
+        """Record failed attempts as `(message_id, error, retry_at)`; a `retry_at` of None makes a dead letter"""
+    
+    @abstractmethod
+    async def dead_letters(self, limit: int) -> List[dict]:
+        """Messages that ran out of attempts, most recently failed first"""
+    
+    @abstractmethod
+    async def requeue(self, message_id: str) -> bool:
+        """Make a dead letter due again with a fresh set of attempts; returns False if not found"""
+    
+    @abstractmethod
+    async def delete(self, message_id: str) -> bool:
+        """Discard a message; returns False if not found"""
+    
+    @abstractmethod
+    async def counts(self) -> Dict[str, int]:
+        """Number of `pending` and `dead` messages"""
+
+
+class CheckpointRepository(ABC):
+    """Named blobs of in-memory service state, saved so restarts resume warm"""
+    
+    @abstractmethod
+    async def save(self, name: str, data: dict):
+        """Replace the checkpoint `name`"""
+    
+    @abstractmethod
+    async def load(self, name: str) -> Optional[dict]:
+        """Checkpoint `name`, if any"""
+
+
+class SketchRepository(ABC):
+    """Serialized quantile sketches, one per (device, metric, hour) and writer"""
+    
+    @abstractmethod
+    async def save_many(self, docs: List[dict]):
+        """Insert or replace sketches by `_id`; each has hour, device_id, metric, count and data"""
+    
+    @abstractmethod
+    async def find(self, since: datetime, device_id: Optional[str] = None) -> List[dict]:
+        """Sketches for hours starting at or after `since`"""
+
+
+class ValveRepository(ABC):
+    """Valve state per device, shared by every worker so only one of them sends each irrigation command"""
+    
+    @abstractmethod
+    async def claim_open(
+        self,
+        device_id: str,
+        now: datetime,
+        open_until: datetime,
+        busy_until: datetime,
+        force: bool = False
+    ) -> bool:
+        """Atomically mark the valve open and the device busy, unless it is still busy at `now`
+        
+        Returns True if this caller made the change and should send the command.
+        """
+    
+    @abstractmethod
+    async def claim_close(self, device_id: str, now: datetime, busy_until: datetime, force: bool = False) -> bool:
+        """Atomically mark the valve closed and the device busy, if the valve is open at `now`"""
+    
+    @abstractmethod
+    async def release(self, device_id: str):
+        """Forget the device's valve state, so that the next reading may water again"""
+
+
+class Storage(ABC):
+    """A storage backend bundling the sensor data, alert and settings repositories"""
+    
+    name: str = "base"
+    sensor_data: SensorDataRepository
+    alerts: AlertRepository
+    outbox: OutboxRepository
+    settings: SettingsRepository
+    checkpoints: CheckpointRepository
+    sketches: SketchRepository
+    valves: ValveRepository
+    
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """Whether `connect` has completed"""
+    
+    @property
+    def is_ready(self) -> bool:
+        """Whether the backend is connected and any background setup has finished"""
+        return self.is_connected
+    
+    @property
+    def index_failures(self) -> Dict[str, str]:
+        """Indexes that could not be built (collection -> error); queries still work, only slower"""
+        return {}
+    
+    @abstractmethod
+    async def connect(self):
+        """Open connections and create indexes/tables"""
+    
+    @abstractmethod
+    async def close(self):
+        """Close connections"""
+    
+    @abstractmethod
+    async def ping(self):
+        """Raise if the backend is unreachable"""
@@ -0,0 +1,568 @@
+import bisect
+import copy
+import itertools
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from app.config import settings
+from app.storage.base import (
+    SENSOR_FIELDS,
+    SCAN_COLUMNS,
+    AlertRepository,
+    CheckpointRepository,
+    OutboxRepository,
+    SensorDataRepository,
+    SettingsRepository,
+    SketchRepository,
+    Storage,
+    ValveRepository,
+    VersionConflictError,
+    epoch_seconds,
+    hour_bucket,
+    next_hour_bucket,
+    set_paths,
+    alert_counter_deltas,
+    outbox_message,
+    summarize_alert_counters,
+)
+
+
+class MemorySensorDataRepository(SensorDataRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        self._ids = itertools.count(1)
+        # Kept sorted by (timestamp, device_id) for range scans
+        self._keys: List[Tuple[datetime, str]] = []
+        self._docs: List[dict] = []
+        self._last_id = 0
+    
+    def _upsert_locked(self, doc: dict) -> bool:
+        key = (doc["timestamp"], doc["device_id"])
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return False
+        self._last_id = next(self._ids)
+        stored = dict(doc, _id=str(self._last_id))
+        self._keys.insert(index, key)
+        self._docs.insert(index, stored)
+        return True
+    
+    async def upsert(self, doc: dict) -> bool:
+        with self._lock:
+            return self._upsert_locked(doc)
+    
+    async def upsert_many(self, docs: List[dict]) -> List[bool]:
+        with self._lock:
+            return [self._upsert_locked(doc) for doc in docs]
+    
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        with self._lock:
+            return [doc for doc in docs if self._upsert_locked(doc)]
+    
+    async def delete_range(self, since: datetime, until: datetime, received_before: Optional[datetime] = None) -> int:
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (since, ""))
+            end = bisect.bisect_left(self._keys, (until, ""))
+            kept = [
+                (key, doc) for key, doc in zip(self._keys[start:end], self._docs[start:end])
+                if received_before is not None and (doc.get("received_at") or received_before) > received_before
+            ]
+            self._keys[start:end] = [key for key, _ in kept]
+            self._docs[start:end] = [doc for _, doc in kept]
+            return end - start - len(kept)
+    
+    def _since_locked(self, since: datetime) -> List[dict]:
+        start = bisect.bisect_left(self._keys, (since, ""))
+        return self._docs[start:]
+    
+    async def latest(self) -> Optional[dict]:
+        with self._lock:
+            return dict(self._docs[-1]) if self._docs else None
+    
+    async def sync_cursor(self) -> int:
+        with self._lock:
+            return self._last_id
+    
+    async def changes_since(
+        self,
+        cursor: int,
+        since: datetime,
+        limit: int,
+        device_id: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[dict], int, bool]:
+        with self._lock:
+            docs = [
+                doc for doc in self._since_locked(since)
+                if int(doc["_id"]) > cursor
+                and (device_id is None or doc["device_id"] == device_id)
+                and (until is None or doc["timestamp"] < until)
+            ]
+            docs.sort(key=lambda doc: int(doc["_id"]))
+            if len(docs) > limit:
+                return [dict(doc) for doc in docs[:limit]], int(docs[limit - 1]["_id"]), True
+            return [dict(doc) for doc in docs], self._last_id, False
+    
+    async def history(self, since: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            docs = self._since_locked(since)
+            if device_id is not None:
+                docs = [doc for doc in docs if doc["device_id"] == device_id]
+            return [dict(doc) for doc in reversed(docs[-limit:])]
+    
+    async def stats_windows(self, windows: Dict[str, datetime]) -> Dict[str, Optional[dict]]:
+        # Windows all end now, so each is a suffix of the widest: walk it newest
+        # first and snapshot the running aggregates as each window's start is passed
+        bounds = sorted(windows.items(), key=lambda item: item[1], reverse=True)
+        results: Dict[str, Optional[dict]] = {name: None for name in windows}
+        count = 0
+        sums = {field: 0.0 for field in SENSOR_FIELDS}
+        mins: Dict[str, float] = {}
+        maxs: Dict[str, float] = {}
+        
+        def snapshot() -> Optional[dict]:
+            if not count:
+                return None
+            stats = {"total_readings": count}
+            for field in SENSOR_FIELDS:
+                stats[f"avg_{field}"] = sums[field] / count
+                stats[f"min_{field}"] = mins[field]
+                stats[f"max_{field}"] = maxs[field]
+            return stats
+        
+        with self._lock:
+            docs = self._since_locked(min(windows.values())) if windows else []
+            position = 0
+            for doc in reversed(docs):
+                while position < len(bounds) and doc["timestamp"] < bounds[position][1]:
+                    results[bounds[position][0]] = snapshot()
+                    position += 1
+                count += 1
+                for field in SENSOR_FIELDS:
+                    value = doc[field]
+                    sums[field] += value
+                    mins[field] = min(mins.get(field, value), value)
+                    maxs[field] = max(maxs.get(field, value), value)
+            for name, _ in bounds[position:]:
+                results[name] = snapshot()
+        return results
+    
+    async def scan_columns(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        batch_size: int = 50000
+    ) -> AsyncIterator[Dict[str, Sequence]]:
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (since, ""))
+            end = bisect.bisect_left(self._keys, (until, ""))
+            docs = [doc for doc in self._docs[start:end] if device_id is None or doc["device_id"] == device_id]
+        for offset in range(0, len(docs), batch_size):
+            batch = docs[offset:offset + batch_size]
+            columns = {column: [doc[column] for doc in batch] for column in SCAN_COLUMNS}
+            columns["timestamp"] = [epoch_seconds(timestamp) for timestamp in columns["timestamp"]]
+            yield columns
+
+
+class MemoryAlertRepository(AlertRepository):
+    
+    def __init__(self, lock: threading.RLock, outbox: "MemoryOutboxRepository"):
+        self._lock = lock
+        self._outbox = outbox
+        self._ids = itertools.count(1)
+        self._alerts: Dict[str, dict] = {}
+        self._counters: Dict[datetime, Counter] = defaultdict(Counter)
+        # (deleted_at, alert_id, device_id) in deletion order
+        self._tombstones: List[Tuple[datetime, str, Optional[str]]] = []
+    
+    def _count_locked(self, alert: dict, deltas: Dict[str, int]):
+        self._counters[hour_bucket(alert["timestamp"])].update(deltas)
+    
+    async def insert(self, doc: dict, notification: Optional[dict] = None) -> str:
+        now = datetime.utcnow()
+        with self._lock:
+            alert_id = str(next(self._ids))
+            self._alerts[alert_id] = dict(doc, _id=alert_id, updated_at=now)
+            if notification is not None:
+                self._outbox.add_locked(outbox_message(alert_id, doc, notification, now))
+            self._count_locked(doc, alert_counter_deltas(doc))
+            return alert_id
+    
+    async def insert_many(self, docs: List[dict]) -> int:
+        now = datetime.utcnow()
+        with self._lock:
+            for doc in docs:
+                alert_id = str(next(self._ids))
+                self._alerts[alert_id] = dict(doc, _id=alert_id, updated_at=doc.get("updated_at", now))
+                self._count_locked(doc, alert_counter_deltas(doc))
+        return len(docs)
+    
+    async def set_email_sent(self, alert_id: str, email_sent: bool):
+        with self._lock:
+            if alert_id in self._alerts:
+                self._alerts[alert_id]["email_sent"] = email_sent
+                self._alerts[alert_id]["updated_at"] = datetime.utcnow()
+    
+    async def set_email_sent_many(self, alert_ids: List[str], email_sent: bool) -> int:
+        now = datetime.utcnow()
+        with self._lock:
+            updated = [self._alerts[alert_id] for alert_id in alert_ids if alert_id in self._alerts]
+            for alert in updated:
+                alert.update(email_sent=email_sent, updated_at=now)
+            return len(updated)
+    
+    def _matching(
+        self,
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        device_id: Optional[str] = None,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> List[dict]:
+        if unresolved_only:
+            is_resolved = False
+        return [
+            alert for alert in self._alerts.values()
+            if (since is None or alert["timestamp"] >= since)
+            and (until is None or alert["timestamp"] < until)
+            and (is_resolved is None or alert["is_resolved"] == is_resolved)
+            and (device_id is None or alert.get("device_id") == device_id)
+            and (not alert_types or alert["alert_type"] in alert_types)
+            and (not severities or alert["severity"] in severities)
+        ]
+    
+    async def find(
+        self,
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        limit: int = 50,
+        device_id: Optional[str] = None
+    ) -> List[dict]:
+        with self._lock:
+            alerts = sorted(
+                self._matching(since, unresolved_only, device_id),
+                key=lambda alert: alert["timestamp"],
+                reverse=True
+            )
+            return [dict(alert) for alert in alerts[:limit]]
+    
+    async def changes(
+        self,
+        since: datetime,
+        until: datetime,
+        limit: int,
+        device_id: Optional[str] = None
+    ) -> Tuple[List[dict], List[str]]:
+        with self._lock:
+            alerts = sorted(
+                (
+                    alert for alert in self._alerts.values()
+                    if since <= alert["updated_at"] < until
+                    and (device_id is None or alert.get("device_id") == device_id)
+                ),
+                key=lambda alert: alert["updated_at"]
+            )
+            deleted = [
+                alert_id for deleted_at, alert_id, alert_device in self._tombstones
+                if since <= deleted_at < until and (device_id is None or alert_device == device_id)
+            ]
+            return [dict(alert) for alert in alerts[:limit]], deleted[:limit]
+    
+    async def summary(self, since: datetime) -> dict:
+        start = next_hour_bucket(since)
+        with self._lock:
+            total = Counter()
+            for bucket, counters in self._counters.items():
+                if bucket >= start:
+                    total.update(counters)
+            for alert in self._matching(since, until=start):
+                total.update(alert_counter_deltas(alert))
+        return summarize_alert_counters(total)
+    
+    async def rebuild_counters(self) -> Optional[int]:
+        with self._lock:
+            self._counters = defaultdict(Counter)
+            for alert in self._alerts.values():
+                self._count_locked(alert, alert_counter_deltas(alert))
+            return len(self._counters)
+    
+    def _resolve_locked(self, alert: dict, now: datetime):
+        alert["is_resolved"] = True
+        alert["resolved_at"] = now
+        alert["updated_at"] = now
+        self._count_locked(alert, {"unresolved": -1})
+    
+    def _bury_locked(self, alerts: List[dict]):
+        """Remember deleted alerts for sync, forgetting ones past the retention"""
+        now = datetime.utcnow()
+        self._tombstones.extend((now, alert["_id"], alert.get("device_id")) for alert in alerts)
+        expired = now - timedelta(hours=settings.SYNC_TOMBSTONE_RETENTION_HOURS)
+        self._tombstones = self._tombstones[bisect.bisect_left(self._tombstones, (expired,)):]
+    
+    async def resolve(self, alert_id: str) -> bool:
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            if alert is None or alert["is_resolved"]:
+                return False
+            self._resolve_locked(alert, datetime.utcnow())
+            return True
+    
+    async def delete(self, alert_id: str) -> bool:
+        with self._lock:
+            alert = self._alerts.pop(alert_id, None)
+            if alert is None:
+                return False
+            self._count_locked(alert, alert_counter_deltas(alert, -1))
+            self._bury_locked([alert])
+            return True
+    
+    async def resolve_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> int:
+        with self._lock:
+            now = datetime.utcnow()
+            alerts = self._matching(since, True, device_id, alert_types, severities, until)
+            for alert in alerts:
+                self._resolve_locked(alert, now)
+            return len(alerts)
+    
+    async def delete_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> int:
+        with self._lock:
+            alerts = self._matching(since, False, device_id, alert_types, severities, until, is_resolved)
+            for alert in alerts:
+                del self._alerts[alert["_id"]]
+                self._count_locked(alert, alert_counter_deltas(alert, -1))
+            self._bury_locked(alerts)
+            return len(alerts)
+
+
+class MemorySettingsRepository(SettingsRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        self._ids = itertools.count(1)
+        self._settings: Dict[str, dict] = {}
+    
+    async def get(self, setting_type: str = "system") -> Optional[dict]:
+        with self._lock:
+            doc = self._settings.get(setting_type)
+            return copy.deepcopy(doc) if doc else None
+    
+    async def insert(self, doc: dict) -> dict:
+        with self._lock:
+            stored = copy.deepcopy(dict(doc, _id=str(next(self._ids))))
+            self._settings[stored["setting_type"]] = stored
+            return copy.deepcopy(stored)
+    
+    async def update(
+        self,
+        fields: dict,
+        setting_type: str = "system",
+        upsert: bool = False,
+        expected_version: Optional[int] = None
+    ) -> Optional[dict]:
+        with self._lock:
+            doc = self._settings.get(setting_type)
+            if doc is None:
+                if not upsert or expected_version is not None:
+                    return None
+                doc = self._settings[setting_type] = {
+                    "_id": str(next(self._ids)),
+                    "setting_type": setting_type
+                }
+            elif expected_version is not None and doc.get("version", 0) != expected_version:
+                raise VersionConflictError(f"{setting_type} settings changed since version {expected_version}")
+            set_paths(doc, copy.deepcopy(fields))
+            doc["version"] = doc.get("version", 0) + 1
+            return copy.deepcopy(doc)
+
+
+class MemoryOutboxRepository(OutboxRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        self._ids = itertools.count(1)
+        self._messages: Dict[str, dict] = {}
+    
+    def add_locked(self, message: dict):
+        message_id = str(next(self._ids))
+        self._messages[message_id] = dict(message, _id=message_id)
+    
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[dict]:
+        now = datetime.utcnow()
+        with self._lock:
+            due = sorted(
+                (
+                    message for message in self._messages.values()
+                    if not message["dead"] and message["available_at"] <= now
+                ),
+                key=lambda message: message["available_at"]
+            )[:limit]
+            for message in due:
+                message.update(lease_owner=owner, available_at=now + timedelta(seconds=lease_seconds))
+            return sorted((copy.deepcopy(message) for message in due), key=lambda message: message["created_at"])
+    
+    async def complete(self, message_ids: List[str]) -> int:
+        with self._lock:
+            return sum(self._messages.pop(message_id, None) is not None for message_id in message_ids)
+    
+    async def fail(self, failures: List[Tuple[str, str, Optional[datetime]]]) -> int:
+        now = datetime.utcnow()
+        updated = 0
+        with self._lock:
+            for message_id, error, retry_at in failures:
+                message = self._messages.get(message_id)
+                if message is None:
+                    continue
+                message.update(
+                    attempts=message["attempts"] + 1,
+                    last_error=error,
+                    failed_at=now,
+                    available_at=retry_at or now,
+                    lease_owner=None,
+                    dead=retry_at is None
+                )
+                updated += 1
+        return updated
+    
+    async def dead_letters(self, limit: int) -> List[dict]:
+        with self._lock:
+            dead = [message for message in self._messages.values() if message["dead"]]
+            dead.sort(key=lambda message: message["failed_at"], reverse=True)
+            return copy.deepcopy(dead[:limit])
+    
+    async def requeue(self, message_id: str) -> bool:
+        with self._lock:
+            message = self._messages.get(message_id)
+            if message is None or not message["dead"]:
+                return False
+            message.update(dead=False, attempts=0, available_at=datetime.utcnow(), lease_owner=None)
+            return True
+    
+    async def delete(self, message_id: str) -> bool:
+        with self._lock:
+            return self._messages.pop(message_id, None) is not None
+    
+    async def counts(self) -> Dict[str, int]:
+        with self._lock:
+            dead = sum(message["dead"] for message in self._messages.values())
+            return {"pending": len(self._messages) - dead, "dead": dead}
+
+
+class MemoryCheckpointRepository(CheckpointRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        self._checkpoints: Dict[str, dict] = {}
+    
+    async def save(self, name: str, data: dict):
+        with self._lock:
+            self._checkpoints[name] = copy.deepcopy(data)
+    
+    async def load(self, name: str) -> Optional[dict]:
+        with self._lock:
+            data = self._checkpoints.get(name)
+            return copy.deepcopy(data) if data is not None else None
+
+
+class MemoryValveRepository(ValveRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        # device_id -> {"open_until", "busy_until"}
+        self._valves: Dict[str, dict] = {}
+    
+    async def claim_open(
+        self,
+        device_id: str,
+        now: datetime,
+        open_until: datetime,
+        busy_until: datetime,
+        force: bool = False
+    ) -> bool:
+        with self._lock:
+            valve = self._valves.get(device_id)
+            if not force and valve is not None and valve["busy_until"] > now:
+                return False
+            self._valves[device_id] = {"open_until": open_until, "busy_until": busy_until}
+            return True
+    
+    async def claim_close(self, device_id: str, now: datetime, busy_until: datetime, force: bool = False) -> bool:
+        with self._lock:
+            valve = self._valves.get(device_id)
+            is_open = valve is not None and valve["open_until"] is not None and valve["open_until"] > now
+            if not force and not is_open:
+                return False
+            self._valves[device_id] = {"open_until": None, "busy_until": busy_until}
+            return True
+    
+    async def release(self, device_id: str):
+        with self._lock:
+            self._valves.pop(device_id, None)
+
+
+class MemorySketchRepository(SketchRepository):
+    
+    def __init__(self, lock: threading.RLock):
+        self._lock = lock
+        self._sketches: Dict[str, dict] = {}
+    
+    async def save_many(self, docs: List[dict]):
+        with self._lock:
+            for doc in docs:
+                self._sketches[doc["_id"]] = dict(doc)
+    
+    async def find(self, since: datetime, device_id: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            return [
+                dict(doc) for doc in self._sketches.values()
+                if doc["hour"] >= since and (device_id is None or doc["device_id"] == device_id)
+            ]
+
+
+class MemoryStorage(Storage):
+    """In-process backend for tests and benchmarks; nothing is persisted"""
+    
+    name = "memory"
+    
+    def __init__(self):
+        lock = threading.RLock()
+        self.sensor_data = MemorySensorDataRepository(lock)
+        self.outbox = MemoryOutboxRepository(lock)
+        self.alerts = MemoryAlertRepository(lock, self.outbox)
+        self.settings = MemorySettingsRepository(lock)
+        self.checkpoints = MemoryCheckpointRepository(lock)
+        self.sketches = MemorySketchRepository(lock)
+        self.valves = MemoryValveRepository(lock)
+        self._connected = False
+    
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+    
+    async def connect(self):
+        self._connected = True
+    
+    async def close(self):
+        self._connected = False
+    
+    async def ping(self):
+        pass
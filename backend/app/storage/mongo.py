@@ -0,0 +1,824 @@
+import asyncio
+from bson import ObjectId
+from bson.errors import InvalidId
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.config import settings
+from app.database import Database
+from app.storage.base import (
+    SENSOR_FIELDS,
+    SCAN_COLUMNS,
+    EPOCH,
+    AlertRepository,
+    CheckpointRepository,
+    OutboxRepository,
+    SensorDataRepository,
+    SettingsRepository,
+    SketchRepository,
+    Storage,
+    StorageUnavailableError,
+    ValveRepository,
+    VersionConflictError,
+    epoch_seconds,
+    hour_bucket,
+    next_hour_bucket,
+    alert_counter_deltas,
+    outbox_message,
+    summarize_alert_counters,
+)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Only one worker at a time recomputes the alert counters
+COUNTER_REBUILD_LEASE = "alert_counter_rebuild"
+COUNTER_REBUILD_LEASE_SECONDS = 600
+
+# Group stage key for the hour an alert falls in (works on every MongoDB version)
+ALERT_HOUR_GROUP = {
+    "year": {"$year": "$timestamp"},
+    "month": {"$month": "$timestamp"},
+    "day": {"$dayOfMonth": "$timestamp"},
+    "hour": {"$hour": "$timestamp"},
+}
+
+
+def _with_str_id(doc: Optional[dict]) -> Optional[dict]:
+    if doc and "_id" in doc:
+        doc["_id"] = str(doc["_id"])
+    return doc
+
+
+def _object_id(value: str) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _flat_counters(doc: Optional[dict]) -> Dict[str, int]:
+    """Non-zero counters of an hourly counter document, as `alert_counter_deltas` keys"""
+    counters = {}
+    for key, value in (doc or {}).items():
+        if isinstance(value, dict):
+            counters.update({f"{key}.{name}": count for name, count in value.items() if count})
+        elif key not in ("_id", "revision") and value:
+            counters[key] = value
+    return counters
+
+
+def _counter_document(bucket: datetime, counters: Dict[str, int], revision: int) -> dict:
+    doc = {"_id": bucket, "revision": revision}
+    for key, value in counters.items():
+        group, _, name = key.partition(".")
+        if name:
+            doc.setdefault(group, {})[name] = value
+        else:
+            doc[key] = value
+    return doc
+
+
+def _sync_head() -> datetime:
+    """Whole second before which stored ObjectIds are settled (writes still in flight may have older ids)"""
+    return (datetime.utcnow() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)).replace(microsecond=0)
+
+
+def sensor_data_key(doc: dict) -> dict:
+    """Natural key of a reading; upserting on it makes ingestion idempotent"""
+    return {"device_id": doc["device_id"], "timestamp": doc["timestamp"]}
+
+
+class MongoSensorDataRepository(SensorDataRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().sensor_data
+    
+    @property
+    def read_collection(self):
+        return Database.get_read_db().sensor_data
+    
+    async def upsert(self, doc: dict) -> bool:
+        try:
+            result = await self.collection.update_one(
+                sensor_data_key(doc), {"$setOnInsert": doc}, upsert=True
+            )
+            return result.upserted_id is not None
+        except DuplicateKeyError:
+            # Lost a concurrent upsert race with another worker
+            return False
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
+    
+    async def upsert_many(self, docs: List[dict]) -> List[bool]:
+        requests = [
+            UpdateOne(sensor_data_key(doc), {"$setOnInsert": doc}, upsert=True)
+            for doc in docs
+        ]
+        new = [False] * len(docs)
+        offset = 0
+        while offset < len(requests):
+            try:
+                result = await self.collection.bulk_write(requests[offset:], ordered=True)
+                for index in result.upserted_ids:
+                    new[offset + index] = True
+                return new
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if not errors or errors[0].get("code") != DUPLICATE_KEY_ERROR:
+                    raise StorageUnavailableError(str(e)) from e
+                # Concurrent upsert of the same reading: already stored, carry on
+                for upserted in e.details.get("upserted", []):
+                    new[offset + upserted["index"]] = True
+                offset += errors[0]["index"] + 1
+            except PyMongoError as e:
+                raise StorageUnavailableError(str(e)) from e
+        return new
+    
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        if not docs:
+            return []
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+            return docs
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise StorageUnavailableError(str(e)) from e
+            # Unordered: everything except the duplicates was inserted
+            duplicates = {error["index"] for error in errors}
+            return [doc for index, doc in enumerate(docs) if index not in duplicates]
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
+    
+    async def delete_range(self, since: datetime, until: datetime, received_before: Optional[datetime] = None) -> int:
+        query = {"timestamp": {"$gte": since, "$lt": until}}
+        if received_before is not None:
+            # Readings without received_at predate it and count as received
+            query["received_at"] = {"$not": {"$gt": received_before}}
+        try:
+            result = await self.collection.delete_many(query)
+            return result.deleted_count
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
+    
+    async def latest(self) -> Optional[dict]:
+        return _with_str_id(await self.read_collection.find_one(sort=[("timestamp", -1)]))
+    
+    async def sync_cursor(self) -> int:
+        return int(epoch_seconds(_sync_head()))
+    
+    async def changes_since(
+        self,
+        cursor: int,
+        since: datetime,
+        limit: int,
+        device_id: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[dict], int, bool]:
+        # ObjectIds begin with their creation second, so this is an _id index range
+        # scan. Sync reads go to the primary: a lagging secondary could skip readings.
+        head = _sync_head()
+        query = {
+            "_id": {
+                "$gte": ObjectId.from_datetime(EPOCH + timedelta(seconds=cursor)),
+                "$lt": ObjectId.from_datetime(head),
+            },
+            "timestamp": {"$gte": since},
+        }
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+        if device_id is not None:
+            query["device_id"] = device_id
+        docs = await self.collection.find(query).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+        has_more = len(docs) > limit
+        if has_more:
+            # Cursors are whole seconds: continue from the last one returned,
+            # repeating the readings of that second already sent
+            docs = docs[:limit]
+            head = docs[-1]["_id"].generation_time.replace(tzinfo=None)
+        return [_with_str_id(doc) for doc in docs], int(epoch_seconds(head)), has_more
+    
+    async def history(self, since: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        query = {"timestamp": {"$gte": since}}
+        if device_id is not None:
+            query["device_id"] = device_id
+        cursor = self.read_collection.find(query).sort("timestamp", -1).limit(limit)
+        return [_with_str_id(doc) for doc in await cursor.to_list(length=limit)]
+    
+    async def stats_windows(self, windows: Dict[str, datetime]) -> Dict[str, Optional[dict]]:
+        # One $match on the widest window; each window's aggregates only take
+        # readings inside it through conditional accumulators ($avg/$min/$max skip nulls)
+        group = {"_id": None}
+        for index, since in enumerate(windows.values()):
+            inside = {"$gte": ["$timestamp", since]}
+            group[f"w{index}_total_readings"] = {"$sum": {"$cond": [inside, 1, 0]}}
+            for field in SENSOR_FIELDS:
+                value = {"$cond": [inside, f"${field}", None]}
+                group[f"w{index}_avg_{field}"] = {"$avg": value}
+                group[f"w{index}_min_{field}"] = {"$min": value}
+                group[f"w{index}_max_{field}"] = {"$max": value}
+        
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": min(windows.values())}}},
+            {"$group": group}
+        ]
+        result = await self.read_collection.aggregate(pipeline).to_list(length=1)
+        
+        results = {}
+        for index, name in enumerate(windows):
+            row = result[0] if result else {}
+            prefix = f"w{index}_"
+            if not row.get(f"{prefix}total_readings"):
+                results[name] = None
+                continue
+            results[name] = {
+                key[len(prefix):]: value for key, value in row.items() if key.startswith(prefix)
+            }
+        return results
+    
+    async def scan_columns(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        batch_size: int = 50000
+    ) -> AsyncIterator[Dict[str, Sequence]]:
+        query = {"timestamp": {"$gte": since, "$lt": until}}
+        if device_id is not None:
+            query["device_id"] = device_id
+        cursor = self.read_collection.find(
+            query, {column: 1 for column in SCAN_COLUMNS} | {"_id": 0}, batch_size=batch_size
+        ).sort("timestamp", 1)
+        
+        columns = {column: [] for column in SCAN_COLUMNS}
+        async for doc in cursor:
+            for column in SCAN_COLUMNS:
+                columns[column].append(doc[column])
+            if len(columns["timestamp"]) >= batch_size:
+                columns["timestamp"] = [epoch_seconds(timestamp) for timestamp in columns["timestamp"]]
+                yield columns
+                columns = {column: [] for column in SCAN_COLUMNS}
+        if columns["timestamp"]:
+            columns["timestamp"] = [epoch_seconds(timestamp) for timestamp in columns["timestamp"]]
+            yield columns
+
+
+class MongoAlertRepository(AlertRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().alerts
+    
+    @property
+    def counters(self):
+        return Database.get_db().alert_counters
+    
+    @property
+    def read_collection(self):
+        return Database.get_read_db().alerts
+    
+    @property
+    def read_counters(self):
+        return Database.get_read_db().alert_counters
+    
+    @property
+    def tombstones(self):
+        return Database.get_db().alert_tombstones
+    
+    @property
+    def leases(self):
+        return Database.get_db().leases
+    
+    async def _count(self, changes: Iterable[tuple]):
+        """Apply `(timestamp, deltas)` pairs to the hourly counter documents with `$inc`
+        
+        Every update also bumps the bucket's `revision`, which `rebuild_counters`
+        uses to leave alone buckets that changed while it was computing them.
+        """
+        buckets: Dict[datetime, Counter] = defaultdict(Counter)
+        for timestamp, deltas in changes:
+            buckets[hour_bucket(timestamp)].update(deltas)
+        requests = [
+            UpdateOne(
+                {"_id": bucket},
+                {"$inc": {**{key: value for key, value in deltas.items() if value}, "revision": 1}},
+                upsert=True
+            )
+            for bucket, deltas in buckets.items()
+            if any(deltas.values())
+        ]
+        if requests:
+            await self.counters.bulk_write(requests, ordered=False)
+    
+    async def _grouped_changes(self, query: dict, sign: int) -> List[tuple]:
+        """Counter changes for every alert matching `query`, grouped server-side by hour"""
+        group_key = dict(ALERT_HOUR_GROUP)
+        group_key.update({
+            "alert_type": "$alert_type",
+            "severity": "$severity",
+            "device_id": "$device_id",
+            "is_resolved": "$is_resolved",
+        })
+        pipeline = [
+            {"$match": query},
+            {"$group": {"_id": group_key, "count": {"$sum": 1}}}
+        ]
+        changes = []
+        async for group in self.collection.aggregate(pipeline):
+            key = group["_id"]
+            timestamp = datetime(key["year"], key["month"], key["day"], key["hour"])
+            changes.append((timestamp, alert_counter_deltas(key, sign * group["count"])))
+        return changes
+    
+    @property
+    def outbox(self):
+        return Database.get_db().notification_outbox
+    
+    async def insert(self, doc: dict, notification: Optional[dict] = None) -> str:
+        now = datetime.utcnow()
+        doc = dict(doc, _id=ObjectId(), updated_at=now)
+        if notification is None:
+            await self.collection.insert_one(doc)
+        elif Database.supports_transactions:
+            message = outbox_message(str(doc["_id"]), doc, notification, now)
+            async with await Database.client.start_session() as session:
+                async with session.start_transaction():
+                    await self.collection.insert_one(doc, session=session)
+                    await self.outbox.insert_one(message, session=session)
+        else:
+            # Standalone server: the message goes first, so a crash in between
+            # can at worst notify about an alert that was never stored, never
+            # leave a stored alert nobody is told about
+            await self.outbox.insert_one(outbox_message(str(doc["_id"]), doc, notification, now))
+            await self.collection.insert_one(doc)
+        await self._count([(doc["timestamp"], alert_counter_deltas(doc))])
+        return str(doc["_id"])
+    
+    async def insert_many(self, docs: List[dict]) -> int:
+        if not docs:
+            return 0
+        now = datetime.utcnow()
+        docs = [dict(doc, updated_at=doc.get("updated_at", now)) for doc in docs]
+        try:
+            result = await self.collection.insert_many(docs, ordered=False)
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
+        await self._count((doc["timestamp"], alert_counter_deltas(doc)) for doc in docs)
+        return len(result.inserted_ids)
+    
+    async def set_email_sent(self, alert_id: str, email_sent: bool):
+        await self.collection.update_one(
+            {"_id": _object_id(alert_id)},
+            {"$set": {"email_sent": email_sent, "updated_at": datetime.utcnow()}}
+        )
+    
+    async def set_email_sent_many(self, alert_ids: List[str], email_sent: bool) -> int:
+        object_ids = [object_id for object_id in map(_object_id, alert_ids) if object_id is not None]
+        if not object_ids:
+            return 0
+        result = await self.collection.update_many(
+            {"_id": {"$in": object_ids}},
+            {"$set": {"email_sent": email_sent, "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+    
+    @staticmethod
+    def _query(
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        device_id: Optional[str] = None,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> dict:
+        query = {}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lt"] = until
+        if unresolved_only:
+            query["is_resolved"] = False
+        elif is_resolved is not None:
+            query["is_resolved"] = is_resolved
+        if device_id is not None:
+            query["device_id"] = device_id
+        if alert_types:
+            query["alert_type"] = {"$in": list(alert_types)}
+        if severities:
+            query["severity"] = {"$in": list(severities)}
+        return query
+    
+    async def find(
+        self,
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        limit: int = 50,
+        device_id: Optional[str] = None
+    ) -> List[dict]:
+        cursor = self.read_collection.find(
+            self._query(since, unresolved_only, device_id)
+        ).sort("timestamp", -1).limit(limit)
+        return [_with_str_id(doc) for doc in await cursor.to_list(length=limit)]
+    
+    async def changes(
+        self,
+        since: datetime,
+        until: datetime,
+        limit: int,
+        device_id: Optional[str] = None
+    ) -> Tuple[List[dict], List[str]]:
+        # From the primary: a lagging secondary could skip changes for good
+        query = {"updated_at": {"$gte": since, "$lt": until}}
+        deleted_query = {"deleted_at": {"$gte": since, "$lt": until}}
+        if device_id is not None:
+            query["device_id"] = deleted_query["device_id"] = device_id
+        alerts = await self.collection.find(query).sort("updated_at", 1).limit(limit).to_list(length=limit)
+        deleted = await self.tombstones.find(deleted_query, {"_id": 1}).sort("deleted_at", 1).limit(limit).to_list(
+            length=limit
+        )
+        return [_with_str_id(alert) for alert in alerts], [str(doc["_id"]) for doc in deleted]
+    
+    async def summary(self, since: datetime) -> dict:
+        start = next_hour_bucket(since)
+        totals = Counter()
+        async for bucket in self.read_counters.find({"_id": {"$gte": start}}):
+            for key, value in bucket.items():
+                if isinstance(value, dict):
+                    totals.update({f"{key}.{name}": count for name, count in value.items()})
+                elif key not in ("_id", "revision"):
+                    totals[key] += value
+        if start > since:
+            # The partial hour before the first whole bucket
+            for _, deltas in await self._grouped_changes({"timestamp": {"$gte": since, "$lt": start}}, 1):
+                totals.update(deltas)
+        return summarize_alert_counters(totals)
+    
+    async def rebuild_counters(self) -> Optional[int]:
+        # Counters keep taking `$inc`s while this runs, so nothing is cleared:
+        # each bucket is replaced only if it is off and still at the revision
+        # read before the alerts were aggregated. A bucket that changed in
+        # between is left for the next pass, as is the current hour.
+        now = datetime.utcnow()
+        owner = ObjectId()
+        try:
+            await self.leases.update_one(
+                {"_id": COUNTER_REBUILD_LEASE, "expires_at": {"$lte": now}},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=COUNTER_REBUILD_LEASE_SECONDS)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return None
+        
+        try:
+            current_hour = hour_bucket(now)
+            stored = {doc["_id"]: doc async for doc in self.counters.find({"_id": {"$lt": current_hour}})}
+            expected: Dict[datetime, Counter] = defaultdict(Counter)
+            for timestamp, deltas in await self._grouped_changes({"timestamp": {"$lt": current_hour}}, 1):
+                expected[hour_bucket(timestamp)].update(deltas)
+            
+            requests = []
+            for bucket in stored.keys() | expected.keys():
+                doc = stored.get(bucket)
+                counters = {key: value for key, value in expected.get(bucket, {}).items() if value}
+                if doc is not None and _flat_counters(doc) == counters:
+                    continue
+                if doc is None:
+                    requests.append(InsertOne(_counter_document(bucket, counters, 1)))
+                elif counters:
+                    requests.append(ReplaceOne(
+                        {"_id": bucket, "revision": doc.get("revision")},
+                        _counter_document(bucket, counters, doc.get("revision", 0) + 1)
+                    ))
+                else:
+                    requests.append(DeleteOne({"_id": bucket, "revision": doc.get("revision")}))
+            if requests:
+                try:
+                    await self.counters.bulk_write(requests, ordered=False)
+                except BulkWriteError as e:
+                    # A bucket created by an `$inc` in the meantime is newer than ours
+                    if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                        raise
+            return len(expected)
+        finally:
+            await self.leases.delete_one({"_id": COUNTER_REBUILD_LEASE, "owner": owner})
+    
+    async def resolve(self, alert_id: str) -> bool:
+        object_id = _object_id(alert_id)
+        if object_id is None:
+            return False
+        now = datetime.utcnow()
+        doc = await self.collection.find_one_and_update(
+            {"_id": object_id, "is_resolved": False},
+            {"$set": {"is_resolved": True, "resolved_at": now, "updated_at": now}},
+            projection={"timestamp": 1}
+        )
+        if doc is None:
+            return False
+        await self._count([(doc["timestamp"], {"unresolved": -1})])
+        return True
+    
+    async def delete(self, alert_id: str) -> bool:
+        object_id = _object_id(alert_id)
+        if object_id is None:
+            return False
+        doc = await self.collection.find_one_and_delete({"_id": object_id})
+        if doc is None:
+            return False
+        await self._count([(doc["timestamp"], alert_counter_deltas(doc, -1))])
+        await self.tombstones.replace_one(
+            {"_id": object_id},
+            {"device_id": doc.get("device_id"), "deleted_at": datetime.utcnow()},
+            upsert=True
+        )
+        return True
+    
+    async def resolve_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> int:
+        query = self._query(since, True, device_id, alert_types, severities, until)
+        changes = [
+            (timestamp, {"unresolved": deltas["unresolved"]})
+            for timestamp, deltas in await self._grouped_changes(query, -1)
+        ]
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            query,
+            {"$set": {"is_resolved": True, "resolved_at": now, "updated_at": now}}
+        )
+        await self._count(changes)
+        return result.modified_count
+    
+    async def delete_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> int:
+        query = self._query(since, False, device_id, alert_types, severities, until, is_resolved)
+        changes = await self._grouped_changes(query, -1)
+        # Tombstones for sync, written server-side without fetching the ids
+        await self.collection.aggregate([
+            {"$match": query},
+            {"$project": {"device_id": 1, "deleted_at": {"$literal": datetime.utcnow()}}},
+            {"$merge": {"into": "alert_tombstones", "whenMatched": "replace"}},
+        ]).to_list(length=None)
+        result = await self.collection.delete_many(query)
+        await self._count(changes)
+        return result.deleted_count
+
+
+class MongoSettingsRepository(SettingsRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().settings
+    
+    async def get(self, setting_type: str = "system") -> Optional[dict]:
+        return _with_str_id(await self.collection.find_one({"setting_type": setting_type}))
+    
+    async def insert(self, doc: dict) -> dict:
+        await self.collection.insert_one(doc)
+        return _with_str_id(doc)
+    
+    async def update(
+        self,
+        fields: dict,
+        setting_type: str = "system",
+        upsert: bool = False,
+        expected_version: Optional[int] = None
+    ) -> Optional[dict]:
+        query = {"setting_type": setting_type}
+        if expected_version is not None:
+            # Documents written before versioning count as version 0
+            query["version"] = {"$in": [0, None]} if expected_version == 0 else expected_version
+        doc = await self.collection.find_one_and_update(
+            query,
+            {"$set": fields, "$inc": {"version": 1}},
+            upsert=upsert and expected_version is None,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None and expected_version is not None:
+            if await self.collection.count_documents({"setting_type": setting_type}, limit=1):
+                raise VersionConflictError(f"{setting_type} settings changed since version {expected_version}")
+        return _with_str_id(doc)
+
+
+class MongoOutboxRepository(OutboxRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().notification_outbox
+    
+    @staticmethod
+    def _object_ids(message_ids: List[str]) -> List[ObjectId]:
+        return [object_id for object_id in map(_object_id, message_ids) if object_id is not None]
+    
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[dict]:
+        now = datetime.utcnow()
+        due = {"dead": False, "available_at": {"$lte": now}}
+        candidates = await self.collection.find(due, {"_id": 1}).sort("available_at", 1).limit(limit).to_list(
+            length=None
+        )
+        if not candidates:
+            return []
+        ids = [doc["_id"] for doc in candidates]
+        lease_until = now + timedelta(seconds=lease_seconds)
+        # Re-checking `due` in the update makes a message go to one dispatcher only
+        await self.collection.update_many(
+            {"_id": {"$in": ids}, **due},
+            {"$set": {"lease_owner": owner, "available_at": lease_until}}
+        )
+        claimed = await self.collection.find(
+            {"_id": {"$in": ids}, "lease_owner": owner, "available_at": lease_until}
+        ).sort("created_at", 1).to_list(length=None)
+        return [_with_str_id(doc) for doc in claimed]
+    
+    async def complete(self, message_ids: List[str]) -> int:
+        result = await self.collection.delete_many({"_id": {"$in": self._object_ids(message_ids)}})
+        return result.deleted_count
+    
+    async def fail(self, failures: List[Tuple[str, str, Optional[datetime]]]) -> int:
+        now = datetime.utcnow()
+        requests = [
+            UpdateOne(
+                {"_id": object_id},
+                {
+                    "$inc": {"attempts": 1},
+                    "$set": {
+                        "last_error": error,
+                        "failed_at": now,
+                        "available_at": retry_at or now,
+                        "lease_owner": None,
+                        "dead": retry_at is None,
+                    },
+                }
+            )
+            for message_id, error, retry_at in failures
+            if (object_id := _object_id(message_id)) is not None
+        ]
+        if not requests:
+            return 0
+        result = await self.collection.bulk_write(requests, ordered=False)
+        return result.modified_count
+    
+    async def dead_letters(self, limit: int) -> List[dict]:
+        cursor = self.collection.find({"dead": True}).sort("failed_at", -1).limit(limit)
+        return [_with_str_id(doc) async for doc in cursor]
+    
+    async def requeue(self, message_id: str) -> bool:
+        object_id = _object_id(message_id)
+        if object_id is None:
+            return False
+        result = await self.collection.update_one(
+            {"_id": object_id, "dead": True},
+            {"$set": {"dead": False, "attempts": 0, "available_at": datetime.utcnow(), "lease_owner": None}}
+        )
+        return result.matched_count > 0
+    
+    async def delete(self, message_id: str) -> bool:
+        object_id = _object_id(message_id)
+        if object_id is None:
+            return False
+        result = await self.collection.delete_one({"_id": object_id})
+        return result.deleted_count > 0
+    
+    async def counts(self) -> Dict[str, int]:
+        pending, dead = await asyncio.gather(
+            self.collection.count_documents({"dead": False}),
+            self.collection.count_documents({"dead": True})
+        )
+        return {"pending": pending, "dead": dead}
+
+
+class MongoCheckpointRepository(CheckpointRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().checkpoints
+    
+    async def save(self, name: str, data: dict):
+        await self.collection.replace_one(
+            {"_id": name},
+            {"_id": name, "data": data, "updated_at": datetime.utcnow()},
+            upsert=True
+        )
+    
+    async def load(self, name: str) -> Optional[dict]:
+        doc = await self.collection.find_one({"_id": name})
+        return doc["data"] if doc else None
+
+
+class MongoSketchRepository(SketchRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().sensor_sketches
+    
+    @property
+    def read_collection(self):
+        return Database.get_read_db().sensor_sketches
+    
+    async def save_many(self, docs: List[dict]):
+        if docs:
+            await self.collection.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs],
+                ordered=False
+            )
+    
+    async def find(self, since: datetime, device_id: Optional[str] = None) -> List[dict]:
+        query = {"hour": {"$gte": since}}
+        if device_id is not None:
+            query["device_id"] = device_id
+        return await self.read_collection.find(query).to_list(length=None)
+
+
+class MongoValveRepository(ValveRepository):
+    
+    @property
+    def collection(self):
+        return Database.get_db().valve_states
+    
+    async def claim_open(
+        self,
+        device_id: str,
+        now: datetime,
+        open_until: datetime,
+        busy_until: datetime,
+        force: bool = False
+    ) -> bool:
+        query = {"_id": device_id}
+        if not force:
+            query["busy_until"] = {"$lte": now}
+        try:
+            # A busy device doesn't match, and the upsert then collides with its _id
+            await self.collection.update_one(
+                query, {"$set": {"open_until": open_until, "busy_until": busy_until}}, upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+    
+    async def claim_close(self, device_id: str, now: datetime, busy_until: datetime, force: bool = False) -> bool:
+        query = {"_id": device_id}
+        if not force:
+            query["open_until"] = {"$gt": now}
+        result = await self.collection.update_one(
+            query, {"$set": {"open_until": None, "busy_until": busy_until}}, upsert=force
+        )
+        return result.matched_count > 0 or result.upserted_id is not None
+    
+    async def release(self, device_id: str):
+        await self.collection.delete_one({"_id": device_id})
+
+
+class MongoStorage(Storage):
+    """MongoDB backend (Motor)"""
+    
+    name = "mongo"
+    
+    def __init__(self):
+        self.sensor_data = MongoSensorDataRepository()
+        self.alerts = MongoAlertRepository()
+        self.outbox = MongoOutboxRepository()
+        self.settings = MongoSettingsRepository()
+        self.checkpoints = MongoCheckpointRepository()
+        self.sketches = MongoSketchRepository()
+        self.valves = MongoValveRepository()
+    
+    @property
+    def is_connected(self) -> bool:
+        return Database.db is not None
+    
+    @property
+    def is_ready(self) -> bool:
+        return Database.db is not None and Database.indexes_ready
+    
+    @property
+    def index_failures(self) -> Dict[str, str]:
+        return dict(Database.index_failures)
+    
+    async def connect(self):
+        await Database.connect_db()
+    
+    async def close(self):
+        await Database.close_db()
+    
+    async def ping(self):
+        try:
+            await Database.get_db().command("ping")
+        except PyMongoError as e:
+            raise StorageUnavailableError(str(e)) from e
@@ -0,0 +1,1000 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from enum import Enum
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from bson import json_util
+from app.config import settings
+from app.storage.base import (
+    SENSOR_FIELDS,
+    SCAN_COLUMNS,
+    AlertRepository,
+    CheckpointRepository,
+    OutboxRepository,
+    SensorDataRepository,
+    SettingsRepository,
+    SketchRepository,
+    Storage,
+    StorageUnavailableError,
+    ValveRepository,
+    VersionConflictError,
+    hour_bucket,
+    next_hour_bucket,
+    set_paths,
+    alert_counter_deltas,
+    outbox_message,
+    summarize_alert_counters,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    soil_moisture REAL,
+    temperature REAL,
+    humidity REAL,
+    light_intensity REAL,
+    received_at TEXT,
+    UNIQUE (device_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp ON sensor_data (timestamp);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    alert_type TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    message TEXT NOT NULL,
+    sensor_value REAL,
+    threshold_value REAL,
+    device_id TEXT,
+    timestamp TEXT NOT NULL,
+    is_resolved INTEGER NOT NULL DEFAULT 0,
+    email_sent INTEGER NOT NULL DEFAULT 0,
+    resolved_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp);
+CREATE INDEX IF NOT EXISTS idx_alerts_is_resolved ON alerts (is_resolved);
+CREATE INDEX IF NOT EXISTS idx_alerts_device_open ON alerts (device_id, is_resolved, alert_type);
+
+CREATE TABLE IF NOT EXISTS alert_tombstones (
+    alert_id TEXT NOT NULL,
+    device_id TEXT,
+    deleted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alert_tombstones_deleted_at ON alert_tombstones (deleted_at);
+
+CREATE TABLE IF NOT EXISTS alert_counters (
+    bucket TEXT NOT NULL,
+    counter TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (bucket, counter)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS settings (
+    id INTEGER PRIMARY KEY,
+    setting_type TEXT NOT NULL UNIQUE,
+    doc TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sensor_sketches (
+    id TEXT PRIMARY KEY,
+    hour TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    count REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sensor_sketches_hour ON sensor_sketches (hour, device_id);
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY,
+    alert_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    alert TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    available_at TEXT NOT NULL,
+    lease_owner TEXT,
+    last_error TEXT,
+    failed_at TEXT,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (dead, available_at);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS valve_states (
+    device_id TEXT PRIMARY KEY,
+    open_until TEXT,
+    busy_until TEXT NOT NULL
+);
+"""
+
+SENSOR_COLUMNS = ("device_id", "timestamp") + SENSOR_FIELDS + ("received_at",)
+ALERT_COLUMNS = (
+    "alert_type", "severity", "message", "sensor_value", "threshold_value",
+    "device_id", "timestamp", "is_resolved", "email_sent", "resolved_at", "updated_at",
+)
+ALERT_BOOL_COLUMNS = ("is_resolved", "email_sent")
+ALERT_TIME_COLUMNS = ("timestamp", "resolved_at", "updated_at")
+
+
+def to_sql(value: Any) -> Any:
+    """Python value -> SQLite value (datetimes as sortable ISO strings)"""
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="microseconds")
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def from_sql_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a connection in WAL mode (readers never block the writer)"""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def migrate(conn: sqlite3.Connection):
+    """Bring databases created by earlier versions up to SCHEMA"""
+    if "updated_at" not in {row["name"] for row in conn.execute("PRAGMA table_info(alerts)")}:
+        conn.execute("ALTER TABLE alerts ADD COLUMN updated_at TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_updated_at ON alerts (updated_at)")
+
+
+class SQLiteWriter(threading.Thread):
+    """Single writer thread that group-commits queued write jobs
+    
+    Jobs that queue up while a transaction is being committed are written
+    together in the next one, so bursts of readings cost one fsync per batch
+    rather than one per reading. Each job runs in its own savepoint so a
+    failing job does not take the rest of the batch down with it.
+    """
+    
+    def __init__(self, path: str, batch_size: int):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self.path = path
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.batches_committed = 0
+        self.jobs_committed = 0
+    
+    def submit(self, job: Callable[[sqlite3.Connection], Any]) -> Future:
+        future: Future = Future()
+        self._queue.put((job, future))
+        return future
+    
+    def stop(self):
+        self._queue.put(None)
+        self.join()
+    
+    def run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._commit(conn, batch)
+                        return
+                    batch.append(item)
+                
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+    
+    def _commit(self, conn: sqlite3.Connection, batch: List[tuple]):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, job(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"❌ SQLite commit failed: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(StorageUnavailableError(str(e)))
+            return
+        
+        self.batches_committed += 1
+        self.jobs_committed += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class _SQLiteRepository:
+    
+    def __init__(self, storage: "SQLiteStorage"):
+        self._storage = storage
+    
+    async def _write(self, job: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.wrap_future(self._storage.writer.submit(job))
+    
+    async def _read(self, job: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.wrap_future(
+            self._storage.readers.submit(lambda: job(self._storage.read_connection()))
+        )
+
+
+class SQLiteSensorDataRepository(_SQLiteRepository, SensorDataRepository):
+    
+    INSERT = (
+        f"INSERT OR IGNORE INTO sensor_data ({', '.join(SENSOR_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in SENSOR_COLUMNS)})"
+    )
+    
+    @staticmethod
+    def _row(doc: dict) -> tuple:
+        return tuple(to_sql(doc.get(column)) for column in SENSOR_COLUMNS)
+    
+    @staticmethod
+    def _doc(row: sqlite3.Row) -> dict:
+        doc = dict(row)
+        doc["_id"] = str(doc.pop("id"))
+        doc["timestamp"] = from_sql_time(doc["timestamp"])
+        doc["received_at"] = from_sql_time(doc["received_at"])
+        return doc
+    
+    async def upsert(self, doc: dict) -> bool:
+        row = self._row(doc)
+        return await self._write(lambda conn: conn.execute(self.INSERT, row).rowcount == 1)
+    
+    async def upsert_many(self, docs: List[dict]) -> List[bool]:
+        rows = [self._row(doc) for doc in docs]
+        return await self._write(lambda conn: [conn.execute(self.INSERT, row).rowcount == 1 for row in rows])
+    
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        rows = [self._row(doc) for doc in docs]
+        
+        def job(conn):
+            return [doc for doc, row in zip(docs, rows) if conn.execute(self.INSERT, row).rowcount]
+        
+        return await self._write(job)
+    
+    async def delete_range(self, since: datetime, until: datetime, received_before: Optional[datetime] = None) -> int:
+        where, params = "timestamp >= ? AND timestamp < ?", [to_sql(since), to_sql(until)]
+        if received_before is not None:
+            where += " AND (received_at IS NULL OR received_at <= ?)"
+            params.append(to_sql(received_before))
+        return await self._write(lambda conn: conn.execute(f"DELETE FROM sensor_data WHERE {where}", params).rowcount)
+    
+    async def latest(self) -> Optional[dict]:
+        row = await self._read(lambda conn: conn.execute(
+            "SELECT * FROM sensor_data ORDER BY timestamp DESC LIMIT 1"
+        ).fetchone())
+        return self._doc(row) if row else None
+    
+    async def sync_cursor(self) -> int:
+        return await self._read(lambda conn: conn.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data").fetchone()[0])
+    
+    async def changes_since(
+        self,
+        cursor: int,
+        since: datetime,
+        limit: int,
+        device_id: Optional[str] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[dict], int, bool]:
+        # Ids are assigned in commit order by the single writer: a rowid range scan
+        where, params = "id > ? AND id <= ? AND timestamp >= ?", [to_sql(since)]
+        if until is not None:
+            where += " AND timestamp < ?"
+            params.append(to_sql(until))
+        if device_id is not None:
+            where += " AND device_id = ?"
+            params.append(device_id)
+        
+        def job(conn):
+            # Head first, so a reading committed in between is left for the next call
+            head = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data").fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM sensor_data WHERE {where} ORDER BY id LIMIT ?", (cursor, head, *params, limit + 1)
+            ).fetchall()
+            return rows, head
+        
+        rows, head = await self._read(job)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return [self._doc(row) for row in rows], rows[-1]["id"], True
+        return [self._doc(row) for row in rows], head, False
+    
+    async def history(self, since: datetime, limit: int, device_id: Optional[str] = None) -> List[dict]:
+        where, params = "timestamp >= ?", [to_sql(since)]
+        if device_id is not None:
+            where += " AND device_id = ?"
+            params.append(device_id)
+        rows = await self._read(lambda conn: conn.execute(
+            f"SELECT * FROM sensor_data WHERE {where} ORDER BY timestamp DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall())
+        return [self._doc(row) for row in rows]
+    
+    async def stats_windows(self, windows: Dict[str, datetime]) -> Dict[str, Optional[dict]]:
+        # One range scan of the widest window with per-window CASE aggregates
+        columns, params = [], []
+        for index, since in enumerate(windows.values()):
+            inside = "timestamp >= ?"
+            columns.append(f"SUM(CASE WHEN {inside} THEN 1 ELSE 0 END) AS w{index}_total_readings")
+            params.append(to_sql(since))
+            for field in SENSOR_FIELDS:
+                for function in ("AVG", "MIN", "MAX"):
+                    columns.append(
+                        f"{function}(CASE WHEN {inside} THEN {field} END) AS w{index}_{function.lower()}_{field}"
+                    )
+                    params.append(to_sql(since))
+        params.append(to_sql(min(windows.values())))
+        
+        row = await self._read(lambda conn: conn.execute(
+            f"SELECT {', '.join(columns)} FROM sensor_data WHERE timestamp >= ?", params
+        ).fetchone())
+        
+        results = {}
+        for index, name in enumerate(windows):
+            prefix = f"w{index}_"
+            if not row or not row[f"{prefix}total_readings"]:
+                results[name] = None
+                continue
+            results[name] = {
+                key[len(prefix):]: row[key] for key in row.keys() if key.startswith(prefix)
+            }
+        return results
+    
+    async def scan_columns(
+        self,
+        since: datetime,
+        until: datetime,
+        device_id: Optional[str] = None,
+        batch_size: int = 50000
+    ) -> AsyncIterator[Dict[str, Sequence]]:
+        where, params = "timestamp < ?", [to_sql(until)]
+        if device_id is not None:
+            where += " AND device_id = ?"
+            params.append(device_id)
+        # Keyset pagination on the (timestamp, device_id) order, one read per batch.
+        # Epoch seconds are whole seconds plus the stored fraction, as julianday()
+        # only keeps about a millisecond
+        sql = (
+            f"SELECT device_id, CAST(strftime('%s', timestamp) AS INTEGER) + CAST(substr(timestamp, 20) AS REAL), "
+            f"{', '.join(SENSOR_FIELDS)}, timestamp FROM sensor_data "
+            f"WHERE {where} AND (timestamp, device_id) > (?, ?) "
+            f"ORDER BY timestamp, device_id LIMIT ?"
+        )
+        
+        def fetch(conn, after):
+            # Plain tuples: building sqlite3.Row objects dominates large scans
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(sql, (*params, *after, batch_size)).fetchall()
+        
+        after = (to_sql(since), "")
+        while True:
+            rows = await self._read(lambda conn: fetch(conn, after))
+            if not rows:
+                return
+            yield dict(zip(SCAN_COLUMNS, zip(*rows)))
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][-1], rows[-1][0])
+
+
+class SQLiteAlertRepository(_SQLiteRepository, AlertRepository):
+    
+    COUNTER_UPSERT = (
+        "INSERT INTO alert_counters (bucket, counter, value) VALUES (?, ?, ?) "
+        "ON CONFLICT (bucket, counter) DO UPDATE SET value = value + excluded.value"
+    )
+    
+    @classmethod
+    def _count(cls, conn: sqlite3.Connection, changes: Iterable[tuple]):
+        """Apply `(timestamp, deltas)` pairs to the hourly counters in the current transaction"""
+        totals = Counter()
+        for timestamp, deltas in changes:
+            bucket = to_sql(hour_bucket(timestamp))
+            for counter, value in deltas.items():
+                totals[(bucket, counter)] += value
+        conn.executemany(
+            cls.COUNTER_UPSERT,
+            [(bucket, counter, value) for (bucket, counter), value in totals.items() if value]
+        )
+    
+    @staticmethod
+    def _doc(row: sqlite3.Row) -> dict:
+        doc = dict(row)
+        doc["_id"] = str(doc.pop("id"))
+        for column in ALERT_BOOL_COLUMNS:
+            doc[column] = bool(doc[column])
+        for column in ALERT_TIME_COLUMNS:
+            doc[column] = from_sql_time(doc[column])
+        return doc
+    
+    @staticmethod
+    def _where(
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        device_id: Optional[str] = None,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> tuple:
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(to_sql(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(to_sql(until))
+        if unresolved_only:
+            is_resolved = False
+        if is_resolved is not None:
+            clauses.append("is_resolved = ?")
+            params.append(int(is_resolved))
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        for column, values in (("alert_type", alert_types), ("severity", severities)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params.extend(to_sql(value) for value in values)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+    
+    async def insert(self, doc: dict, notification: Optional[dict] = None) -> str:
+        now = datetime.utcnow()
+        doc = dict(doc, updated_at=now)
+        columns = [column for column in ALERT_COLUMNS if column in doc]
+        values = tuple(to_sql(doc[column]) for column in columns)
+        sql = (
+            f"INSERT INTO alerts ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        
+        def job(conn):
+            alert_id = conn.execute(sql, values).lastrowid
+            if notification is not None:
+                # Same savepoint as the alert: both are stored or neither
+                SQLiteOutboxRepository.add(conn, outbox_message(str(alert_id), doc, notification, now))
+            self._count(conn, [(doc["timestamp"], alert_counter_deltas(doc))])
+            return alert_id
+        
+        return str(await self._write(job))
+    
+    async def insert_many(self, docs: List[dict]) -> int:
+        if not docs:
+            return 0
+        now = datetime.utcnow()
+        docs = [dict(doc, updated_at=doc.get("updated_at", now)) for doc in docs]
+        columns = [column for column in ALERT_COLUMNS if column in docs[0]]
+        rows = [tuple(to_sql(doc.get(column)) for column in columns) for doc in docs]
+        sql = (
+            f"INSERT INTO alerts ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        
+        def job(conn):
+            conn.executemany(sql, rows)
+            self._count(conn, ((doc["timestamp"], alert_counter_deltas(doc)) for doc in docs))
+            return len(rows)
+        
+        return await self._write(job)
+    
+    async def set_email_sent(self, alert_id: str, email_sent: bool):
+        await self._write(lambda conn: conn.execute(
+            "UPDATE alerts SET email_sent = ?, updated_at = ? WHERE id = ?",
+            (int(email_sent), to_sql(datetime.utcnow()), alert_id)
+        ))
+    
+    async def set_email_sent_many(self, alert_ids: List[str], email_sent: bool) -> int:
+        if not alert_ids:
+            return 0
+        return await self._write(lambda conn: conn.execute(
+            f"UPDATE alerts SET email_sent = ?, updated_at = ? WHERE id IN ({', '.join('?' for _ in alert_ids)})",
+            (int(email_sent), to_sql(datetime.utcnow()), *alert_ids)
+        ).rowcount)
+    
+    async def find(
+        self,
+        since: Optional[datetime] = None,
+        unresolved_only: bool = False,
+        limit: int = 50,
+        device_id: Optional[str] = None
+    ) -> List[dict]:
+        where, params = self._where(since, unresolved_only, device_id)
+        rows = await self._read(lambda conn: conn.execute(
+            f"SELECT * FROM alerts{where} ORDER BY timestamp DESC LIMIT ?", (*params, limit)
+        ).fetchall())
+        return [self._doc(row) for row in rows]
+    
+    async def changes(
+        self,
+        since: datetime,
+        until: datetime,
+        limit: int,
+        device_id: Optional[str] = None
+    ) -> Tuple[List[dict], List[str]]:
+        params = [to_sql(since), to_sql(until)]
+        device = ""
+        if device_id is not None:
+            device = " AND device_id = ?"
+            params.append(device_id)
+        
+        def job(conn):
+            alerts = conn.execute(
+                f"SELECT * FROM alerts WHERE updated_at >= ? AND updated_at < ?{device} ORDER BY updated_at LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+            deleted = conn.execute(
+                f"SELECT alert_id FROM alert_tombstones WHERE deleted_at >= ? AND deleted_at < ?{device} "
+                f"ORDER BY deleted_at LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+            return alerts, deleted
+        
+        alerts, deleted = await self._read(job)
+        return [self._doc(row) for row in alerts], [row[0] for row in deleted]
+    
+    async def summary(self, since: datetime) -> dict:
+        start = next_hour_bucket(since)
+        
+        def job(conn):
+            counters = conn.execute(
+                "SELECT counter, SUM(value) FROM alert_counters WHERE bucket >= ? GROUP BY counter",
+                (to_sql(start),)
+            ).fetchall()
+            # The partial hour before the first whole bucket
+            alerts = conn.execute(
+                "SELECT alert_type, severity, device_id, timestamp, is_resolved FROM alerts "
+                "WHERE timestamp >= ? AND timestamp < ?",
+                (to_sql(since), to_sql(start))
+            ).fetchall()
+            return counters, alerts
+        
+        counters, alerts = await self._read(job)
+        total = Counter({row[0]: row[1] for row in counters})
+        for _, deltas in self._changes(alerts, 1):
+            total.update(deltas)
+        return summarize_alert_counters(total)
+    
+    async def rebuild_counters(self) -> Optional[int]:
+        def job(conn):
+            rows = conn.execute(
+                "SELECT alert_type, severity, device_id, timestamp, is_resolved FROM alerts"
+            ).fetchall()
+            conn.execute("DELETE FROM alert_counters")
+            self._count(conn, self._changes(rows, 1))
+            return conn.execute("SELECT COUNT(DISTINCT bucket) FROM alert_counters").fetchone()[0]
+        
+        return await self._write(job)
+    
+    @staticmethod
+    def _changes(rows: List[sqlite3.Row], sign: int) -> Iterable[tuple]:
+        for row in rows:
+            alert = dict(row)
+            alert["is_resolved"] = bool(alert["is_resolved"])
+            yield from_sql_time(alert["timestamp"]), alert_counter_deltas(alert, sign)
+    
+    @staticmethod
+    def _bury(conn: sqlite3.Connection, rows: List[sqlite3.Row]):
+        """Remember deleted alerts for sync, forgetting ones past the retention"""
+        now = datetime.utcnow()
+        conn.executemany(
+            "INSERT INTO alert_tombstones (alert_id, device_id, deleted_at) VALUES (?, ?, ?)",
+            [(str(row["id"]), row["device_id"], to_sql(now)) for row in rows]
+        )
+        conn.execute(
+            "DELETE FROM alert_tombstones WHERE deleted_at < ?",
+            (to_sql(now - timedelta(hours=settings.SYNC_TOMBSTONE_RETENTION_HOURS)),)
+        )
+    
+    async def resolve(self, alert_id: str) -> bool:
+        return await self._resolve_where(" WHERE id = ? AND is_resolved = 0", [alert_id]) > 0
+    
+    async def delete(self, alert_id: str) -> bool:
+        return await self._delete_where(" WHERE id = ?", [alert_id]) > 0
+    
+    async def _resolve_where(self, where: str, params: list) -> int:
+        now = to_sql(datetime.utcnow())
+        
+        def job(conn):
+            rows = conn.execute(f"SELECT timestamp FROM alerts{where}", params).fetchall()
+            conn.execute(f"UPDATE alerts SET is_resolved = 1, resolved_at = ?, updated_at = ?{where}", (now, now, *params))
+            self._count(conn, ((from_sql_time(row[0]), {"unresolved": -1}) for row in rows))
+            return len(rows)
+        
+        return await self._write(job)
+    
+    async def _delete_where(self, where: str, params: list) -> int:
+        def job(conn):
+            rows = conn.execute(
+                f"SELECT id, alert_type, severity, device_id, timestamp, is_resolved FROM alerts{where}", params
+            ).fetchall()
+            conn.execute(f"DELETE FROM alerts{where}", params)
+            self._count(conn, self._changes(rows, -1))
+            self._bury(conn, rows)
+            return len(rows)
+        
+        return await self._write(job)
+    
+    async def resolve_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> int:
+        where, params = self._where(since, True, device_id, alert_types, severities, until)
+        return await self._resolve_where(where, params)
+    
+    async def delete_many(
+        self,
+        alert_types: Optional[List[str]] = None,
+        severities: Optional[List[str]] = None,
+        device_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        is_resolved: Optional[bool] = None
+    ) -> int:
+        where, params = self._where(since, False, device_id, alert_types, severities, until, is_resolved)
+        return await self._delete_where(where, params)
+
+
+class SQLiteSettingsRepository(_SQLiteRepository, SettingsRepository):
+    
+    @staticmethod
+    def _doc(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        doc = json_util.loads(row["doc"])
+        doc["_id"] = str(row["id"])
+        return doc
+    
+    @staticmethod
+    def _select(conn: sqlite3.Connection, setting_type: str) -> Optional[sqlite3.Row]:
+        return conn.execute(
+            "SELECT id, doc FROM settings WHERE setting_type = ?", (setting_type,)
+        ).fetchone()
+    
+    async def get(self, setting_type: str = "system") -> Optional[dict]:
+        return self._doc(await self._read(lambda conn: self._select(conn, setting_type)))
+    
+    async def insert(self, doc: dict) -> dict:
+        body = {key: value for key, value in doc.items() if key != "_id"}
+        
+        def job(conn):
+            conn.execute(
+                "INSERT INTO settings (setting_type, doc) VALUES (?, ?)",
+                (body["setting_type"], json_util.dumps(body))
+            )
+            return self._select(conn, body["setting_type"])
+        
+        return self._doc(await self._write(job))
+    
+    async def update(
+        self,
+        fields: dict,
+        setting_type: str = "system",
+        upsert: bool = False,
+        expected_version: Optional[int] = None
+    ) -> Optional[dict]:
+        # Read-modify-write is atomic here: every write runs on the single writer thread
+        def job(conn):
+            row = self._select(conn, setting_type)
+            if row is None:
+                if not upsert or expected_version is not None:
+                    return None
+                doc = {"setting_type": setting_type}
+                set_paths(doc, fields)
+                doc["version"] = 1
+                conn.execute(
+                    "INSERT INTO settings (setting_type, doc) VALUES (?, ?)",
+                    (setting_type, json_util.dumps(doc))
+                )
+            else:
+                doc = json_util.loads(row["doc"])
+                if expected_version is not None and doc.get("version", 0) != expected_version:
+                    raise VersionConflictError(f"{setting_type} settings changed since version {expected_version}")
+                set_paths(doc, fields)
+                doc["version"] = doc.get("version", 0) + 1
+                conn.execute(
+                    "UPDATE settings SET doc = ? WHERE id = ?", (json_util.dumps(doc), row["id"])
+                )
+            return self._select(conn, setting_type)
+        
+        return self._doc(await self._write(job))
+
+
+class SQLiteOutboxRepository(_SQLiteRepository, OutboxRepository):
+    
+    COLUMNS = (
+        "alert_id", "channel", "recipient", "alert", "attempts", "created_at",
+        "available_at", "lease_owner", "last_error", "failed_at", "dead",
+    )
+    
+    @classmethod
+    def add(cls, conn: sqlite3.Connection, message: dict):
+        """Insert a message in the current transaction"""
+        values = [
+            json_util.dumps(message[column]) if column == "alert" else to_sql(message[column])
+            for column in cls.COLUMNS
+        ]
+        conn.execute(
+            f"INSERT INTO notification_outbox ({', '.join(cls.COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in cls.COLUMNS)})",
+            values
+        )
+    
+    @staticmethod
+    def _doc(row: sqlite3.Row) -> dict:
+        doc = dict(row)
+        doc["_id"] = str(doc.pop("id"))
+        doc["alert"] = json_util.loads(doc["alert"])
+        doc["dead"] = bool(doc["dead"])
+        for column in ("created_at", "available_at", "failed_at"):
+            doc[column] = from_sql_time(doc[column])
+        return doc
+    
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> List[dict]:
+        now = datetime.utcnow()
+        lease_until = to_sql(now + timedelta(seconds=lease_seconds))
+        
+        # Select and lease in one write job: the single writer serializes claims
+        def job(conn):
+            rows = conn.execute(
+                "SELECT * FROM notification_outbox WHERE dead = 0 AND available_at <= ? "
+                "ORDER BY available_at LIMIT ?",
+                (to_sql(now), limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE notification_outbox SET lease_owner = ?, available_at = ? WHERE id = ?",
+                [(owner, lease_until, row["id"]) for row in rows]
+            )
+            return rows
+        
+        docs = [self._doc(row) for row in await self._write(job)]
+        for doc in docs:
+            doc.update(lease_owner=owner, available_at=from_sql_time(lease_until))
+        return sorted(docs, key=lambda doc: doc["created_at"])
+    
+    async def complete(self, message_ids: List[str]) -> int:
+        if not message_ids:
+            return 0
+        return await self._write(lambda conn: conn.execute(
+            f"DELETE FROM notification_outbox WHERE id IN ({', '.join('?' for _ in message_ids)})",
+            message_ids
+        ).rowcount)
+    
+    async def fail(self, failures: List[Tuple[str, str, Optional[datetime]]]) -> int:
+        now = datetime.utcnow()
+        rows = [
+            (error, to_sql(now), to_sql(retry_at or now), int(retry_at is None), message_id)
+            for message_id, error, retry_at in failures
+        ]
+        return await self._write(lambda conn: conn.executemany(
+            "UPDATE notification_outbox SET attempts = attempts + 1, last_error = ?, failed_at = ?, "
+            "available_at = ?, lease_owner = NULL, dead = ? WHERE id = ?",
+            rows
+        ).rowcount)
+    
+    async def dead_letters(self, limit: int) -> List[dict]:
+        rows = await self._read(lambda conn: conn.execute(
+            "SELECT * FROM notification_outbox WHERE dead = 1 ORDER BY failed_at DESC LIMIT ?", (limit,)
+        ).fetchall())
+        return [self._doc(row) for row in rows]
+    
+    async def requeue(self, message_id: str) -> bool:
+        return await self._write(lambda conn: conn.execute(
+            "UPDATE notification_outbox SET dead = 0, attempts = 0, available_at = ?, lease_owner = NULL "
+            "WHERE id = ? AND dead = 1",
+            (to_sql(datetime.utcnow()), message_id)
+        ).rowcount > 0)
+    
+    async def delete(self, message_id: str) -> bool:
+        return await self._write(lambda conn: conn.execute(
+            "DELETE FROM notification_outbox WHERE id = ?", (message_id,)
+        ).rowcount > 0)
+    
+    async def counts(self) -> Dict[str, int]:
+        rows = await self._read(lambda conn: conn.execute(
+            "SELECT dead, COUNT(*) AS count FROM notification_outbox GROUP BY dead"
+        ).fetchall())
+        counts = {"pending": 0, "dead": 0}
+        for row in rows:
+            counts["dead" if row["dead"] else "pending"] = row["count"]
+        return counts
+
+
+class SQLiteCheckpointRepository(_SQLiteRepository, CheckpointRepository):
+    
+    async def save(self, name: str, data: dict):
+        values = (name, json_util.dumps(data), to_sql(datetime.utcnow()))
+        await self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (name, data, updated_at) VALUES (?, ?, ?)", values
+        ))
+    
+    async def load(self, name: str) -> Optional[dict]:
+        row = await self._read(lambda conn: conn.execute(
+            "SELECT data FROM checkpoints WHERE name = ?", (name,)
+        ).fetchone())
+        return json_util.loads(row["data"]) if row else None
+
+
+class SQLiteValveRepository(_SQLiteRepository, ValveRepository):
+    
+    async def claim_open(
+        self,
+        device_id: str,
+        now: datetime,
+        open_until: datetime,
+        busy_until: datetime,
+        force: bool = False
+    ) -> bool:
+        # The conflict update only applies when its WHERE holds; rowcount says whether it did
+        condition = "" if force else " WHERE busy_until <= ?"
+        params = (device_id, to_sql(open_until), to_sql(busy_until)) + (() if force else (to_sql(now),))
+        cursor = await self._write(lambda conn: conn.execute(
+            "INSERT INTO valve_states (device_id, open_until, busy_until) VALUES (?, ?, ?) "
+            "ON CONFLICT (device_id) DO UPDATE SET open_until = excluded.open_until, "
+            f"busy_until = excluded.busy_until{condition}",
+            params
+        ))
+        return cursor.rowcount > 0
+    
+    async def claim_close(self, device_id: str, now: datetime, busy_until: datetime, force: bool = False) -> bool:
+        if force:
+            await self._write(lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO valve_states (device_id, open_until, busy_until) VALUES (?, NULL, ?)",
+                (device_id, to_sql(busy_until))
+            ))
+            return True
+        cursor = await self._write(lambda conn: conn.execute(
+            "UPDATE valve_states SET open_until = NULL, busy_until = ? WHERE device_id = ? AND open_until > ?",
+            (to_sql(busy_until), device_id, to_sql(now))
+        ))
+        return cursor.rowcount > 0
+    
+    async def release(self, device_id: str):
+        await self._write(lambda conn: conn.execute("DELETE FROM valve_states WHERE device_id = ?", (device_id,)))
+
+
+class SQLiteSketchRepository(_SQLiteRepository, SketchRepository):
+    
+    COLUMNS = ("hour", "device_id", "metric", "count", "data")
+    
+    async def save_many(self, docs: List[dict]):
+        rows = [(doc["_id"], *(to_sql(doc[column]) for column in self.COLUMNS)) for doc in docs]
+        await self._write(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO sensor_sketches (id, hour, device_id, metric, count, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows
+        ))
+    
+    async def find(self, since: datetime, device_id: Optional[str] = None) -> List[dict]:
+        where, params = "hour >= ?", [to_sql(since)]
+        if device_id is not None:
+            where += " AND device_id = ?"
+            params.append(device_id)
+        rows = await self._read(lambda conn: conn.execute(
+            f"SELECT * FROM sensor_sketches WHERE {where}", params
+        ).fetchall())
+        docs = []
+        for row in rows:
+            doc = dict(row)
+            doc["_id"] = doc.pop("id")
+            doc["hour"] = from_sql_time(doc["hour"])
+            docs.append(doc)
+        return docs
+
+
+class SQLiteStorage(Storage):
+    """Embedded SQLite backend for gateways without MongoDB
+    
+    Writes go through a single group-committing writer thread; reads run on a
+    small thread pool with one WAL-mode connection per thread.
+    """
+    
+    name = "sqlite"
+    
+    def __init__(self, path: str, batch_size: int = 500, read_threads: int = 2):
+        self.path = path
+        self.batch_size = batch_size
+        self.read_threads = read_threads
+        self.writer: Optional[SQLiteWriter] = None
+        self.readers: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.sensor_data = SQLiteSensorDataRepository(self)
+        self.alerts = SQLiteAlertRepository(self)
+        self.outbox = SQLiteOutboxRepository(self)
+        self.settings = SQLiteSettingsRepository(self)
+        self.checkpoints = SQLiteCheckpointRepository(self)
+        self.sketches = SQLiteSketchRepository(self)
+        self.valves = SQLiteValveRepository(self)
+    
+    @property
+    def is_connected(self) -> bool:
+        return self.writer is not None
+    
+    def read_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    async def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        conn = connect(self.path)
+        try:
+            conn.executescript(SCHEMA)
+            migrate(conn)
+        finally:
+            conn.close()
+        
+        self.writer = SQLiteWriter(self.path, self.batch_size)
+        self.writer.start()
+        self.readers = ThreadPoolExecutor(max_workers=self.read_threads, thread_name_prefix="sqlite-reader")
+        logger.info(f"✅ Opened SQLite storage: {self.path}")
+    
+    async def close(self):
+        if self.writer:
+            await asyncio.to_thread(self.writer.stop)
+            self.writer = None
+        if self.readers:
+            self.readers.shutdown(wait=True)
+            self.readers = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+        logger.info("🔌 SQLite storage closed")
+    
+    async def ping(self):
+        if not self.is_connected:
+            raise StorageUnavailableError("SQLite storage is not open")
@@ -0,0 +1,66 @@
+"""On-demand sampling profiler producing flamegraph-compatible collapsed stacks"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profiling session is already running"""
+
+
+class SamplingProfiler:
+    """Periodically samples the stacks of every thread in the process"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+    
+    @property
+    def is_running(self) -> bool:
+        return self._lock.locked()
+    
+    def run(self, duration: float, interval: float = 0.005) -> Dict[str, int]:
+        """Sample all threads for `duration` seconds (blocking)"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profiling session is already running")
+        
+        try:
+            own_ident = threading.get_ident()
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + duration
+            
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+                time.sleep(interval)
+            
+            return dict(stacks)
+        finally:
+            self._lock.release()
+    
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """Render a frame chain root-first as `thread;func (file:line);...`"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            frames.append(f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":"))
+            frame = frame.f_back
+        frames.append(thread_name.replace(";", ":").replace(" ", "_"))
+        return ";".join(reversed(frames))
+    
+    @staticmethod
+    def to_collapsed(stacks: Dict[str, int]) -> str:
+        """Format sampled stacks in Brendan Gregg's collapsed-stack format"""
+        lines = [f"{stack} {count}" for stack, count in sorted(stacks.items())]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+# Global profiler instance
+profiler = SamplingProfiler()
@@ -0,0 +1,149 @@
+"""
+Mergeable season statistics over column batches of sensor readings
+
+`batch_partial` runs in analytics worker processes, so this module only
+imports NumPy. Partials from any number of batches are combined with
+`merge_partial` and turned into reports with `finalize`. Days are UTC days.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def batch_partial(
+    columns: Dict[str, Sequence],
+    fields: Sequence[str],
+    correlation: bool,
+    daily: bool,
+    degree_days: bool
+) -> dict:
+    """Aggregates of one batch: co-moments, per-day min/max/sum, per-device daily temperature range"""
+    values = np.column_stack([np.asarray(columns[field], dtype=np.float64) for field in fields])
+    days = (np.asarray(columns["timestamp"], dtype=np.float64) // 86400).astype(np.int64)
+    partial = {"count": len(values)}
+    
+    if correlation:
+        # Centered per batch and merged with Chan's update, which stays accurate over long ranges
+        mean = values.mean(axis=0)
+        centered = values - mean
+        partial["mean"] = mean
+        partial["comoment"] = centered.T @ centered
+    
+    if daily:
+        unique_days, inverse = np.unique(days, return_inverse=True)
+        mins = np.full((len(unique_days), len(fields)), np.inf)
+        maxs = np.full((len(unique_days), len(fields)), -np.inf)
+        sums = np.zeros((len(unique_days), len(fields)))
+        np.minimum.at(mins, inverse, values)
+        np.maximum.at(maxs, inverse, values)
+        np.add.at(sums, inverse, values)
+        counts = np.bincount(inverse, minlength=len(unique_days))
+        partial["days"] = {
+            int(day): (int(counts[i]), mins[i], maxs[i], sums[i]) for i, day in enumerate(unique_days)
+        }
+    
+    if degree_days:
+        # A dict beats np.unique on strings for the few devices in a batch
+        index: Dict[str, int] = {}
+        device_ids = columns["device_id"]
+        codes = np.fromiter(
+            (index.setdefault(device, len(index)) for device in device_ids), dtype=np.int64, count=len(device_ids)
+        )
+        devices = list(index)
+        temperature = values[:, list(fields).index("temperature")]
+        keys, inverse = np.unique(days * len(devices) + codes, return_inverse=True)
+        low = np.full(len(keys), np.inf)
+        high = np.full(len(keys), -np.inf)
+        np.minimum.at(low, inverse, temperature)
+        np.maximum.at(high, inverse, temperature)
+        partial["device_days"] = {
+            (devices[key % len(devices)], int(key // len(devices))): (float(low[i]), float(high[i]))
+            for i, key in enumerate(keys)
+        }
+    return partial
+
+
+def merge_partial(total: Optional[dict], partial: dict) -> dict:
+    """Fold a batch partial into the running total (which may be None)"""
+    if total is None:
+        return partial
+    count = total["count"] + partial["count"]
+    
+    if "mean" in partial:
+        delta = partial["mean"] - total["mean"]
+        weight = total["count"] * partial["count"] / count
+        total["comoment"] = total["comoment"] + partial["comoment"] + np.outer(delta, delta) * weight
+        total["mean"] = total["mean"] + delta * partial["count"] / count
+    
+    for day, (day_count, mins, maxs, sums) in partial.get("days", {}).items():
+        current = total["days"].get(day)
+        if current is None:
+            total["days"][day] = (day_count, mins, maxs, sums)
+        else:
+            total["days"][day] = (
+                current[0] + day_count, np.minimum(current[1], mins), np.maximum(current[2], maxs), current[3] + sums
+            )
+    
+    for key, (low, high) in partial.get("device_days", {}).items():
+        current = total["device_days"].get(key)
+        total["device_days"][key] = (min(current[0], low), max(current[1], high)) if current else (low, high)
+    
+    total["count"] = count
+    return total
+
+
+def _day(day: int) -> str:
+    return (EPOCH_DATE + timedelta(days=day)).isoformat()
+
+
+def finalize(total: Optional[dict], fields: Sequence[str], reports: Sequence[str], gdd_base: float) -> dict:
+    """Reports from the merged partials"""
+    result = {"total_readings": total["count"] if total else 0}
+    
+    if "correlation" in reports:
+        matrix = {field: {other: None for other in fields} for field in fields}
+        if total and total["count"] > 1:
+            spread = np.sqrt(np.diag(total["comoment"]))
+            for i, field in enumerate(fields):
+                for j, other in enumerate(fields):
+                    if spread[i] > 0 and spread[j] > 0:
+                        matrix[field][other] = round(float(total["comoment"][i, j] / (spread[i] * spread[j])), 4)
+        result["correlation"] = matrix
+    
+    if "daily" in reports:
+        daily: List[dict] = []
+        for day, (count, mins, maxs, sums) in sorted((total or {}).get("days", {}).items()):
+            entry = {"date": _day(day), "readings": count}
+            for i, field in enumerate(fields):
+                entry[field] = {
+                    "min": round(float(mins[i]), 3),
+                    "max": round(float(maxs[i]), 3),
+                    "mean": round(float(sums[i] / count), 3),
+                }
+            daily.append(entry)
+        result["daily"] = daily
+    
+    if "growing_degree_days" in reports:
+        by_device: Dict[str, List[dict]] = {}
+        cumulative: Dict[str, float] = {}
+        for (device, day), (low, high) in sorted((total or {}).get("device_days", {}).items()):
+            # Simple averaging method: mean of the day's extremes above the base temperature
+            gdd = max((low + high) / 2 - gdd_base, 0.0)
+            cumulative[device] = cumulative.get(device, 0.0) + gdd
+            by_device.setdefault(device, []).append({
+                "date": _day(day),
+                "min_temperature": round(low, 2),
+                "max_temperature": round(high, 2),
+                "gdd": round(gdd, 2),
+                "cumulative": round(cumulative[device], 2),
+            })
+        result["growing_degree_days"] = {
+            "base_celsius": gdd_base,
+            "devices": {
+                device: {"total": days[-1]["cumulative"], "days": days} for device, days in by_device.items()
+            },
+        }
+    return result
@@ -0,0 +1,35 @@
+"""Opaque sync tokens for incremental (delta) polling of history and alerts"""
+import base64
+import binascii
+import json
+from typing import Union
+
+
+class SyncTokenError(ValueError):
+    """Raised for a sync token that cannot be decoded or belongs to another endpoint"""
+
+
+class StaleSyncTokenError(SyncTokenError):
+    """Raised for a sync token the server can no longer continue from; the client reloads in full"""
+
+
+def encode_sync_token(kind: str, backend: str, cursor: Union[int, float]) -> str:
+    """URL-safe token holding the endpoint, storage backend and position"""
+    payload = json.dumps({"k": kind, "b": backend, "c": cursor}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_sync_token(token: str, kind: str, backend: str) -> Union[int, float]:
+    """Position held by a token from `encode_sync_token` for the same endpoint"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise SyncTokenError("Malformed sync token") from e
+    if not isinstance(payload, dict) or payload.get("k") != kind:
+        raise SyncTokenError(f"Not a {kind} sync token")
+    cursor = payload.get("c")
+    if isinstance(cursor, bool) or not isinstance(cursor, (int, float)):
+        raise SyncTokenError("Malformed sync token")
+    if payload.get("b") != backend:
+        raise StaleSyncTokenError("Sync token is from another storage backend")
+    return cursor
@@ -0,0 +1,125 @@
+"""Mergeable t-digest quantile sketch"""
+import math
+from array import array
+from typing import List, Tuple
+
+
+class TDigest:
+    """Merging t-digest (Dunning) for streaming, mergeable quantile estimates
+    
+    Keeps about `compression / 2` weighted centroids, small near the tails so
+    p5/p95 stay accurate. Digests built on different workers or hours can be
+    merged and still answer quantile queries for the combined data.
+    """
+    
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._centroids: List[Tuple[float, float]] = []
+        self._buffer: List[Tuple[float, float]] = []
+    
+    def add(self, value: float, weight: float = 1.0):
+        """Add one observation"""
+        self._buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+    
+    def merge(self, other: "TDigest"):
+        """Fold another digest into this one"""
+        other._compress()
+        if not other._centroids:
+            return
+        # Buffered like single points, so merging many digests compresses rarely
+        self._buffer.extend(other._centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+    
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        total = self.count
+        
+        merged = []
+        mean, weight = points[0]
+        cumulative = 0.0
+        q_limit = self._q_limit(0.0)
+        for value, value_weight in points[1:]:
+            proposed = weight + value_weight
+            # Arcsine scale: centroids shrink towards the tails (q -> 0 or 1)
+            if (cumulative + proposed) / total <= q_limit:
+                mean += (value - mean) * value_weight / proposed
+                weight = proposed
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                q_limit = self._q_limit(cumulative / total)
+                mean, weight = value, value_weight
+        merged.append((mean, weight))
+        self._centroids = merged
+    
+    def _q_limit(self, q: float) -> float:
+        """Highest quantile a centroid starting at `q` may reach (k1 scale function)"""
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+    
+    def quantile(self, q: float) -> float:
+        """Estimated value at quantile `q` (0..1); NaN when empty"""
+        self._compress()
+        centroids = self._centroids
+        if not centroids:
+            return math.nan
+        if len(centroids) == 1 or q <= 0:
+            return self.min if q <= 0 else (self.max if q >= 1 else centroids[0][0])
+        if q >= 1:
+            return self.max
+        
+        target = q * self.count
+        first_mean, first_weight = centroids[0]
+        if target < first_weight / 2:
+            return self.min + (first_mean - self.min) * target / (first_weight / 2)
+        
+        cumulative = 0.0
+        for (left_mean, left_weight), (right_mean, right_weight) in zip(centroids, centroids[1:]):
+            left_center = cumulative + left_weight / 2
+            right_center = cumulative + left_weight + right_weight / 2
+            if target <= right_center:
+                fraction = (target - left_center) / (right_center - left_center)
+                return left_mean + (right_mean - left_mean) * fraction
+            cumulative += left_weight
+        
+        last_mean, last_weight = centroids[-1]
+        remaining = self.count - target
+        return self.max - (self.max - last_mean) * remaining / (last_weight / 2)
+    
+    def to_bytes(self) -> bytes:
+        """Compact binary form: header then interleaved (mean, weight) doubles"""
+        self._compress()
+        values = array("d", [self.compression, self.count, self.min, self.max])
+        for mean, weight in self._centroids:
+            values.append(mean)
+            values.append(weight)
+        return values.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        values = array("d")
+        values.frombytes(data)
+        digest = cls(values[0])
+        digest.count, digest.min, digest.max = values[1], values[2], values[3]
+        digest._centroids = list(zip(values[4::2], values[5::2]))
+        return digest
+
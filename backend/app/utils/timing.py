@@ -0,0 +1,106 @@
+"""Per-stage timing spans aggregated into in-memory percentile summaries"""
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Sequence
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+class StageTimings:
+    """Thread-safe registry of recent durations for each hot-path stage"""
+    
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, stage: str, duration_ms: float):
+        """Record a single duration (milliseconds) for a stage"""
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            samples.append(duration_ms)
+            self._counts[stage] += 1
+    
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block and record it under `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Percentile summary of the recent window for every stage"""
+        with self._lock:
+            snapshot = {stage: list(samples) for stage, samples in self._samples.items()}
+            counts = dict(self._counts)
+        
+        result = {}
+        for stage, samples in sorted(snapshot.items()):
+            samples.sort()
+            result[stage] = {
+                "count": counts[stage],
+                "window": len(samples),
+                "mean_ms": round(sum(samples) / len(samples), 3) if samples else 0.0,
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p90_ms": round(percentile(samples, 90), 3),
+                "p99_ms": round(percentile(samples, 99), 3),
+                "max_ms": round(samples[-1], 3) if samples else 0.0,
+            }
+        return result
+    
+    def reset(self):
+        """Drop all recorded samples"""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+class LatencyHistogram:
+    """Thread-safe latency counts in fixed buckets (milliseconds), cumulative like Prometheus"""
+    
+    DEFAULT_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+    
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = sorted(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._sum_ms = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, duration_ms: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets_ms, duration_ms)] += 1
+            self._sum_ms += duration_ms
+    
+    def snapshot(self) -> dict:
+        """Count, mean and cumulative count per upper bound ("le_<ms>", then "le_inf")"""
+        with self._lock:
+            counts = list(self._counts)
+            total_ms = self._sum_ms
+        buckets, running = {}, 0
+        for bound, count in zip([*self.buckets_ms, "inf"], counts):
+            running += count
+            buckets[f"le_{bound}"] = running
+        return {
+            "count": running,
+            "mean_ms": round(total_ms / running, 3) if running else 0.0,
+            "buckets": buckets,
+        }
+
+
+# Global stage timing registry
+stage_timings = StageTimings()
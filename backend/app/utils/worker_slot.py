@@ -0,0 +1,48 @@
+"""Stable per-worker identity, for state that must survive a worker's restart"""
+import os
+import threading
+from typing import IO, Optional
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no worker slots
+    fcntl = None
+
+_lock = threading.Lock()
+_slot: Optional[int] = None
+_slot_handle: Optional[IO] = None
+
+
+def worker_slot() -> Optional[int]:
+    """This process's worker number within the replica, or None without MQTT_CLIENT_ID_SUFFIX
+    
+    Each worker takes the lowest slot not locked by another process; the lock
+    goes when the process exits, so a restarted worker gets its predecessor's.
+    """
+    global _slot, _slot_handle
+    if not settings.MQTT_CLIENT_ID_SUFFIX or fcntl is None:
+        return None
+    with _lock:
+        if _slot is not None:
+            return _slot
+        os.makedirs(settings.MQTT_WORKER_SLOT_DIR, exist_ok=True)
+        slot = 0
+        while True:
+            handle = open(os.path.join(settings.MQTT_WORKER_SLOT_DIR, f"worker-{slot}.lock"), "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                slot += 1
+                continue
+            _slot_handle, _slot = handle, slot
+            return slot
+
+
+def worker_name() -> Optional[str]:
+    """`<MQTT_CLIENT_ID_SUFFIX>-<slot>`, the same for a worker across restarts, or None"""
+    slot = worker_slot()
+    if slot is None:
+        return None
+    return f"{settings.MQTT_CLIENT_ID_SUFFIX}-{slot}"
@@ -0,0 +1,277 @@
+"""
+Load-test the dashboard and alert HTTP routes
+
+Hits every /api/dashboard and /api/alerts route in turn with `--concurrency`
+keep-alive clients and reports p50/p95/p99 latency and throughput per
+route. Point it at a running server (seeded with benchmarks.seed_dataset for
+realistic volumes), or let it start one with --start-server. Routes that
+change alerts only run with --writes, on alerts fetched beforehand.
+
+Usage:
+    python -m benchmarks.bench_api --url http://127.0.0.1:8000 --concurrency 32 --requests 2000 --json
+    python -m benchmarks.bench_api --start-server --backend sqlite --routes dashboard.stats,alerts.list
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.bench_startup import free_port, status
+from benchmarks.seed_dataset import device_name
+
+# name -> (method, request builder returning (path, JSON body or None), changes data)
+Route = Tuple[str, Callable[[], Tuple[str, Optional[dict]]], bool]
+
+
+class Client:
+    """One keep-alive connection per thread"""
+    
+    def __init__(self, base_url: str, timeout: float):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+    
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+    
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, bytes, float]:
+        """Status (0 on connection errors), body and latency in seconds"""
+        headers = {"Connection": "keep-alive"}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        started = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+            return response.status, payload, time.perf_counter() - started
+        except (OSError, http.client.HTTPException):
+            self._local.connection.close()
+            self._local.connection = None
+            return 0, b"", time.perf_counter() - started
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted `values`"""
+    if not values:
+        return None
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def fetch_alert_ids(client: Client, devices: int, wanted: int) -> List[str]:
+    """Ids of open alerts across devices, for the write routes"""
+    ids = []
+    for index in range(devices):
+        code, payload, _ = client.request("GET", f"/api/alerts/?unresolved_only=true&limit=200&device_id={device_name(index)}")
+        if code == 200:
+            ids.extend(alert["_id"] for alert in json.loads(payload))
+        if len(ids) >= wanted:
+            break
+    random.shuffle(ids)
+    return ids
+
+
+def build_routes(devices: int, alert_ids: List[str]) -> Dict[str, Route]:
+    def device() -> str:
+        return device_name(random.randrange(devices))
+    
+    def hour_filter() -> dict:
+        # One device and one hour of the seeded month: a realistic, bounded bulk operation
+        until = datetime.utcnow() - timedelta(hours=random.randrange(24, 24 * 30))
+        return {"device_id": device(), "since": (until - timedelta(hours=1)).isoformat(), "until": until.isoformat()}
+    
+    # Resolve and delete take separate halves so neither hits the other's deleted alerts
+    resolve_ids = alert_ids[::2]
+    delete_ids = alert_ids[1::2]
+    
+    return {
+        "dashboard.latest": ("GET", lambda: ("/api/dashboard/sensor-data/latest", None), False),
+        "dashboard.history": ("GET", lambda: ("/api/dashboard/sensor-data/history?hours=24&limit=1000", None), False),
+        "dashboard.history_device": (
+            "GET", lambda: (f"/api/dashboard/sensor-data/history?hours=168&limit=1000&device_id={device()}", None), False
+        ),
+        "dashboard.history_columnar": (
+            "GET", lambda: ("/api/dashboard/sensor-data/history?hours=24&limit=1000&format=columnar", None), False
+        ),
+        "dashboard.stats": ("GET", lambda: ("/api/dashboard/stats?hours=24", None), False),
+        "dashboard.stats_windows": ("GET", lambda: ("/api/dashboard/stats?windows=1h,24h,7d", None), False),
+        "dashboard.forecast": ("GET", lambda: (f"/api/dashboard/forecast?device_id={device()}", None), False),
+        "dashboard.health": ("GET", lambda: ("/api/dashboard/health", None), False),
+        "alerts.list": ("GET", lambda: ("/api/alerts/?limit=50", None), False),
+        "alerts.list_unresolved": ("GET", lambda: ("/api/alerts/?limit=200&unresolved_only=true", None), False),
+        "alerts.list_device": ("GET", lambda: (f"/api/alerts/?limit=50&device_id={device()}", None), False),
+        "alerts.stats": ("GET", lambda: ("/api/alerts/stats?hours=168", None), False),
+        "alerts.resolve": (
+            "PUT", lambda: (f"/api/alerts/{resolve_ids.pop() if resolve_ids else 'missing'}/resolve", None), True
+        ),
+        "alerts.delete": ("DELETE", lambda: (f"/api/alerts/{delete_ids.pop() if delete_ids else 'missing'}", None), True),
+        "alerts.bulk_resolve": ("POST", lambda: ("/api/alerts/bulk/resolve", hour_filter()), True),
+        "alerts.bulk_delete": ("POST", lambda: ("/api/alerts/bulk/delete", hour_filter()), True),
+    }
+
+
+def run_route(client: Client, method: str, build: Callable, requests: int, concurrency: int, warmup: int) -> dict:
+    """Send `requests` requests from `concurrency` threads; latency and throughput of the successful ones"""
+    lock = threading.Lock()
+    
+    def next_request() -> Tuple[str, Optional[dict]]:
+        # Request builders pop shared id lists
+        with lock:
+            return build()
+    
+    for _ in range(warmup):
+        client.request(method, *next_request())
+    
+    latencies: List[float] = []
+    statuses = Counter()
+    remaining = [requests]
+    
+    def worker():
+        local_latencies = []
+        local_statuses = Counter()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            code, _, elapsed = client.request(method, *next_request())
+            local_statuses[code] += 1
+            if 200 <= code < 300:
+                local_latencies.append(elapsed)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    ok = len(latencies)
+    return {
+        "method": method,
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "errors": sum(statuses.values()) - ok,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 1) if elapsed > 0 else None,
+        "latency_ms": {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+                ("max", latencies[-1] if latencies else None),
+                ("mean", sum(latencies) / ok if ok else None),
+            )
+        },
+    }
+
+
+def start_server(backend: str, timeout: float) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ, STORAGE_BACKEND=backend),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    started = time.perf_counter()
+    while status(f"{base}/api/health/live") != 200:
+        if process.poll() is not None or time.perf_counter() - started > timeout:
+            process.terminate()
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+    return process, base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to test")
+    parser.add_argument("--start-server", action="store_true", help="Start uvicorn on a free port instead of using --url")
+    parser.add_argument("--backend", default="mongo", help="STORAGE_BACKEND for --start-server")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per route")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per route")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per route first")
+    parser.add_argument("--devices", type=int, default=50, help="Devices in the seeded dataset")
+    parser.add_argument("--routes", help="Comma-separated route names (default: all read routes)")
+    parser.add_argument("--writes", action="store_true", help="Also run the routes that resolve and delete alerts")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+    
+    process = None
+    base_url = args.url
+    if args.start_server:
+        process, base_url = start_server(args.backend, args.timeout)
+    try:
+        client = Client(base_url, args.timeout)
+        alert_ids = []
+        if args.writes:
+            # Enough open alerts for every resolve and delete request, warmups included
+            alert_ids = fetch_alert_ids(client, args.devices, 2 * (args.requests + args.warmup))
+        routes = build_routes(args.devices, alert_ids)
+        
+        if args.routes:
+            names = [name.strip() for name in args.routes.split(",")]
+            unknown = [name for name in names if name not in routes]
+            if unknown:
+                parser.error(f"unknown routes: {', '.join(unknown)} (known: {', '.join(routes)})")
+        else:
+            names = [name for name, (_, _, writes) in routes.items() if args.writes or not writes]
+        
+        if not args.json:
+            print(f"\n== {base_url} ({args.concurrency} concurrent, {args.requests} requests per route)")
+        results = {}
+        for name in names:
+            method, build, _ = routes[name]
+            results[name] = run_route(client, method, build, args.requests, args.concurrency, args.warmup)
+            if not args.json:
+                result = results[name]
+                latency = result["latency_ms"]
+                print(
+                    f"  {name:<28} {result['throughput_rps'] or 0:>8.1f} req/s  "
+                    f"p50 {latency['p50'] or 0:>8.2f}ms  p95 {latency['p95'] or 0:>8.2f}ms  "
+                    f"p99 {latency['p99'] or 0:>8.2f}ms  errors {result['errors']}"
+                )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+    
+    report = {
+        "url": base_url,
+        "concurrency": args.concurrency,
+        "requests_per_route": args.requests,
+        "routes": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the CPU cost of turning an MQTT payload into an insert-ready reading document
+
+Compares the previous path (json.loads, SensorReading(**payload), model_dump)
+with the cached TypeAdapter decoder, one payload at a time and as JSON arrays.
+
+Usage:
+    python -m benchmarks.bench_ingest --messages 50000 --batch-size 100
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.models import SensorReading
+from app.models.sensor_data import decode_readings
+
+
+def generate_payloads(count: int, devices: int):
+    """JSON payloads like the ESP32 firmware sends, one second apart"""
+    start = datetime.utcnow() - timedelta(seconds=count)
+    return [
+        {
+            "device_id": f"ESP32_{i % devices:03d}",
+            "timestamp": (start + timedelta(seconds=i)).isoformat() + "Z",
+            "soil_moisture": round(random.uniform(20, 80), 2),
+            "temperature": round(random.uniform(15, 40), 2),
+            "humidity": round(random.uniform(30, 90), 2),
+            "light_intensity": round(random.uniform(1000, 60000), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def model_path(raw: bytes) -> dict:
+    payload = json.loads(raw.decode())
+    doc = SensorReading(**payload).model_dump()
+    doc["received_at"] = datetime.utcnow()
+    return doc
+
+
+def cpu_time(fn, items) -> float:
+    started = time.process_time()
+    for item in items:
+        fn(item)
+    return time.process_time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=100, help="Readings per JSON array payload")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+    
+    payloads = generate_payloads(args.messages, args.devices)
+    singles = [json.dumps(payload).encode() for payload in payloads]
+    batches = [
+        json.dumps(payloads[i:i + args.batch_size]).encode() for i in range(0, len(payloads), args.batch_size)
+    ]
+    
+    # Same documents either way (received_at aside)
+    for raw in singles[:100]:
+        expected = model_path(raw)
+        actual = decode_readings(raw)[0]
+        assert {**expected, "received_at": None} == {**actual, "received_at": None}, (expected, actual)
+    
+    # Warm up
+    cpu_time(model_path, singles[:1000])
+    cpu_time(decode_readings, singles[:1000])
+    
+    report = {}
+    for name, fn, items in [
+        ("model", model_path, singles),
+        ("decoder", decode_readings, singles),
+        ("decoder_bulk", decode_readings, batches),
+    ]:
+        seconds = cpu_time(fn, items)
+        report[name] = {
+            "cpu_seconds": round(seconds, 4),
+            "us_per_reading": round(seconds / args.messages * 1e6, 2),
+            "readings_per_sec": round(args.messages / seconds, 1) if seconds > 0 else None,
+        }
+    baseline = report["model"]["us_per_reading"]
+    for result in report.values():
+        result["cpu_saved_percent"] = round(100 * (1 - result["us_per_reading"] / baseline), 1) if baseline else None
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"{args.messages:,} readings ({args.batch_size} per array for decoder_bulk), CPU time:")
+    for name, result in report.items():
+        print(
+            f"  {name:<14} {result['us_per_reading']:>8.2f} µs/reading  {result['readings_per_sec'] or 0:>12,.1f} readings/s"
+            f"  {result['cpu_saved_percent']:>6.1f}% saved"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Measure startup time: process launch to first served request, and to readiness
+
+Starts uvicorn in a subprocess several times and polls /api/health/live and
+/api/health/ready. Run it on every release and compare the medians.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5 --backend sqlite
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def status(url: str) -> int:
+    """HTTP status of a GET, or 0 when nothing is listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def import_time(env: dict) -> float:
+    """Seconds to import the application module in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_run(env: dict, timeout: float, wait_ready: bool) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    result = {"first_request": None, "ready": None}
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            if result["first_request"] is None and status(f"{base}/api/health/live") == 200:
+                result["first_request"] = time.perf_counter() - started
+                if not wait_ready:
+                    break
+            if result["first_request"] is not None and status(f"{base}/api/health/ready") == 200:
+                result["ready"] = time.perf_counter() - started
+                break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return result
+
+
+def summarize(values: list) -> dict:
+    values = [value for value in values if value is not None]
+    if not values:
+        return {"median": None, "min": None, "max": None}
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="sqlite", help="STORAGE_BACKEND for the server")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Give up on a run after this many seconds")
+    parser.add_argument("--wait-ready", action="store_true", help="Also wait for /api/health/ready")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            STORAGE_BACKEND=args.backend,
+            SQLITE_PATH=os.path.join(tmp, "startup.db"),
+            SPOOL_PATH=os.path.join(tmp, "spool.db"),
+            DATABASE_NAME=f"bench_startup_{int(time.time())}",
+        )
+        imports = [import_time(env) for _ in range(args.runs)]
+        runs = [measure_run(env, args.timeout, args.wait_ready) for _ in range(args.runs)]
+    
+    report = {
+        "backend": args.backend,
+        "runs": args.runs,
+        "import_app": summarize(imports),
+        "first_request": summarize([run["first_request"] for run in runs]),
+        "ready": summarize([run["ready"] for run in runs]),
+    }
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"\n== startup ({args.backend}, {args.runs} runs)")
+    for name in ("import_app", "first_request", "ready"):
+        result = report[name]
+        if result["median"] is None:
+            print(f"  {name:<16} n/a")
+        else:
+            print(f"  {name:<16} median {result['median']:.4f}s  (min {result['min']:.4f}s, max {result['max']:.4f}s)")
+
+
+if __name__ == "__main__":
+    main()
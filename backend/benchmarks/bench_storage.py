@@ -0,0 +1,133 @@
+"""
+Benchmark the storage backends (memory, sqlite, mongo) on the ingest and dashboard paths
+
+Usage:
+    python -m benchmarks.bench_storage --readings 20000 --backends memory,sqlite,mongo
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.storage import create_storage
+
+
+def generate_readings(count: int, devices: int):
+    """Readings one second apart, spread over `devices` devices"""
+    start = datetime.utcnow() - timedelta(seconds=count)
+    return [
+        {
+            "device_id": f"ESP32_{i % devices:03d}",
+            "timestamp": start + timedelta(seconds=i),
+            "received_at": start + timedelta(seconds=i),
+            "soil_moisture": round(random.uniform(20, 80), 2),
+            "temperature": round(random.uniform(15, 40), 2),
+            "humidity": round(random.uniform(30, 90), 2),
+            "light_intensity": round(random.uniform(1000, 60000), 2),
+        }
+        for i in range(count)
+    ]
+
+
+async def timed(results: dict, name: str, count: int, coro):
+    started = time.perf_counter()
+    value = await coro
+    elapsed = time.perf_counter() - started
+    results[name] = {
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(count / elapsed, 1) if elapsed > 0 else None,
+    }
+    return value
+
+
+async def bench_backend(backend: str, readings: list, single: int, batch_size: int) -> dict:
+    storage = create_storage(backend)
+    await storage.connect()
+    results = {}
+    try:
+        async def upsert_single():
+            for doc in readings[:single]:
+                await storage.sensor_data.upsert(dict(doc))
+        
+        async def upsert_concurrent():
+            docs = readings[single:single * 2]
+            await asyncio.gather(*(storage.sensor_data.upsert(dict(doc)) for doc in docs))
+        
+        async def upsert_batches():
+            docs = readings[single * 2:]
+            for i in range(0, len(docs), batch_size):
+                await storage.sensor_data.upsert_many([dict(doc) for doc in docs[i:i + batch_size]])
+        
+        async def upsert_duplicates():
+            docs = readings[:batch_size]
+            await storage.sensor_data.upsert_many([dict(doc) for doc in docs])
+        
+        async def repeat(fn, times):
+            for _ in range(times):
+                await fn()
+        
+        since_1h = datetime.utcnow() - timedelta(hours=1)
+        since_24h = datetime.utcnow() - timedelta(hours=24)
+        windows = {"1h": since_1h, "24h": since_24h, "7d": datetime.utcnow() - timedelta(days=7)}
+        
+        await timed(results, "upsert_single", single, upsert_single())
+        await timed(results, "upsert_concurrent", single, upsert_concurrent())
+        await timed(results, "upsert_many", len(readings) - single * 2, upsert_batches())
+        await timed(results, "upsert_many_duplicates", batch_size, upsert_duplicates())
+        await timed(results, "latest", 200, repeat(storage.sensor_data.latest, 200))
+        await timed(results, "history_1h_limit_1000", 50, repeat(lambda: storage.sensor_data.history(since_1h, 1000), 50))
+        await timed(results, "stats_24h", 20, repeat(lambda: storage.sensor_data.stats(since_24h), 20))
+        await timed(results, "stats_windows_1h_24h_7d", 20, repeat(lambda: storage.sensor_data.stats_windows(windows), 20))
+    finally:
+        if backend == "mongo":
+            from app.database import Database
+            await Database.client.drop_database(settings.DATABASE_NAME)
+        await storage.close()
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--single", type=int, default=1000, help="Readings written one at a time")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--backends", default="memory,sqlite,mongo")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+    
+    readings = generate_readings(args.readings, args.devices)
+    report = {}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.SQLITE_PATH = os.path.join(tmp, "bench.db")
+        settings.DATABASE_NAME = f"bench_{int(time.time())}"
+        
+        for backend in args.backends.split(","):
+            try:
+                report[backend] = await bench_backend(backend, readings, args.single, args.batch_size)
+            except Exception as e:
+                report[backend] = {"error": str(e)}
+                print(f"⚠️ Skipping {backend}: {e}", file=sys.stderr)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    for backend, results in report.items():
+        print(f"\n== {backend}")
+        for name, result in results.items():
+            if name == "error":
+                print(f"  error: {result}")
+            else:
+                print(f"  {name:<28} {result['seconds']:>9.4f}s  {result['ops_per_sec'] or 0:>12,.1f} ops/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,309 @@
+"""
+Seed a storage backend with a realistic multi-device dataset for load tests
+
+Each device gets readings at a fixed interval over the last `--days` days:
+temperature and light follow the day (peaking in the afternoon), humidity
+moves against temperature, soil moisture dries out and jumps back when
+watered, all with sensor noise and per-device parameters. Alerts are
+threshold violations spread over the same range, mostly resolved except
+for recent ones. Values are generated with NumPy in chunks and bulk-loaded
+through the storage layer, so counters and indexes match a live system.
+
+Seed a separate database so the real one is left alone, e.g.:
+    DATABASE_NAME=plant_monitoring_load python -m benchmarks.seed_dataset \\
+        --readings 10000000 --alerts 1000000 --devices 50
+
+Usage:
+    python -m benchmarks.seed_dataset --readings 1000000 --alerts 100000 --backend sqlite --json
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import List
+
+import numpy as np
+
+from app.models.alert import AlertSeverity, AlertType
+from app.models.settings import ThresholdSettings
+from app.storage import create_storage
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# (alert type, metric, unit, "min"/"max" threshold, share of alerts)
+ALERT_KINDS = [
+    (AlertType.SOIL_MOISTURE_LOW, "soil_moisture", "%", "min", 0.30),
+    (AlertType.SOIL_MOISTURE_HIGH, "soil_moisture", "%", "max", 0.08),
+    (AlertType.TEMPERATURE_LOW, "temperature", "°C", "min", 0.07),
+    (AlertType.TEMPERATURE_HIGH, "temperature", "°C", "max", 0.20),
+    (AlertType.HUMIDITY_LOW, "humidity", "%", "min", 0.15),
+    (AlertType.HUMIDITY_HIGH, "humidity", "%", "max", 0.05),
+    (AlertType.LIGHT_INTENSITY_LOW, "light_intensity", " Lux", "min", 0.10),
+    (AlertType.LIGHT_INTENSITY_HIGH, "light_intensity", " Lux", "max", 0.05),
+]
+METRIC_NAMES = {
+    "soil_moisture": "Soil moisture",
+    "temperature": "Temperature",
+    "humidity": "Humidity",
+    "light_intensity": "Light intensity",
+}
+# How far past its threshold a violating value typically lands
+OVERSHOOT = {"soil_moisture": 5.0, "temperature": 2.0, "humidity": 5.0, "light_intensity": 4000.0}
+
+
+def device_name(index: int) -> str:
+    """Device ids the seeder uses (ESP32_001, ESP32_002, ...)"""
+    return f"ESP32_{index + 1:03d}"
+
+
+def to_datetimes(seconds: np.ndarray) -> List[datetime]:
+    """Epoch seconds -> naive UTC datetimes, converted in C rather than one call per value"""
+    return (seconds * 1e6).astype("int64").astype("datetime64[us]").astype(object).tolist()
+
+
+class DeviceProfiles:
+    """Per-device climate and watering parameters, one array entry per device"""
+    
+    def __init__(self, rng: np.random.Generator, devices: int):
+        self.temperature_mean = rng.normal(24.0, 3.0, devices)
+        self.temperature_swing = rng.uniform(3.0, 8.0, devices)
+        self.humidity_mean = rng.uniform(50.0, 70.0, devices)
+        self.light_peak = rng.uniform(30000.0, 65000.0, devices)
+        self.moisture_top = rng.uniform(65.0, 80.0, devices)
+        self.moisture_bottom = rng.uniform(22.0, 35.0, devices)
+        # Percentage points of soil moisture lost per hour
+        self.drying_rate = rng.uniform(0.3, 1.2, devices)
+        self.watering_phase = rng.uniform(0.0, 1.0, devices)
+        # Devices don't report in lockstep
+        self.clock_offset = rng.uniform(0.0, 1.0, devices)
+
+
+def generate_readings(
+    rng: np.random.Generator,
+    profiles: DeviceProfiles,
+    start: float,
+    interval: float,
+    first: int,
+    last: int
+) -> List[dict]:
+    """Reading documents for steps [first, last) of every device, oldest first"""
+    devices = len(profiles.temperature_mean)
+    steps = np.arange(first, last, dtype=np.float64)
+    # (devices, steps) grids, column-broadcast per device
+    t = start + (steps[None, :] + profiles.clock_offset[:, None]) * interval
+    shape = t.shape
+    hour_of_day = (t % DAY) / HOUR
+    
+    temperature = (
+        profiles.temperature_mean[:, None]
+        + profiles.temperature_swing[:, None] * np.sin(2 * np.pi * (hour_of_day - 9.0) / 24.0)
+        + rng.normal(0.0, 0.4, shape)
+    )
+    humidity = np.clip(
+        profiles.humidity_mean[:, None]
+        - 1.8 * (temperature - profiles.temperature_mean[:, None])
+        + rng.normal(0.0, 1.5, shape),
+        5.0, 100.0
+    )
+    daylight = np.clip(np.sin(np.pi * (hour_of_day - 6.0) / 12.0), 0.0, None) ** 1.5
+    cloud = rng.uniform(0.55, 1.0, shape)
+    light = np.clip(profiles.light_peak[:, None] * daylight * cloud + rng.normal(0.0, 150.0, shape), 0.0, None)
+    
+    # Sawtooth: dries at a steady rate, refilled whenever it reaches the bottom
+    span = profiles.moisture_top - profiles.moisture_bottom
+    period = span / profiles.drying_rate * HOUR
+    cycle = ((t - start) / period[:, None] + profiles.watering_phase[:, None]) % 1.0
+    soil_moisture = np.clip(
+        profiles.moisture_top[:, None] - cycle * span[:, None] + rng.normal(0.0, 0.6, shape),
+        0.0, 100.0
+    )
+    received = t + rng.exponential(0.3, shape)
+    
+    def order(values: np.ndarray) -> np.ndarray:
+        """Flatten step-major, so a chunk is in timestamp order across devices"""
+        return values.T.ravel()
+    
+    device_ids = np.tile(np.array([device_name(i) for i in range(devices)], dtype=object), len(steps)).tolist()
+    columns = zip(
+        device_ids,
+        to_datetimes(order(t)),
+        to_datetimes(order(received)),
+        np.round(order(soil_moisture), 2).tolist(),
+        np.round(order(temperature), 2).tolist(),
+        np.round(order(humidity), 2).tolist(),
+        np.round(order(light), 2).tolist(),
+    )
+    return [
+        {
+            "device_id": device_id,
+            "timestamp": timestamp,
+            "received_at": received_at,
+            "soil_moisture": soil_moisture,
+            "temperature": temperature,
+            "humidity": humidity,
+            "light_intensity": light_intensity,
+        }
+        for device_id, timestamp, received_at, soil_moisture, temperature, humidity, light_intensity in columns
+    ]
+
+
+def generate_alerts(
+    rng: np.random.Generator,
+    count: int,
+    devices: int,
+    start: float,
+    end: float,
+    now: float
+) -> List[dict]:
+    """Alert documents at random times in [start, end), mostly resolved unless recent as of `now`"""
+    thresholds = ThresholdSettings().model_dump()
+    shares = np.array([kind[4] for kind in ALERT_KINDS])
+    kinds = rng.choice(len(ALERT_KINDS), size=count, p=shares / shares.sum())
+    timestamps = np.sort(rng.uniform(start, end, count))
+    device_indexes = rng.integers(0, devices, count)
+    overshoot = rng.exponential(1.0, count)
+    critical = rng.random(count) < 0.25
+    resolved = rng.random(count) < np.where(now - timestamps > DAY, 0.97, 0.4)
+    resolved_at = np.minimum(timestamps + rng.exponential(2 * HOUR, count), now)
+    email_sent = rng.random(count) < 0.6
+    
+    threshold_values = np.empty(count)
+    sensor_values = np.empty(count)
+    for index, (_, metric, _, bound, _) in enumerate(ALERT_KINDS):
+        mask = kinds == index
+        threshold = thresholds[f"{metric}_{bound}"]
+        direction = -1.0 if bound == "min" else 1.0
+        threshold_values[mask] = threshold
+        sensor_values[mask] = threshold + direction * overshoot[mask] * OVERSHOOT[metric]
+    sensor_values = np.round(np.clip(sensor_values, 0.0, None), 2)
+    
+    docs = []
+    for kind, device_index, timestamp, is_resolved, resolved_time, value, threshold, is_critical, sent in zip(
+        kinds.tolist(),
+        device_indexes.tolist(),
+        to_datetimes(timestamps),
+        resolved.tolist(),
+        to_datetimes(resolved_at),
+        sensor_values.tolist(),
+        threshold_values.tolist(),
+        critical.tolist(),
+        email_sent.tolist(),
+    ):
+        alert_type, metric, unit, bound, _ = ALERT_KINDS[kind]
+        docs.append({
+            "alert_type": alert_type.value,
+            "severity": (AlertSeverity.CRITICAL if is_critical else AlertSeverity.WARNING).value,
+            "message": (
+                f"{METRIC_NAMES[metric]} ({value}{unit}) is "
+                f"{'below minimum' if bound == 'min' else 'above maximum'} threshold"
+            ),
+            "sensor_value": value,
+            "threshold_value": threshold,
+            "device_id": device_name(device_index),
+            "timestamp": timestamp,
+            "is_resolved": is_resolved,
+            "email_sent": sent,
+            "resolved_at": resolved_time if is_resolved else None,
+        })
+    return docs
+
+
+async def seed(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    profiles = DeviceProfiles(rng, args.devices)
+    end = time.time()
+    start = end - args.days * DAY
+    steps = max(args.readings // args.devices, 1)
+    interval = args.days * DAY / steps
+    # Steps per chunk so one chunk holds about `--chunk-size` readings
+    chunk_steps = max(args.chunk_size // args.devices, 1)
+    
+    storage = create_storage(args.backend)
+    await storage.connect()
+    report = {
+        "backend": args.backend,
+        "devices": args.devices,
+        "days": args.days,
+        "interval_seconds": round(interval, 3),
+        "readings": {"generated": 0, "inserted": 0, "generate_seconds": 0.0, "load_seconds": 0.0},
+        "alerts": {"generated": 0, "inserted": 0, "generate_seconds": 0.0, "load_seconds": 0.0},
+    }
+    
+    async def load(kind: str, build, insert):
+        stats = report[kind]
+        started = time.perf_counter()
+        docs = build()
+        stats["generate_seconds"] += time.perf_counter() - started
+        stats["generated"] += len(docs)
+        started = time.perf_counter()
+        inserted = await insert(docs)
+        stats["load_seconds"] += time.perf_counter() - started
+        stats["inserted"] += inserted if isinstance(inserted, int) else len(inserted)
+    
+    try:
+        for first in range(0, steps, chunk_steps):
+            last = min(first + chunk_steps, steps)
+            await load(
+                "readings",
+                lambda: generate_readings(rng, profiles, start, interval, first, last),
+                storage.sensor_data.insert_many
+            )
+            if not args.json:
+                print(f"  readings {report['readings']['inserted']:>12,}", end="\r", flush=True)
+        
+        # Alerts in time-ordered chunks too, so each chunk touches few counter buckets
+        bounds = np.linspace(start, end, max(args.alerts // args.chunk_size, 1) + 1)
+        per_chunk = np.diff(np.linspace(0, args.alerts, len(bounds)).round().astype(int))
+        for (chunk_start, chunk_end), count in zip(zip(bounds[:-1], bounds[1:]), per_chunk.tolist()):
+            await load(
+                "alerts",
+                lambda: generate_alerts(rng, count, args.devices, chunk_start, chunk_end, end),
+                storage.alerts.insert_many
+            )
+            if not args.json:
+                print(f"  alerts   {report['alerts']['inserted']:>12,}", end="\r", flush=True)
+    finally:
+        await storage.close()
+    
+    for stats in (report["readings"], report["alerts"]):
+        stats["generate_seconds"] = round(stats["generate_seconds"], 2)
+        stats["load_seconds"] = round(stats["load_seconds"], 2)
+        stats["docs_per_sec"] = round(stats["inserted"] / stats["load_seconds"], 1) if stats["load_seconds"] else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="mongo", choices=["mongo", "sqlite"])
+    parser.add_argument("--readings", type=int, default=1_000_000, help="Total readings across all devices")
+    parser.add_argument("--alerts", type=int, default=100_000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--days", type=float, default=30.0, help="Readings and alerts cover the last this many days")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Documents generated and inserted at a time")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed, for reproducible datasets")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+    
+    started = time.perf_counter()
+    report = asyncio.run(seed(args))
+    report["total_seconds"] = round(time.perf_counter() - started, 2)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"\n== seeded {args.backend} ({args.devices} devices over {args.days:g} days)")
+    for kind in ("readings", "alerts"):
+        stats = report[kind]
+        print(
+            f"  {kind:<9} {stats['inserted']:>12,} inserted  "
+            f"generate {stats['generate_seconds']:.1f}s  load {stats['load_seconds']:.1f}s  "
+            f"({stats['docs_per_sec'] or 0:,.0f} docs/s)"
+        )
+    print(f"  total     {report['total_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Bulk-import historical sensor readings from logger CSV or NDJSON files
+
+Files are streamed in chunks. Chunks are parsed and validated in a process
+pool and written with unordered bulk inserts; readings that are already
+stored are skipped, so an interrupted import can simply be run again.
+
+CSV files need a header row with the SensorReading field names
+(timestamp, soil_moisture, temperature, humidity, light_intensity and
+optionally device_id). NDJSON files hold one reading object per line.
+
+Usage:
+    python import_history.py season_2025.csv field_b.ndjson --workers 4
+    python import_history.py logger.csv --device-id ESP32_007 --replay-alerts --rebuild-aggregates
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models import SensorReading
+from app.storage import get_storage
+
+# Invalid rows reported individually; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def detect_format(path: str) -> str:
+    return "ndjson" if path.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def read_chunks(path: str, file_format: str, chunk_size: int) -> Iterator[Tuple[Optional[List[str]], int, List[str]]]:
+    """Yield (CSV header, first line number, raw lines) without loading the whole file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = None
+        line_number = 1
+        if file_format == "csv":
+            header = next(csv.reader([f.readline()]), None)
+            line_number = 2
+        
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield header, line_number, lines
+                line_number += len(lines)
+                lines = []
+        if lines:
+            yield header, line_number, lines
+
+
+def parse_chunk(
+    file_format: str,
+    header: Optional[List[str]],
+    first_line: int,
+    lines: List[str],
+    default_device_id: Optional[str]
+) -> Tuple[List[dict], int, List[str]]:
+    """Parse and validate raw lines (runs in a worker process)
+    
+    Returns the reading documents, the number of invalid rows and the
+    messages for the first few of them.
+    """
+    docs, invalid, errors = [], 0, []
+    received_at = datetime.utcnow()
+    for offset, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            if file_format == "csv":
+                values = next(csv.reader([line]))
+                row = {name: value for name, value in zip(header, values) if value != ""}
+            else:
+                row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+            if not row.get("timestamp"):
+                # Historical rows must say when they were taken
+                raise ValueError("missing timestamp")
+            if default_device_id and not row.get("device_id"):
+                row["device_id"] = default_device_id
+            doc = SensorReading(**row).model_dump()
+            doc["received_at"] = received_at
+            docs.append(doc)
+        except (ValueError, ValidationError, TypeError) as e:
+            invalid += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"line {first_line + offset}: {str(e).splitlines()[0]}")
+    return docs, invalid, errors
+
+
+class HistoryImporter:
+    """Writes validated chunks and optionally replays alerting and rebuilds aggregates"""
+    
+    def __init__(self, replay_alerts: bool, rebuild_aggregates: bool):
+        self.replay_alerts = replay_alerts
+        self.rebuild_aggregates = rebuild_aggregates
+        self.rows = 0
+        self.inserted = 0
+        self.invalid = 0
+        self.errors: List[str] = []
+        self.started = time.perf_counter()
+        self.alert_service = None
+        self.settings_doc = None
+        self.sketches = None
+    
+    async def prepare(self):
+        storage = get_storage()
+        if storage.name == "mongo":
+            # The unique (device_id, timestamp) index is what makes re-runs idempotent
+            from app.database import Database
+            if Database.index_task:
+                await Database.index_task
+        if self.replay_alerts:
+            from app.services.alert_service import AlertService
+            self.alert_service = AlertService()
+            self.settings_doc = await storage.settings.get()
+            if not self.settings_doc:
+                print("⚠️ No system settings found, only anomaly alerts will be replayed", file=sys.stderr)
+        if self.rebuild_aggregates:
+            from app.services.sketch_service import SketchService
+            self.sketches = SketchService(compression=settings.SKETCH_COMPRESSION)
+    
+    async def write(self, docs: List[dict], invalid: int, errors: List[str]):
+        self.rows += len(docs) + invalid
+        self.invalid += invalid
+        self.errors.extend(errors[:MAX_REPORTED_ERRORS - len(self.errors)])
+        
+        new_docs = await get_storage().sensor_data.insert_many(docs)
+        self.inserted += len(new_docs)
+        if not new_docs:
+            return
+        
+        # Replayed in time order, like live readings, and only for new readings
+        readings = [
+            SensorReading.model_construct(**{field: doc[field] for field in SensorReading.model_fields})
+            for doc in sorted(new_docs, key=lambda doc: doc["timestamp"])
+        ]
+        if self.sketches:
+            for reading in readings:
+                self.sketches.update(reading)
+            await self.sketches.flush()
+        if self.alert_service:
+            for reading in readings:
+                await self.alert_service.check_and_create_alerts(
+                    reading, send_emails=False, settings_doc=self.settings_doc
+                )
+    
+    async def finish(self):
+        if self.rebuild_aggregates:
+            await self.sketches.flush()
+            await get_storage().alerts.rebuild_counters()
+    
+    def progress(self, final: bool = False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0
+        print(
+            f"\r📥 {self.rows:,} rows, {self.inserted:,} new, {self.rows - self.inserted - self.invalid:,} already stored, "
+            f"{self.invalid:,} invalid | {rate:,.0f} rows/s",
+            end="\n" if final else "",
+            file=sys.stderr,
+            flush=True
+        )
+
+
+async def run(args) -> HistoryImporter:
+    storage = get_storage()
+    await storage.connect()
+    importer = HistoryImporter(args.replay_alerts, args.rebuild_aggregates)
+    loop = asyncio.get_running_loop()
+    try:
+        await importer.prepare()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for path in args.files:
+                file_format = args.format if args.format != "auto" else detect_format(path)
+                print(f"📂 {path} ({file_format})", file=sys.stderr)
+                
+                # A bounded window of chunks in flight; results are written in file order
+                pending = deque()
+                for header, first_line, lines in read_chunks(path, file_format, args.chunk_size):
+                    pending.append(loop.run_in_executor(
+                        pool, parse_chunk, file_format, header, first_line, lines, args.device_id
+                    ))
+                    if len(pending) >= args.workers * 2:
+                        await importer.write(*await pending.popleft())
+                        importer.progress()
+                while pending:
+                    await importer.write(*await pending.popleft())
+                    importer.progress()
+                importer.progress(final=True)
+        await importer.finish()
+    finally:
+        await storage.close()
+    return importer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="CSV or NDJSON files")
+    parser.add_argument("--format", choices=["auto", "csv", "ndjson"], default="auto", help="Input format (default: by extension)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows parsed and written per batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--device-id", help="device_id for rows that don't have one")
+    parser.add_argument("--replay-alerts", action="store_true", help="Re-evaluate thresholds and anomalies for new readings (no emails)")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="Build percentile sketches and rebuild alert counters")
+    parser.add_argument("--verbose", action="store_true", help="Show application logs")
+    args = parser.parse_args()
+    
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    importer = asyncio.run(run(args))
+    for error in importer.errors:
+        print(f"  ❌ {error}", file=sys.stderr)
+    if importer.invalid > len(importer.errors):
+        print(f"  ... and {importer.invalid - len(importer.errors):,} more invalid rows", file=sys.stderr)
+    
+    elapsed = time.perf_counter() - importer.started
+    print(f"✅ Imported {importer.inserted:,} readings in {elapsed:.1f}s ({importer.rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
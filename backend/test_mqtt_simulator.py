@@ -1,7 +1,11 @@
 """
 Test script to simulate ESP32 sending sensor data via MQTT
+
+It also plays the device side of irrigation: valve commands on the
+device's command topic are acknowledged on its ack topic.
 """
 import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
 import json
 import time
 import random
@@ -11,7 +15,15 @@ from datetime import datetime
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
 MQTT_TOPIC = "smart_crop/sensors"
+MQTT_QOS = 1
 CLIENT_ID = "esp32_simulator"
+DEVICE_ID = "ESP32_001"
+COMMAND_TOPIC = f"smart_crop/irrigation/{DEVICE_ID}/command"
+ACK_TOPIC = f"smart_crop/irrigation/{DEVICE_ID}/ack"
+
+# Valve closes by itself at this time (0 = closed)
+valve_open_until = 0.0
+acked_commands = set()
 
 
 def generate_sensor_data():
@@ -21,19 +33,37 @@ def generate_sensor_data():
         "temperature": round(random.uniform(15, 40), 2),
         "humidity": round(random.uniform(30, 90), 2),
         "light_intensity": round(random.uniform(1000, 60000), 2),
-        "timestamp": datetime.utcnow().isoformat() + "Z"
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "device_id": DEVICE_ID
     }
 
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, reason_code, properties):
     """Callback when connected to MQTT broker"""
-    if rc == 0:
+    if not reason_code.is_failure:
         print("✅ Connected to MQTT broker")
+        client.subscribe(COMMAND_TOPIC, qos=1)
     else:
-        print(f"❌ Connection failed with code {rc}")
+        print(f"❌ Connection failed: {reason_code}")
+
+
+def on_message(client, userdata, msg):
+    """Open or close the (simulated) valve and acknowledge the command"""
+    global valve_open_until
+    command = json.loads(msg.payload)
+    # Retries repeat the command_id: act once, ack every time
+    if command["command_id"] not in acked_commands:
+        acked_commands.add(command["command_id"])
+        if command["action"] == "open":
+            valve_open_until = time.time() + command["duration_seconds"]
+            print(f"🚿 Valve open for {command['duration_seconds']}s ({command['reason']})")
+        else:
+            valve_open_until = 0.0
+            print(f"🚱 Valve closed ({command['reason']})")
+    client.publish(ACK_TOPIC, json.dumps({"command_id": command["command_id"], "status": "ok"}), qos=1)
 
 
-def on_publish(client, userdata, mid):
+def on_publish(client, userdata, mid, reason_code, properties):
     """Callback when message is published"""
     print(f"📤 Message published (ID: {mid})")
 
@@ -48,9 +78,10 @@ def main():
     print()
     
     # Create MQTT client
-    client = mqtt.Client(client_id=CLIENT_ID)
+    client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=CLIENT_ID, protocol=mqtt.MQTTv5)
     client.on_connect = on_connect
     client.on_publish = on_publish
+    client.on_message = on_message
     
     try:
         # Connect to broker
@@ -72,7 +103,7 @@ def main():
             payload = json.dumps(sensor_data)
             
             # Publish to MQTT
-            result = client.publish(MQTT_TOPIC, payload)
+            result = client.publish(MQTT_TOPIC, payload, qos=MQTT_QOS)
             
             # Display data
             print(f"🌡️  Temperature: {sensor_data['temperature']}°C")
@@ -80,6 +111,7 @@ def main():
             print(f"💨 Humidity: {sensor_data['humidity']}%")
             print(f"☀️  Light: {sensor_data['light_intensity']} Lux")
             print(f"⏰ Time: {sensor_data['timestamp']}")
+            print(f"🚰 Valve: {'open' if time.time() < valve_open_until else 'closed'}")
             print("-" * 50)
             
             # Wait 5 seconds
@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from app.storage.memory import MemoryStorage
+from app.storage.sqlite import SQLiteStorage
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on the test's own event loop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path, run):
+    """A connected, empty storage backend"""
+    if request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "test.db"), batch_size=50)
+    else:
+        backend = MemoryStorage()
+    run(backend.connect())
+    yield backend
+    run(backend.close())
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+import app.storage
+from app.models import SensorReading
+from app.services.forecast_service import ForecastService
+from app.storage.memory import MemoryStorage
+
+
+def reading(timestamp: datetime, soil_moisture: float) -> SensorReading:
+    return SensorReading(
+        device_id="D1",
+        timestamp=timestamp,
+        soil_moisture=soil_moisture,
+        temperature=20.0,
+        humidity=60.0,
+        light_intensity=1000.0
+    )
+
+
+def test_warm_up_back_fills_windows_started_by_ingest(run, monkeypatch):
+    storage = MemoryStorage()
+    run(storage.connect())
+    monkeypatch.setattr(app.storage, "storage", storage)
+    now = datetime.utcnow().replace(microsecond=0)
+    readings = [reading(now - timedelta(minutes=100 - index), 60 - index * 0.1) for index in range(100)]
+    run(storage.sensor_data.upsert_many([r.model_dump() for r in readings[:90]]))
+    
+    forecasts = ForecastService(window_points=720, window_hours=12, min_points=10)
+    # Ingested since the restart, overlapping the stored history
+    for r in readings[85:]:
+        forecasts.update(r)
+    
+    assert forecasts.needs_warm_up("D1")
+    run(forecasts.warm_up("D1"))
+    result = forecasts.forecast("D1", "soil_moisture", {"soil_moisture_min": 30.0})
+    assert result["samples"] == 100
+    assert result["status"] == "crossing"
+    assert not forecasts.needs_warm_up("D1")
+
+
+def test_unseen_devices_are_never_warmed_up():
+    forecasts = ForecastService(window_points=720, window_hours=12, min_points=10)
+    assert not forecasts.needs_warm_up("not-a-device")
+    assert forecasts.forecast("not-a-device", "soil_moisture", {})["status"] == "insufficient_data"
+    assert forecasts._models == {}
@@ -0,0 +1,127 @@
+"""
+IrrigationController driven end to end through the LoopbackBroker stand-in
+
+Valve claims go through the `storage` fixture, so pacing is checked on
+both the memory and SQLite backends.
+"""
+import time
+from datetime import datetime
+import pytest
+import app.storage
+from app.config import settings
+from app.models import Alert, AlertType
+from app.services.irrigation_service import IrrigationController
+from app.services.loopback_broker import LoopbackBroker, SimulatedValves
+
+
+@pytest.fixture
+def shared_storage(storage, monkeypatch):
+    """The test's storage backend as the global one the controller uses"""
+    monkeypatch.setattr(app.storage, "storage", storage)
+    return storage
+
+
+def controller(broker: LoopbackBroker, max_attempts: int = 3, ack_timeout_seconds: float = 60.0) -> IrrigationController:
+    irrigation = IrrigationController(
+        enabled=True,
+        duration_seconds=120,
+        soak_seconds=900.0,
+        ack_timeout_seconds=ack_timeout_seconds,
+        max_attempts=max_attempts
+    )
+    # Publishing only: the ack sweep is driven by the tests
+    irrigation.transport = broker
+    broker.subscribe(irrigation.ack_subscription(), lambda topic, payload: irrigation.handle_ack(payload))
+    return irrigation
+
+
+def dry_soil(device_id: str = "D1") -> list:
+    return [Alert(
+        alert_type=AlertType.SOIL_MOISTURE_LOW,
+        message="Soil too dry",
+        sensor_value=10.0,
+        threshold_value=30.0,
+        device_id=device_id
+    )]
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_open_command_is_acked(shared_storage, run):
+    broker = LoopbackBroker()
+    valves = SimulatedValves(broker, ack_delay=0.0)
+    irrigation = controller(broker)
+    
+    run(irrigation.on_alerts("D1", dry_soil(), datetime.utcnow()))
+    wait_for(lambda: irrigation.counters["acked"] == 1)
+    
+    [command] = valves.received
+    assert command["device_id"] == "D1"
+    assert command["action"] == "open"
+    assert command["duration_seconds"] == 120
+    assert irrigation.metrics()["pending"] == []
+    assert irrigation.latency["reading_to_ack"].snapshot()["count"] == 1
+    
+    # Still watering, then soaking: the next dry reading sends nothing
+    run(irrigation.on_alerts("D1", dry_soil(), datetime.utcnow()))
+    assert len(valves.received) == 1
+    assert irrigation.counters["suppressed"] == 1
+
+
+def test_unacked_command_is_retried_then_raises_an_alert(shared_storage, run):
+    broker = LoopbackBroker()
+    valves = SimulatedValves(broker, ack_delay=0.0, drop_rate=1.0)
+    irrigation = controller(broker, max_attempts=2, ack_timeout_seconds=0.0)
+    
+    command = run(irrigation.send("D1", "open", reason="test"))
+    resent = irrigation._retry_expired()
+    assert [(retry["command_id"], retry["attempt"]) for retry in resent] == [(command["command_id"], 2)]
+    assert [received["command_id"] for received in valves.received] == [command["command_id"]] * 2
+    
+    # Out of attempts: failed, not resent
+    assert irrigation._retry_expired() == []
+    assert irrigation.counters == {"sent": 1, "retried": 1, "acked": 0, "failed": 1, "suppressed": 0}
+    
+    run(irrigation._raise_failures())
+    [alert] = run(shared_storage.alerts.find())
+    assert alert["alert_type"] == AlertType.IRRIGATION_FAILED.value
+    assert alert["device_id"] == "D1"
+    # The valve was released, so the next dry reading tries again
+    assert run(irrigation.send("D1", "open", reason="test")) is not None
+
+
+def test_late_ack_after_a_retry_completes_the_command(shared_storage, run):
+    broker = LoopbackBroker()
+    irrigation = controller(broker, ack_timeout_seconds=0.0)
+    
+    command = run(irrigation.send("D1", "open", reason="test"))
+    irrigation._retry_expired()
+    ack_topic = settings.IRRIGATION_ACK_TOPIC.format(device_id="D1")
+    # Devices ack the repeat of a command under the same id; only the first ack counts
+    for _ in range(2):
+        broker.publish(ack_topic, {"command_id": command["command_id"], "device_id": "D1", "status": "ok"})
+    assert irrigation.counters["acked"] == 1
+    assert irrigation.counters["retried"] == 1
+    assert irrigation._retry_expired() == []
+
+
+def test_workers_sharing_storage_send_one_command_per_device(shared_storage, run):
+    broker = LoopbackBroker()
+    valves = SimulatedValves(broker, ack_delay=0.0)
+    workers = [controller(broker), controller(broker)]
+    
+    # Both workers see a dry reading for each device
+    for device_id in ("D1", "D2"):
+        for irrigation in workers:
+            run(irrigation.on_alerts(device_id, dry_soil(device_id), datetime.utcnow()))
+    
+    assert sorted(command["device_id"] for command in valves.received) == ["D1", "D2"]
+    assert sum(irrigation.counters["sent"] for irrigation in workers) == 2
+    assert sum(irrigation.counters["suppressed"] for irrigation in workers) == 2
+    # Acks reach every worker; each completes only its own commands
+    wait_for(lambda: sum(irrigation.counters["acked"] for irrigation in workers) == 2)
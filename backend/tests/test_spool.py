@@ -0,0 +1,43 @@
+from app.services.spool_service import ReadingSpool
+
+
+def test_workers_sharing_a_spool_only_ack_their_rows(tmp_path):
+    path = str(tmp_path / "spool.db")
+    first, second = ReadingSpool(path, max_readings=100), ReadingSpool(path, max_readings=100)
+    first.open()
+    second.open()
+    try:
+        for index in range(3):
+            assert first.append({"n": index})
+        batch = first.peek(10)
+        # Appended by another worker after the peek
+        assert second.append({"n": 3})
+        
+        first.ack([row_id for row_id, _ in batch])
+        assert first.replayed_total == 3
+        assert first.depth == second.depth == 1
+        assert first.has_pending()
+        assert [doc for _, doc in second.peek(10)] == [{"n": 3}]
+        
+        second.ack([row_id for row_id, _ in second.peek(10)])
+        assert not first.has_pending()
+        assert first.depth == 0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_full_spool_drops_readings(tmp_path):
+    spool = ReadingSpool(str(tmp_path / "spool.db"), max_readings=2)
+    spool.open()
+    try:
+        assert spool.append({"n": 0})
+        assert spool.append({"n": 1})
+        assert not spool.append({"n": 2})
+        assert spool.dropped_total == 1
+        # Acked rows free their space even with gaps in the ids
+        spool.ack([spool.peek(1)[0][0]])
+        assert spool.append({"n": 3})
+        assert spool.depth == 2
+    finally:
+        spool.close()
@@ -0,0 +1,277 @@
+"""
+Repository behaviour every storage backend must share
+
+Each test runs against the in-memory and SQLite backends (see conftest.py).
+MongoDB needs a server, so it is covered by the benchmarks instead.
+"""
+from datetime import datetime, timedelta
+from app.models import Alert, AlertSeverity, AlertType, SensorReading
+from app.storage import SENSOR_FIELDS
+from app.storage.base import EPOCH
+
+# Whole seconds: every backend round-trips them exactly
+NOW = datetime.utcnow().replace(microsecond=0)
+HOUR = NOW.replace(minute=0, second=0)
+
+
+def reading(device_id: str, timestamp: datetime, value: float = 50.0) -> dict:
+    return SensorReading(
+        device_id=device_id,
+        timestamp=timestamp,
+        soil_moisture=value,
+        temperature=20.0,
+        humidity=60.0,
+        light_intensity=1000.0
+    ).model_dump()
+
+
+def alert(
+    timestamp: datetime,
+    device_id: str = "D1",
+    alert_type: AlertType = AlertType.SOIL_MOISTURE_LOW,
+    severity: AlertSeverity = AlertSeverity.WARNING
+) -> dict:
+    return Alert(
+        alert_type=alert_type,
+        severity=severity,
+        message="test",
+        sensor_value=10.0,
+        threshold_value=30.0,
+        device_id=device_id,
+        timestamp=timestamp
+    ).model_dump(exclude={"id"})
+
+
+def test_upsert_is_idempotent(storage, run):
+    doc = reading("D1", NOW - timedelta(minutes=5))
+    assert run(storage.sensor_data.upsert(doc)) is True
+    assert run(storage.sensor_data.upsert(dict(doc, soil_moisture=1.0))) is False
+    
+    batch = [doc, reading("D1", NOW - timedelta(minutes=4)), reading("D2", NOW - timedelta(minutes=5))]
+    assert run(storage.sensor_data.upsert_many(batch)) == [False, True, True]
+    assert run(storage.sensor_data.upsert_many(batch)) == [False, False, False]
+    
+    new = run(storage.sensor_data.insert_many(batch + [reading("D2", NOW - timedelta(minutes=3))]))
+    assert [(doc["device_id"], doc["timestamp"]) for doc in new] == [("D2", NOW - timedelta(minutes=3))]
+    
+    history = run(storage.sensor_data.history(NOW - timedelta(hours=1), 100))
+    assert len(history) == 4
+    # The first write wins
+    assert [doc["soil_moisture"] for doc in history if doc["device_id"] == "D1"] == [50.0, 50.0]
+
+
+def test_alert_counters_follow_writes(storage, run):
+    alerts = storage.alerts
+    first = run(alerts.insert(alert(HOUR - timedelta(minutes=30))))
+    run(alerts.insert(alert(HOUR + timedelta(seconds=1), device_id="D2", severity=AlertSeverity.CRITICAL)))
+    run(alerts.insert(alert(HOUR + timedelta(seconds=2), alert_type=AlertType.TEMPERATURE_HIGH)))
+    
+    summary = run(alerts.summary(HOUR - timedelta(hours=1)))
+    assert summary["total_alerts"] == 3
+    assert summary["unresolved_alerts"] == 3
+    assert summary["alerts_by_device"] == {"D1": 2, "D2": 1}
+    assert summary["alerts_by_severity"] == {"warning": 2, "critical": 1}
+    assert run(alerts.summary(HOUR))["total_alerts"] == 2
+    # A window starting mid-hour counts that hour's alerts exactly
+    assert run(alerts.summary(HOUR - timedelta(minutes=20)))["total_alerts"] == 2
+    summary = run(alerts.summary(HOUR - timedelta(minutes=40)))
+    assert summary["total_alerts"] == 3
+    assert summary["alerts_by_type"] == {"soil_moisture_low": 2, "temperature_high": 1}
+    
+    assert run(alerts.resolve(first)) is True
+    assert run(alerts.resolve(first)) is False
+    assert run(alerts.summary(HOUR - timedelta(hours=1)))["unresolved_alerts"] == 2
+    
+    assert run(alerts.delete(first)) is True
+    assert run(alerts.delete(first)) is False
+    summary = run(alerts.summary(HOUR - timedelta(hours=1)))
+    assert summary["total_alerts"] == 2
+    assert summary["alerts_by_device"] == {"D1": 1, "D2": 1}
+
+
+def test_alert_counters_keep_dotted_device_ids(storage, run):
+    alerts = storage.alerts
+    for device_id in ("greenhouse.1", "$bed%2", "greenhouse.1"):
+        run(alerts.insert(alert(NOW, device_id=device_id)))
+    
+    expected = {"greenhouse.1": 2, "$bed%2": 1}
+    assert run(alerts.summary(HOUR))["alerts_by_device"] == expected
+    run(alerts.rebuild_counters())
+    assert run(alerts.summary(HOUR))["alerts_by_device"] == expected
+
+
+def test_rebuild_counters_matches_incremental_counts(storage, run):
+    alerts = storage.alerts
+    ids = [run(alerts.insert(alert(HOUR - timedelta(hours=hours), device_id=f"D{hours % 2}"))) for hours in range(3)]
+    run(alerts.resolve(ids[0]))
+    run(alerts.delete(ids[1]))
+    assert run(alerts.resolve_many(device_id="D0")) == 1
+    before = run(alerts.summary(HOUR - timedelta(days=1)))
+    
+    assert run(alerts.rebuild_counters()) == 2
+    after = run(alerts.summary(HOUR - timedelta(days=1)))
+    assert after == before
+    assert after["total_alerts"] == 2
+    assert after["unresolved_alerts"] == 0
+
+
+def test_alert_changes_include_updates_and_tombstones(storage, run):
+    alerts = storage.alerts
+    kept = run(alerts.insert(alert(NOW - timedelta(minutes=10))))
+    deleted = run(alerts.insert(alert(NOW - timedelta(minutes=9), device_id="D2")))
+    
+    since = datetime.utcnow()
+    assert run(alerts.resolve(kept))
+    assert run(alerts.delete(deleted))
+    until = datetime.utcnow() + timedelta(seconds=1)
+    
+    changed, gone = run(alerts.changes(since, until, 100))
+    assert [doc["_id"] for doc in changed] == [kept]
+    assert changed[0]["is_resolved"] is True
+    assert gone == [deleted]
+    
+    changed, gone = run(alerts.changes(since, until, 100, device_id="D1"))
+    assert [doc["_id"] for doc in changed] == [kept]
+    assert gone == []
+    
+    assert run(alerts.delete_many(device_id="D1")) == 1
+    _, gone = run(alerts.changes(since, datetime.utcnow() + timedelta(seconds=1), 100))
+    assert sorted(gone) == sorted([kept, deleted])
+
+
+def test_outbox_claim_lease_and_retry(storage, run):
+    notification = {"channel": "email", "recipient": "grower@example.com"}
+    alert_id = run(storage.alerts.insert(alert(NOW), notification))
+    run(storage.alerts.insert(alert(NOW)))
+    outbox = storage.outbox
+    assert run(outbox.counts()) == {"pending": 1, "dead": 0}
+    
+    claimed = run(outbox.claim("a", 10, 60))
+    assert [message["alert_id"] for message in claimed] == [alert_id]
+    assert claimed[0]["recipient"] == "grower@example.com"
+    assert claimed[0]["alert"]["device_id"] == "D1"
+    # Leased to "a" until the lease runs out
+    assert run(outbox.claim("b", 10, 60)) == []
+    
+    message_id = claimed[0]["_id"]
+    assert run(outbox.fail([(message_id, "smtp down", NOW - timedelta(seconds=1))])) == 1
+    retried = run(outbox.claim("b", 10, -1))
+    assert [(message["_id"], message["attempts"], message["last_error"]) for message in retried] == [
+        (message_id, 1, "smtp down")
+    ]
+    # An expired lease makes the message due for anyone
+    assert [message["_id"] for message in run(outbox.claim("c", 10, 60))] == [message_id]
+    
+    assert run(outbox.complete([message_id])) == 1
+    assert run(outbox.complete([message_id])) == 0
+    assert run(outbox.counts()) == {"pending": 0, "dead": 0}
+
+
+def test_outbox_dead_letters_and_requeue(storage, run):
+    notification = {"channel": "email", "recipient": "grower@example.com"}
+    run(storage.alerts.insert(alert(NOW), notification))
+    run(storage.alerts.insert(alert(NOW, device_id="D2"), notification))
+    outbox = storage.outbox
+    first, second = run(outbox.claim("a", 10, 60))
+    
+    run(outbox.fail([(first["_id"], "mailbox full", None)]))
+    assert run(outbox.counts()) == {"pending": 1, "dead": 1}
+    dead = run(outbox.dead_letters(10))
+    assert [(message["_id"], message["last_error"], message["attempts"]) for message in dead] == [
+        (first["_id"], "mailbox full", 1)
+    ]
+    # Dead letters are never claimed
+    run(outbox.fail([(second["_id"], "later", NOW - timedelta(seconds=1))]))
+    assert [message["_id"] for message in run(outbox.claim("b", 10, 60))] == [second["_id"]]
+    
+    assert run(outbox.requeue(first["_id"])) is True
+    assert run(outbox.requeue(first["_id"])) is False
+    requeued = run(outbox.claim("c", 10, 60))
+    assert [(message["_id"], message["attempts"]) for message in requeued] == [(first["_id"], 0)]
+    
+    assert run(outbox.delete(second["_id"])) is True
+    assert run(outbox.delete(second["_id"])) is False
+    assert run(outbox.counts()) == {"pending": 1, "dead": 0}
+
+
+def test_changes_since_pages_in_storage_order(storage, run):
+    sensor_data = storage.sensor_data
+    since = NOW - timedelta(hours=1)
+    run(sensor_data.upsert_many([reading("D1", since + timedelta(minutes=minute)) for minute in range(5)]))
+    cursor = run(sensor_data.sync_cursor())
+    
+    # Stored out of timestamp order: changes follow storage order
+    late = [reading("D2", since + timedelta(minutes=minute)) for minute in (20, 10, 30, 15, 25)]
+    for doc in late:
+        run(sensor_data.upsert(doc))
+    run(sensor_data.upsert(reading("D1", since - timedelta(minutes=1))))
+    
+    seen = []
+    pages = 0
+    while True:
+        docs, next_cursor, has_more = run(sensor_data.changes_since(cursor, since, 2))
+        pages += 1
+        seen.extend(doc["timestamp"] for doc in docs)
+        assert len(docs) <= 2
+        if not has_more:
+            break
+        assert next_cursor != cursor
+        cursor = next_cursor
+    assert pages == 3
+    assert seen == [doc["timestamp"] for doc in late]
+    
+    # Nothing new since the last cursor
+    assert run(sensor_data.changes_since(next_cursor, since, 2))[0] == []
+    
+    docs, _, has_more = run(sensor_data.changes_since(
+        cursor, since, 10, device_id="D2", until=since + timedelta(minutes=25)
+    ))
+    assert not has_more
+    assert all(doc["device_id"] == "D2" and doc["timestamp"] < since + timedelta(minutes=25) for doc in docs)
+
+
+def test_scan_columns_pages_by_timestamp(storage, run):
+    sensor_data = storage.sensor_data
+    since = NOW - timedelta(hours=2)
+    docs = [
+        reading(device_id, since + timedelta(minutes=minute), value=minute)
+        for minute in range(0, 60, 5)
+        for device_id in ("D2", "D1")
+    ]
+    run(sensor_data.upsert_many(docs[::-1]))
+    
+    async def scan(**kwargs):
+        return [batch async for batch in sensor_data.scan_columns(since, since + timedelta(minutes=50), **kwargs)]
+    
+    batches = run(scan(batch_size=3))
+    assert [len(batch["timestamp"]) for batch in batches] == [3, 3, 3, 3, 3, 3, 2]
+    rows = [row for batch in batches for row in zip(*(batch[column] for column in ("timestamp", "device_id")))]
+    assert rows == sorted(rows)
+    assert len(set(rows)) == 20
+    assert rows[0] == ((since - EPOCH).total_seconds(), "D1")
+    assert set(batches[0]) >= {"device_id", "timestamp", *SENSOR_FIELDS}
+    
+    batches = run(scan(device_id="D2", batch_size=4))
+    values = [value for batch in batches for value in batch["soil_moisture"]]
+    assert values == [float(minute) for minute in range(0, 50, 5)]
+
+
+def test_valve_claims_pace_devices(storage, run):
+    valves = storage.valves
+    open_until = NOW + timedelta(minutes=2)
+    busy_until = NOW + timedelta(minutes=15)
+    
+    assert run(valves.claim_open("D1", NOW, open_until, busy_until)) is True
+    # Another worker sees the same reading
+    assert run(valves.claim_open("D1", NOW, open_until, busy_until)) is False
+    assert run(valves.claim_open("D2", NOW, open_until, busy_until)) is True
+    assert run(valves.claim_open("D1", NOW, open_until, busy_until, force=True)) is True
+    
+    assert run(valves.claim_close("D1", NOW, busy_until)) is True
+    assert run(valves.claim_close("D1", NOW, busy_until)) is False
+    # Busy until the soak is over
+    assert run(valves.claim_open("D1", NOW + timedelta(minutes=5), open_until, busy_until)) is False
+    assert run(valves.claim_open("D1", busy_until, busy_until + timedelta(minutes=2), busy_until + timedelta(minutes=15))) is True
+    
+    run(valves.release("D2"))
+    assert run(valves.claim_open("D2", NOW, open_until, busy_until)) is True